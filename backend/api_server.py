@@ -5,30 +5,43 @@ Simulates Laravel API without needing PHP/Docker
 Supports full user management with SQLite backend
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, stream_with_context, send_file
 from flask_cors import CORS
-import sqlite3
 import os
 import json
 from datetime import datetime, timedelta
 from functools import wraps
 from dotenv import load_dotenv
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import secrets
-import pandas as pd
-import io
-import csv
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
+import importlib
+import threading
+import time
+import base64
 try:
     import psycopg2
     from psycopg2.extras import RealDictCursor
 except ImportError:
     psycopg2 = None
+from db import get_db_connection
+from db_pool import ConnectionPool, PoolTimeout
+import rollups
+import report_export
+import report_jobs
+import queries
+import live_feed
+import changes
+import table_versions
+import compression
+import serializers
+import auth
+import auto_checkout
+import search
+import seed_visitors
+import migrations
+import partitions
+import metrics
+import slow_queries
+from queries import run
 
 # Load environment variables
 load_dotenv()
@@ -39,51 +52,49 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})
 # Database configuration
 DB_FILE = os.getenv('DB_FILE', 'api_server.db')
 
-def get_db_connection():
-    """Get database connection (Strict PostgreSQL Only)"""
-    # Resolve URL at runtime to ensure latest Env Vars are picked up
-    db_url = os.getenv('DATABASE_URL') or os.getenv('Database_URL')
-    
-    if not db_url:
-        # Halt execution if NO DB URL is present
-        raise RuntimeError("CRITICAL ERROR: DATABASE_URL environment variable is not set. Application cannot start without a PostgreSQL database (SQLite fallback disabled to prevent data loss).")
-        
-    if not psycopg2:
-        # Halt execution if driver is missing
-        raise RuntimeError("CRITICAL ERROR: psycopg2 driver not installed. Cannot connect to PostgreSQL.")
+# Connection pool configuration (per worker process)
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+
+_pool = None
+_pool_pid = None
+
+def get_pool():
+    """Get this process's connection pool, creating it lazily after fork"""
+    global _pool, _pool_pid
+    # gunicorn forks workers from the master; each worker must own its own pool
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ConnectionPool(get_db_connection, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+        _pool_pid = os.getpid()
+    return _pool
+
+def get_db():
+    """Get the request-scoped pooled connection (returned to the pool on teardown)"""
+    if 'db_conn' not in g:
+        started = time.perf_counter()
+        try:
+            g.db_conn = get_pool().getconn()
+        except PoolTimeout:
+            metrics.POOL_TIMEOUTS.inc()
+            raise
+        metrics.POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - started)
+    return g.db_conn
 
-    try:
-        conn = psycopg2.connect(db_url)
-        return conn
-    except Exception as e:
-        print(f"CRITICAL ERROR: Failed to connect to PostgreSQL: {e}")
-        raise RuntimeError(f"Database connection failed: {e}")
+@app.teardown_appcontext
+def release_db(exc):
+    """Return the request's connection to the pool, even if the handler raised"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().putconn(conn)
 
-def execute_query(cursor, query, params=None):
-    """Execute query handling placeholder differences"""
-    if params is None:
-        params = ()
-        
-    # Check if this is a psycopg2 cursor
-    is_postgres = hasattr(cursor, 'query') or (psycopg2 and isinstance(cursor, psycopg2.extensions.cursor))
-    
-    if is_postgres:
-        # Convert ? to %s for Postgres
-        # Note: This is a simple replacement. Complex queries might need careful handling.
-        query = query.replace('?', '%s')
-        cursor.execute(query, params)
-    else:
-        cursor.execute(query, params)
-
-def get_row_dict(row, cursor):
-    """Convert row to dict compatible with both drivers"""
-    if hasattr(row, 'keys'): # SQLite Row
-        return dict(row)
-    if isinstance(row, dict): # Psycopg2 RealDictCursor
-        return row
-    # Psycopg2 normal cursor (tuple) - need column names
-    col_names = [desc[0] for desc in cursor.description]
-    return dict(zip(col_names, row))
+def json_bytes(body, status=200):
+    """Response from JSON already encoded by serializers"""
+    return Response(body, status, mimetype='application/json')
+
+def execute_query(cursor, query, params=None, name='adhoc'):
+    """Execute one-off SQL with ? placeholders (request-path SQL is prepared via queries.py)"""
+    queries.execute(cursor, query, params or (), name)
 
 
 # Email configuration
@@ -91,17 +102,71 @@ SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
 SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
 SMTP_EMAIL = os.getenv('SMTP_EMAIL')
 SMTP_PASSWORD = os.getenv('SMTP_PASSWORD', '').replace(' ', '')
-
-if not SMTP_EMAIL or not SMTP_PASSWORD:
+# A local SMTP stand-in (e.g. `python -m aiosmtpd -n -l localhost:1025`) needs both set to false
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() in ('1', 'true', 'yes')
+SMTP_AUTH = os.getenv('SMTP_AUTH', 'true').lower() in ('1', 'true', 'yes')
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', 10))
+
+# Background dispatch queue
+MAIL_WORKERS = int(os.getenv('MAIL_WORKERS', 2))
+MAIL_QUEUE_SIZE = int(os.getenv('MAIL_QUEUE_SIZE', 100))
+MAIL_QUEUE_OVERFLOW = os.getenv('MAIL_QUEUE_OVERFLOW', 'drop_new')
+MAIL_MAX_RETRIES = int(os.getenv('MAIL_MAX_RETRIES', 3))
+MAIL_RETRY_BACKOFF = float(os.getenv('MAIL_RETRY_BACKOFF', 1))
+MAIL_IDLE_TIMEOUT = float(os.getenv('MAIL_IDLE_TIMEOUT', 60))
+
+EMAIL_MOCKED = not SMTP_EMAIL or (SMTP_AUTH and not SMTP_PASSWORD)
+
+if EMAIL_MOCKED:
     print("WARNING: Email credentials not set in .env file. Email sending will be MOCKED.")
 
+_mailer = None
+_mailer_lock = threading.Lock()
+
+def print_fallback_email(to_email, message, reason):
+    """Print an undeliverable email so the reset link can still be used"""
+    body = message.get_payload()[0].get_payload() if message.is_multipart() else message.get_payload()
+    print(f"============================================")
+    print(f"FALLBACK MOCK EMAIL TO: {to_email} ({reason})")
+    print(f"Subject: {message['Subject']}")
+    print(body)
+    print(f"============================================")
+
+def get_mailer():
+    """Get the process-wide email dispatcher (its worker threads start on first submit)"""
+    global _mailer
+    if _mailer is None:
+        with _mailer_lock:
+            if _mailer is None:
+                # Imported on first use to keep worker start-up fast
+                import atexit
+                import mailer
+                dispatcher = mailer.EmailDispatcher(
+                    mailer.smtp_session_factory(
+                        SMTP_SERVER, SMTP_PORT,
+                        SMTP_EMAIL if SMTP_AUTH else None, SMTP_PASSWORD if SMTP_AUTH else None,
+                        starttls=SMTP_STARTTLS, timeout=SMTP_TIMEOUT
+                    ),
+                    SMTP_EMAIL,
+                    workers=MAIL_WORKERS,
+                    queue_size=MAIL_QUEUE_SIZE,
+                    overflow=MAIL_QUEUE_OVERFLOW,
+                    max_retries=MAIL_MAX_RETRIES,
+                    backoff=MAIL_RETRY_BACKOFF,
+                    idle_timeout=MAIL_IDLE_TIMEOUT,
+                    on_failure=print_fallback_email
+                )
+                atexit.register(dispatcher.shutdown)
+                _mailer = dispatcher
+    return _mailer
+
 def send_reset_email(to_email, user_name, reset_token):
-    """Send reset email (Mocked if no credentials)"""
+    """Queue reset email for background delivery (Mocked if no credentials)"""
     # Use HTTPS and strip trailing slash
     base_url = os.getenv('FRONTEND_URL', 'https://visitor-tracker-frontend.onrender.com').rstrip('/')
     reset_link = f"{base_url}/reset-password?token={reset_token}"
     
-    if not SMTP_EMAIL or not SMTP_PASSWORD:
+    if EMAIL_MOCKED:
         print(f"============================================")
         print(f"MOCK EMAIL TO: {to_email}")
         print(f"Subject: Password Reset Request")
@@ -109,6 +174,10 @@ def send_reset_email(to_email, user_name, reset_token):
         print(f"============================================")
         return True
 
+    # Imported on first use to keep worker start-up fast
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
     msg = MIMEMultipart()
     msg['From'] = SMTP_EMAIL
     msg['To'] = to_email
@@ -127,148 +196,64 @@ def send_reset_email(to_email, user_name, reset_token):
     Link expires in 1 hour.
     """
     msg.attach(MIMEText(body, 'plain'))
-    
-    try:
-        # Add timeout to prevent hanging (caused 502 errors)
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=5)
-        server.starttls()
-        server.login(SMTP_EMAIL, SMTP_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(SMTP_EMAIL, to_email, text)
-        server.quit()
-        print(f"Email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        print(f"Failed to send email (falling back to mock): {e}")
-        # Fallback: Print mock link so user can still access account
-        print(f"============================================")
-        print(f"FALLBACK MOCK EMAIL TO: {to_email}")
-        print(f"Subject: Password Reset Request")
-        print(f"Link: {reset_link}")
-        print(f"============================================")
-        return False
+
+    # Delivery (connect, STARTTLS, login, retries) happens on the mailer's worker threads
+    return get_mailer().submit(to_email, msg)
 
 def init_db():
-    """Initialize database tables"""
+    """Bring the schema up to date (a single version check when it already is; see migrations.py)"""
     conn = get_db_connection()
-    # Rollback and set autocommit to avoid transaction block locking
-    conn.rollback()
-    conn.autocommit = True
-    
-    # Check if postgres
-    # Since we enforce DATABASE_URL and psycopg2 in get_db_connection, 
-    # we can assume it is Postgres. Using AUTOINCREMENT will fail on Postgres.
-    is_postgres = True
-    print(f"INFO: Initializing PostgreSQL database (Strict Mode)")
-        
-    cursor = conn.cursor()
-
-    # Create users table
-    id_type = "SERIAL PRIMARY KEY" if is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
-    
-    execute_query(cursor, f"""
-        CREATE TABLE IF NOT EXISTS users (
-            id {id_type},
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT DEFAULT 'security',
-            status TEXT DEFAULT 'Active',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Create visitors table
-    execute_query(cursor, f"""
-        CREATE TABLE IF NOT EXISTS visitors (
-            id {id_type},
-            name TEXT NOT NULL,
-            email TEXT,
-            phone TEXT,
-            purpose TEXT NOT NULL,
-            check_in_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            check_out_time TIMESTAMP,
-            host_name TEXT,
-            company TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Create settings table
-    execute_query(cursor, f"""
-        CREATE TABLE IF NOT EXISTS settings (
-            id {id_type},
-            organization_name TEXT DEFAULT 'Rachana Girls Hostel',
-            email TEXT DEFAULT 'contact@rachana.org',
-            phone TEXT DEFAULT '+91 22 1234 5678',
-            push_notifications BOOLEAN DEFAULT FALSE,
-            email_notifications BOOLEAN DEFAULT FALSE,
-            auto_checkout BOOLEAN DEFAULT FALSE,
-            require_email BOOLEAN DEFAULT FALSE,
-            require_organization BOOLEAN DEFAULT FALSE
-        )
-    """)
-    
-    # Check for reset_token columns and add if missing (DB Migration)
-    # This ensures deployment preserves existing users but adds new capabilities
     try:
-        # Try to select the column to see if it exists
-        execute_query(cursor, "SELECT reset_token FROM users LIMIT 1")
-    except Exception:
-        # Column likely missing, so the previous query failed and Aborted the transaction.
-        # We MUST rollback the failed transaction before running ALTER TABLE.
-        conn.rollback()
-        
-        # Column likely missing, add them
-        print("INFO: Migrating database - adding reset_token columns")
-        try:
-            execute_query(cursor, "ALTER TABLE users ADD COLUMN reset_token TEXT")
-            execute_query(cursor, "ALTER TABLE users ADD COLUMN reset_token_expiry TIMESTAMP")
-        except Exception as e:
-            print(f"WARNING: Database migration failed (columns might ensure exist): {e}")
-
-    # Ensure default settings exist
-    execute_query(cursor, "SELECT COUNT(*) FROM settings")
-    if cursor.fetchone()[0] == 0:
-        execute_query(cursor, """
-            INSERT INTO settings (id, organization_name, email, phone) 
-            VALUES (1, 'Rachana Girls Hostel', 'contact@rachana.org', '+91 22 1234 5678')
-        """)
-
-    # Check if seed data exists
-    execute_query(cursor, "SELECT COUNT(*) FROM users")
-    count = cursor.fetchone()[0]
-
-    # Always ensure the main admin exists, even if other users exist
-    admin_email = "akhadedhanashri@gmail.com"
-    execute_query(cursor, "SELECT id FROM users WHERE email = ?", (admin_email,))
-    existing_admin = cursor.fetchone()
-
-    if not existing_admin:
-        print(f"INFO: Creating main admin user {admin_email}")
-        execute_query(cursor, """
-            INSERT INTO users (name, email, password, role, status)
-            VALUES (?, ?, ?, ?, ?)
-        """, ("Admin Dhanashri", admin_email, "Dhanashri@2026", "admin", "Active"))
-    
-    # Run comprehensive seeder if users are empty (first run)
-    if count == 0:
-        print("INFO: Database appears empty. Running initial user seed...")
-        try:
-            # We import here to avoid circular dependencies at top level if any
-            from seed_test_data import seed_test_data
-            seed_test_data()
-            print("SUCCESS: Seeded initial users")
-        except Exception as e:
-            print(f"ERROR: Failed to run seeder: {e}")
-
-    conn.commit()
-    conn.close()
+        migrations.ensure_current(conn)
+        # Cheap when the months exist; covers the time before a scheduler leader is up
+        for name in partitions.ensure_partitions(conn.cursor()):
+            print(f"INFO: Created partition {name}")
+        conn.commit()
+    finally:
+        conn.close()
 
 # get_db_connection is verified above
 
+# Heavy modules used only by the report and password-reset endpoints. They are imported on
+# first use; with PREWARM_IMPORTS=true they are also loaded in the background once the
+# worker has served its first request, so the first report does not pay for them.
+# benchmarks/bench_startup.py reads this list to check that importing the app loads none of them.
+LAZY_MODULES = (
+    'reportlab.pdfbase.pdfmetrics',
+    'mailer',
+    'email.mime.multipart',
+    'email.mime.text',
+)
+PREWARM_IMPORTS = os.getenv('PREWARM_IMPORTS', 'false').lower() in ('1', 'true', 'yes')
+PREWARM_DELAY = float(os.getenv('PREWARM_DELAY', 2))
+
+_prewarm_started = False
+
+def _prewarm_imports():
+    """Import LAZY_MODULES after a short delay (runs in a daemon thread)"""
+    time.sleep(PREWARM_DELAY)
+    for name in LAZY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"WARNING: Prewarm import of {name} failed: {e}")
+
+@app.before_request
+def start_prewarm():
+    """Start the background prewarm once this worker is serving requests"""
+    global _prewarm_started
+    if PREWARM_IMPORTS and not _prewarm_started:
+        _prewarm_started = True
+        threading.Thread(target=_prewarm_imports, name='prewarm-imports', daemon=True).start()
+
+# Auto checkout scheduler; runs in one worker, the advisory-lock holder (see auto_checkout.py)
+_auto_checkout = auto_checkout.AutoCheckout(get_db_connection)
+
+@app.before_request
+def start_auto_checkout():
+    """Start the scheduler in this worker if no process is running it (it also keeps partitions created)"""
+    _auto_checkout.check()
+
 def validate_json(f):
     """Decorator to validate JSON requests"""
     @wraps(f)
@@ -278,6 +263,197 @@ def validate_json(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def conditional_on(table):
+    """Decorator: weak ETag from the table's data version, answering If-None-Match before any rows are read"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                version = table_versions.get_version(get_db().cursor(), table)
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
+            if version is None:
+                return f(*args, **kwargs)
+
+            etag = f"{table}-{version}"
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Let clients keep a copy but revalidate it every time
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+# Session tokens are checked from their signature alone; status and role come from a short
+# per-worker cache, so a deactivated user is locked out within AUTH_STATUS_CACHE_TTL seconds.
+password_hasher = auth.PasswordHasher()
+user_status_cache = auth.StatusCache()
+_token_signer = None
+_token_signer_lock = threading.Lock()
+
+def get_token_signer():
+    """This process's token signer (the signing key is read once)"""
+    global _token_signer
+    if _token_signer is None:
+        with _token_signer_lock:
+            if _token_signer is None:
+                _token_signer = auth.TokenSigner(auth.load_signing_key(get_db().cursor()))
+    return _token_signer
+
+def load_auth_state(user_id):
+    """(status, role) of a user, or None if it no longer exists"""
+    cursor = get_db().cursor()
+    run(cursor, queries.USER_AUTH_STATE, (user_id,))
+    return cursor.fetchone()
+
+def request_token(query_token=False):
+    """Bearer token from the Authorization header; with query_token also ?access_token=
+
+    Only routes a browser opens directly (EventSource, download links) take the query string
+    form, since it ends up in access logs.
+    """
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[7:].strip()
+    return request.args.get('access_token') if query_token else None
+
+def require_auth(role=None, query_token=False):
+    """Decorator: verify the session token and set g.user; `role` limits the endpoint to that role"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            token = request_token(query_token)
+            if not token:
+                return jsonify({"error": "Authentication required"}), 401
+            try:
+                claims = get_token_signer().verify(token)
+                state = user_status_cache.get(claims["uid"], load_auth_state)
+            except auth.AuthError as e:
+                return jsonify({"error": str(e)}), 401
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
+            if state is None:
+                return jsonify({"error": "Account no longer exists"}), 401
+            if state[0] != 'Active':
+                return jsonify({"error": "Account is inactive"}), 403
+            if role and state[1] != role:
+                return jsonify({"error": "Not permitted"}), 403
+            g.user = {"id": claims["uid"], "role": state[1]}
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def is_self_or_admin(user_id):
+    """Whether the signed-in caller may act on this user (their own account, or any as admin)"""
+    return g.user["role"] == 'admin' or g.user["id"] == user_id
+
+@app.before_request
+def start_request_timer():
+    """Note when the request started (and start this worker's metrics flush thread)"""
+    g.request_started = time.perf_counter()
+    metrics.start_flusher()
+
+# Registered before compress_response, so it runs after it and includes compression time
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and its latency under its route pattern (not the raw path)"""
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli larger JSON and text responses when the client accepts it"""
+    return compression.compress_response(response, request.accept_encodings)
+
+def parse_date_arg(name, args=None):
+    """Parse a YYYY-MM-DD query argument (None if absent, ValueError if malformed)"""
+    value = (request.args if args is None else args).get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected YYYY-MM-DD")
+
+def build_visitor_filters(args=None):
+    """Build SQL conditions for the shared visitor filters in the query string (or `args`)"""
+    args = request.args if args is None else args
+    conditions = []
+    params = []
+
+    start_date = parse_date_arg('start_date', args)
+    if start_date:
+        conditions.append("check_in_time >= ?")
+        params.append(start_date)
+
+    end_date = parse_date_arg('end_date', args)
+    if end_date:
+        # Whole end day, including fractional seconds
+        conditions.append("check_in_time < ?")
+        params.append(end_date + timedelta(days=1))
+
+    status = args.get('status')
+    if status == 'inside':
+        conditions.append("check_out_time IS NULL")
+    elif status == 'checked_out':
+        conditions.append("check_out_time IS NOT NULL")
+    elif status:
+        raise ValueError("Invalid status: expected 'inside' or 'checked_out'")
+
+    if args.get('host'):
+        conditions.append("host_name = ?")
+        params.append(args['host'])
+
+    if args.get('purpose'):
+        conditions.append("purpose = ?")
+        params.append(args['purpose'])
+
+    return conditions, params
+
+def check_in_hint():
+    """Optional ?check_in_time= of the visit an id refers to (as the API returned it), so only its partition is read"""
+    value = request.args.get('check_in_time')
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+    except ValueError:
+        raise ValueError("Invalid check_in_time: expected the visitor's ISO-8601 check-in time")
+
+def encode_cursor(check_in_time, visitor_id):
+    """Opaque keyset cursor for the (check_in_time, id) position of a row"""
+    raw = json.dumps([check_in_time.isoformat(), visitor_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor (ValueError if tampered or malformed)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        check_in_time, visitor_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(check_in_time), int(visitor_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+# Bearer token scrapers must send to /api/metrics (unset: no token needed)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+@app.route("/api/metrics", methods=["GET"])
+def prometheus_metrics():
+    """GET /api/metrics - Request, query, pool and report metrics in Prometheus text format"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    if METRICS_TOKEN and not secrets.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+        return jsonify({"error": "Invalid metrics token"}), 401
+    return Response(metrics.exposition(), 200, content_type=metrics.CONTENT_TYPE)
+
 # Health Check
 @app.route("/api/health", methods=["GET"])
 def health_check():
@@ -288,7 +464,7 @@ def health_check():
     
     # Try connecting safely
     try:
-        conn = get_db_connection()
+        conn = get_db()
         # Check robustly explicitly imported library or connection type
         if 'psycopg2' in str(type(conn)):
              is_postgres = True
@@ -296,11 +472,10 @@ def health_check():
              is_postgres = True
              
         cursor = conn.cursor()
-        execute_query(cursor, "SELECT COUNT(*) FROM users")
+        run(cursor, queries.COUNT_USERS)
         user_count = cursor.fetchone()[0]
-        execute_query(cursor, "SELECT COUNT(*) FROM visitors")
+        run(cursor, queries.COUNT_VISITORS)
         visitor_count = cursor.fetchone()[0]
-        conn.close()
         db_status = "Connected"
     except Exception as e:
         user_count = -1
@@ -308,6 +483,9 @@ def health_check():
         db_status = f"Error: {str(e)}"
 
     db_type = "PostgreSQL" if is_postgres else "SQLite (If Fallback Enabled)"
+    pool_stats = get_pool().stats() if _pool is not None else None
+    mail_stats = _mailer.stats() if _mailer is not None else None
+    live_stats = _live_feed.stats() if _live_feed is not None else None
     
     # Return 200 even if DB fails, so we can see the JSON diagnostic
     return jsonify({
@@ -319,6 +497,15 @@ def health_check():
         "counts": {
             "users": user_count,
             "visitors": visitor_count
+        },
+        "pool": pool_stats,
+        "mail": mail_stats,
+        "live_feed": live_stats,
+        "auto_checkout": _auto_checkout.stats(),
+        "reports": _report_jobs.stats(),
+        "auth": {
+            "password_hasher": password_hasher.stats(),
+            "status_cache": user_status_cache.stats()
         }
     }), 200
 
@@ -333,33 +520,45 @@ def login():
         if not data or not data.get('email') or not data.get('password'):
             return jsonify({"error": "Email and password are required"}), 400
             
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
-        # In a real app, use bcrypt to verify hash. Here we compare plain text for demo simplicity as per seed data
-        execute_query(cursor, "SELECT id, name, email, role, status FROM users WHERE email = ? AND password = ?", 
-                      (data['email'], data['password']))
+        run(cursor, queries.USER_LOGIN, (data['email'],))
         user = cursor.fetchone()
-        conn.close()
         
         if not user:
             return jsonify({"error": "Invalid credentials"}), 401
+
+        matches, needs_rehash = password_hasher.verify(data['password'], user[5])
+        if not matches:
+            return jsonify({"error": "Invalid credentials"}), 401
             
         if user[4] != 'Active':
             return jsonify({"error": "Account is inactive"}), 403
-            
+
+        if needs_rehash:
+            # Plain-text or weaker legacy password: store it hashed now that we know it
+            run(cursor, queries.USER_UPGRADE_PASSWORD, (password_hasher.hash(data['password']), user[0], user[5]))
+            conn.commit()
+
+        token, expires = get_token_signer().issue(user[0], user[3])
         return jsonify({
             "id": user[0],
             "name": user[1],
             "email": user[2],
             "role": user[3],
-            "status": user[4]
+            "status": user[4],
+            "token": token,
+            "expires_at": serializers.utc_iso(datetime.utcfromtimestamp(expires))
         }), 200
-        
+
+    except auth.HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/change-password", methods=["POST"])
+@require_auth()
 @validate_json
 def change_password():
     """POST /api/change-password - Change user password"""
@@ -372,33 +571,32 @@ def change_password():
         
         if not user_id or not old_password or not new_password:
             return jsonify({"error": "Missing required fields"}), 400
+
+        if not is_self_or_admin(int(user_id)):
+            return jsonify({"error": "Not permitted"}), 403
             
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
         # Verify old password
-        execute_query(cursor, "SELECT password FROM users WHERE id = ?", (user_id,))
+        run(cursor, queries.USER_PASSWORD_BY_ID, (user_id,))
         user_row = cursor.fetchone()
         
         if not user_row:
-            conn.close()
             return jsonify({"error": "User not found"}), 404
             
-        current_db_password = user_row[0]
-        
-        # Simple comparison (replace with hash check in production)
-        if current_db_password != old_password:
-            conn.close()
+        matches, _ = password_hasher.verify(old_password, user_row[0])
+        if not matches:
             return jsonify({"error": "Incorrect current password"}), 401
             
         # Update password
-        execute_query(cursor, "UPDATE users SET password = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", 
-                      (new_password, user_id))
+        run(cursor, queries.USER_SET_PASSWORD, (password_hasher.hash(new_password), user_id))
         conn.commit()
-        conn.close()
         
         return jsonify({"message": "Password updated successfully"}), 200
-        
+
+    except auth.HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -414,9 +612,9 @@ def forgot_password():
             return jsonify({"error": "Email is required"}), 400
         
         # Check if user exists
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
-        execute_query(cursor, "SELECT id, name FROM users WHERE email = ?", (email,))
+        run(cursor, queries.USER_BY_EMAIL, (email,))
         user = cursor.fetchone()
         
         # Always return success (don't reveal if email exists - security best practice)
@@ -426,19 +624,16 @@ def forgot_password():
             expiry = datetime.now() + timedelta(hours=1)
             
             # Save token to DB
-            execute_query(cursor, """
-                UPDATE users SET reset_token = ?, reset_token_expiry = ? WHERE id = ?
-            """, (reset_token, expiry, user[0]))
+            run(cursor, queries.USER_SET_RESET_TOKEN, (reset_token, expiry, user[0]))
             conn.commit()
             
-            # Send email
+            # Queue email (sent in the background, so this returns immediately)
             try:
                 send_reset_email(email, user[1], reset_token)
             except Exception as e:
                 print(f"Email sending error: {e}")
                 # Still return success to user/log the error
         
-        conn.close()
         return jsonify({"message": "If email exists, reset link has been sent"}), 200
         
     except Exception as e:
@@ -456,17 +651,16 @@ def reset_password():
         if not token or not new_password:
             return jsonify({"error": "Token and new password are required"}), 400
             
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
         # Verify token in DB
         # SQLite returns columns by index
         reset_token_col = "reset_token"
-        execute_query(cursor, "SELECT id, reset_token_expiry FROM users WHERE reset_token = ?", (token,))
+        run(cursor, queries.USER_BY_RESET_TOKEN, (token,))
         user = cursor.fetchone()
         
         if not user:
-            conn.close()
             return jsonify({"error": "Invalid or expired token"}), 400
             
         # Check expiry
@@ -484,27 +678,22 @@ def reset_password():
                         expiry = datetime.strptime(expiry_str, '%Y-%m-%d %H:%M:%S')
                     except:
                         # Last ditch effort for other formats? Or just fail safely
-                        conn.close()
                         return jsonify({"error": "Token expiry format error"}), 500
         else:
             expiry = expiry_str
 
         if datetime.now() > expiry:
-            conn.close()
             return jsonify({"error": "Token has expired"}), 400
             
         # Update password
-        execute_query(cursor, """
-            UPDATE users 
-            SET password = ?, reset_token = NULL, reset_token_expiry = NULL, updated_at = CURRENT_TIMESTAMP 
-            WHERE id = ?
-        """, (new_password, user[0]))
+        run(cursor, queries.USER_RESET_PASSWORD, (password_hasher.hash(new_password), user[0]))
         
         conn.commit()
-        conn.close()
         
         return jsonify({"message": "Password has been reset successfully"}), 200
-        
+
+    except auth.HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         print(f"Reset password error: {e}")
         return jsonify({"error": "Failed to reset password"}), 500
@@ -513,32 +702,20 @@ def reset_password():
 
 # User endpoints
 @app.route("/api/users", methods=["GET"])
+@require_auth('admin')
+@conditional_on('users')
 def get_users():
     """GET /api/users - Get all users"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
-        execute_query(cursor, "SELECT id, name, email, role, status, created_at, updated_at FROM users ORDER BY created_at DESC")
-        users = cursor.fetchall()
-        conn.close()
-
-        user_list = []
-        for user in users:
-            user_list.append({
-                "id": user[0],
-                "name": user[1],
-                "email": user[2],
-                "role": user[3],
-                "status": user[4],
-                "created_at": user[5],
-                "updated_at": user[6]
-            })
-
-        return jsonify(user_list), 200
+        run(cursor, queries.USERS_ALL)
+        return json_bytes(serializers.users.dumps_rows(cursor.fetchall()))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/users", methods=["POST"])
+@require_auth('admin')
 @validate_json
 def create_user():
     """POST /api/users - Create new user"""
@@ -548,66 +725,46 @@ def create_user():
         if not data or not data.get('name') or not data.get('email') or not data.get('password'):
             return jsonify({"error": "Name, email, and password are required"}), 400
 
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
 
-        execute_query(cursor, """
-            INSERT INTO users (name, email, password, role, status)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
+        run(cursor, queries.USER_INSERT, (
             data['name'],
             data['email'],
-            data['password'],
+            password_hasher.hash(data['password']),
             data.get('role', 'security'),
             data.get('status', 'Active')
         ))
-
-        conn.commit()
-        # id is available via lastrowid in sqlite, need separate handling for returning id in postgres
-        # For simple compatibility, we can query by email (unique)
-        
-        execute_query(cursor, "SELECT id, name, email, role, status, created_at, updated_at FROM users WHERE email = ?", (data['email'],))
         new_user = cursor.fetchone()
-        conn.close()
+        conn.commit()
 
-        return jsonify({
-            "id": new_user[0],
-            "name": new_user[1],
-            "email": new_user[2],
-            "role": new_user[3],
-            "status": new_user[4],
-            "created_at": new_user[5],
-            "updated_at": new_user[6]
-        }), 201
+        return json_bytes(serializers.users.dumps_row(new_user), 201)
+    except auth.HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/users/<int:user_id>", methods=["GET"])
+@require_auth()
 def get_user(user_id):
     """GET /api/users/{id} - Get user by ID"""
+    if not is_self_or_admin(user_id):
+        return jsonify({"error": "Not permitted"}), 403
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
-        execute_query(cursor, "SELECT id, name, email, role, status, created_at, updated_at FROM users WHERE id = ?", (user_id,))
+        run(cursor, queries.USER_BY_ID, (user_id,))
         user = cursor.fetchone()
-        conn.close()
 
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        return jsonify({
-            "id": user[0],
-            "name": user[1],
-            "email": user[2],
-            "role": user[3],
-            "status": user[4],
-            "created_at": user[5],
-            "updated_at": user[6]
-        }), 200
+        return json_bytes(serializers.users.dumps_row(user))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/users/<int:user_id>", methods=["PUT"])
+@require_auth('admin')
 @validate_json
 def update_user(user_id):
     """PUT /api/users/{id} - Update user"""
@@ -617,7 +774,7 @@ def update_user(user_id):
         if not data:
             return jsonify({"error": "No data provided"}), 400
 
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
 
         # Build update query dynamically
@@ -638,379 +795,625 @@ def update_user(user_id):
             values.append(data['status'])
         if 'password' in data and data['password']:
             update_fields.append("password = ?")
-            values.append(data['password'])
+            values.append(password_hasher.hash(data['password']))
 
         if not update_fields:
-            conn.close()
             return jsonify({"error": "No valid fields to update"}), 400
 
         update_fields.append("updated_at = CURRENT_TIMESTAMP")
         values.append(user_id)
 
-        execute_query(cursor, f"""
+        run(cursor, queries.dynamic(f"""
             UPDATE users
             SET {', '.join(update_fields)}
             WHERE id = ?
-        """, tuple(values))
+        """, 'user_update'), tuple(values))
 
         conn.commit()
+        user_status_cache.invalidate(user_id)
 
         if cursor.rowcount == 0:
-            conn.close()
             return jsonify({"error": "User not found"}), 404
 
-        conn.close()
         return jsonify({"message": "User updated successfully"}), 200
+    except auth.HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/users/<int:user_id>/toggle-status", methods=["POST"])
+@require_auth('admin')
 def toggle_user_status(user_id):
     """POST /api/users/{id}/toggle-status - Toggle user active/inactive status"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
 
         # Get current status
-        execute_query(cursor, "SELECT status FROM users WHERE id = ?", (user_id,))
+        run(cursor, queries.USER_STATUS_BY_ID, (user_id,))
         user = cursor.fetchone()
 
         if not user:
-            conn.close()
             return jsonify({"error": "User not found"}), 404
 
         new_status = "Inactive" if user[0] == "Active" else "Active"
 
-        execute_query(cursor, """
-            UPDATE users
-            SET status = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (new_status, user_id))
+        run(cursor, queries.USER_SET_STATUS, (new_status, user_id))
 
         conn.commit()
-        conn.close()
+        user_status_cache.invalidate(user_id)
 
         return jsonify({"message": f"User status changed to {new_status}", "status": new_status}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def report_query(conditions):
+    """Report SQL for the visitor filters, newest first"""
+    query = f"SELECT {queries.VISITOR_COLUMNS} FROM visitors"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + " ORDER BY check_in_time DESC, id DESC"
+
+def report_subtitle(args):
+    """Date range line for the PDF heading (None for an unbounded report)"""
+    start_date, end_date = args.get('start_date'), args.get('end_date')
+    if not (start_date or end_date):
+        return None
+    return f"{start_date or 'start'} to {end_date or 'today'}"
+
 @app.route("/api/visitors/report", methods=["GET"])
+@require_auth(query_token=True)
 def download_visitor_report():
     """GET /api/visitors/report - Export visitor data as CSV, Excel, or PDF"""
     try:
         format_type = request.args.get('format', 'csv').lower()
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = "SELECT * FROM visitors"
-        params = []
-        conditions = []
-        
-        if start_date:
-            conditions.append("check_in_time >= ?")
-            # Append time to start of day if just date, but assuming frontend sends YYYY-MM-DD
-            params.append(f"{start_date} 00:00:00")
-            
-        if end_date:
-            conditions.append("check_in_time <= ?")
-            # Append time to end of day
-            params.append(f"{end_date} 23:59:59")
-            
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-            
-        query += " ORDER BY check_in_time DESC"
-        
-        execute_query(cursor, query, tuple(params))
-        visitors = cursor.fetchall()
-        conn.close()
-        
-        # Prepare data list
-        data = []
-        columns = ["ID", "Name", "Email", "Phone", "Purpose", "Check-in", "Check-out", "Host", "Company", "Created", "Updated"]
-        
-        for v in visitors:
-            data.append({
-                "ID": v[0],
-                "Name": v[1],
-                "Email": v[2] or "",
-                "Phone": v[3] or "",
-                "Purpose": v[4],
-                "Check-in": v[5] or "",
-                "Check-out": v[6] or "",
-                "Host": v[7] or "",
-                "Company": v[8] or "",
-                "Created": v[9] or "",
-                "Updated": v[10] or ""
-            })
-            
-        if not data:
-             return jsonify({"error": "No visitor data found"}), 404
 
+        try:
+            conditions, params = build_visitor_filters()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        conn = get_db()
+        query = report_query(conditions)
+
+        # Every format is streamed from a server-side cursor
+        cursor = report_export.open_report_cursor(conn)
+        run(cursor, queries.dynamic(query, 'visitor_report'), tuple(params))
+        first_batch = cursor.fetchmany(report_export.REPORT_BATCH_SIZE)
+        if not first_batch:
+            return jsonify({"error": "No visitor data found"}), 404
+
+        rows = report_export.iter_rows(cursor, first_batch)
         if format_type == 'excel':
-            # Generate Excel using pandas
-            df = pd.DataFrame(data)
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Visitors')
-            output.seek(0)
-            
-            return output.read(), 200, {
+            body = report_export.stream_xlsx(rows)
+            headers = {
                 'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                 'Content-Disposition': 'attachment; filename=visitors_report.xlsx'
             }
-            
         elif format_type == 'pdf':
-            # Generate PDF using reportlab
-            output = io.BytesIO()
-            doc = SimpleDocTemplate(output, pagesize=landscape(letter))
-            elements = []
-            
-            styles = getSampleStyleSheet()
-            elements.append(Paragraph("Visitor Report", styles['Title']))
-            elements.append(Spacer(1, 12))
-            
-            # Prepare table data
-            table_data = [columns[:9]] # Header, limiting columns to fit
-            for item in data:
-                row = [
-                    str(item["ID"]),
-                    item["Name"][:20], # Truncate long names
-                    item["Email"][:20],
-                    item["Phone"],
-                    item["Purpose"],
-                    item["Check-in"][:16], # Show date/time
-                    item["Check-out"][:16] if item["Check-out"] else "",
-                    item["Host"][:15],
-                    item["Company"][:15]
-                ]
-                table_data.append(row)
-                
-            # Create Table
-            t = Table(table_data)
-            t.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0,0), (-1,-1), 1, colors.black),
-                ('FONTSIZE', (0,0), (-1,-1), 8), # Smaller font
-            ]))
-            
-            elements.append(t)
-            doc.build(elements)
-            output.seek(0)
-            
-            return output.read(), 200, {
+            body = report_export.stream_pdf(rows, report_subtitle(request.args))
+            headers = {
                 'Content-Type': 'application/pdf',
-                'Content-Disposition': 'attachment; filename=visitors_report.pdf'
+                'Content-Disposition': 'attachment; filename=visitors_report.pdf',
+                'X-Accel-Buffering': 'no'
             }
-
         else:
-            # Default to CSV
-            output = io.StringIO()
-            writer = csv.DictWriter(output, fieldnames=columns)
-            writer.writeheader()
-            writer.writerows(data)
-            
-            return output.getvalue(), 200, {
+            body = report_export.stream_csv(rows)
+            headers = {
                 'Content-Type': 'text/csv',
-                'Content-Disposition': 'attachment; filename=visitors_report.csv'
+                'Content-Disposition': 'attachment; filename=visitors_report.csv',
+                'X-Accel-Buffering': 'no'
             }
+        # stream_with_context keeps the request (and its pooled connection) alive until the last chunk
+        body = metrics.track_report(format_type if format_type in ('excel', 'pdf') else 'csv', body)
+        return Response(stream_with_context(body), 200, headers)
 
     except Exception as e:
         print(f"Export error: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Report jobs run in a process pool; finished files are cached by format, query and data version
+_report_jobs = report_jobs.ReportJobs(get_db_connection)
+
+@app.route("/api/reports", methods=["POST"])
+@require_auth()
+@validate_json
+def create_report():
+    """POST /api/reports - Queue a report (or reuse a cached or in-progress one)"""
+    try:
+        data = request.get_json()
+        format_type = str(data.get('format', 'csv')).lower()
+        if format_type not in report_jobs.FORMATS:
+            return jsonify({"error": f"Invalid format: expected one of {', '.join(report_jobs.FORMATS)}"}), 400
+        try:
+            conditions, params = build_visitor_filters(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        filters = {key: data[key] for key in ('start_date', 'end_date', 'status', 'host', 'purpose') if data.get(key)}
+        job, queued = _report_jobs.submit(
+            get_db(), format_type, report_query(conditions), params, report_subtitle(data), filters, g.user["id"]
+        )
+        if job["status"] == 'done':
+            return jsonify(job), 200
+        return jsonify(job), 202, {'Location': f"/api/reports/{job['id']}"}
+    except Exception as e:
+        print(f"Report job error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/reports/<job_id>", methods=["GET"])
+@require_auth()
+def get_report(job_id):
+    """GET /api/reports/{id} - Report job status"""
+    try:
+        job = _report_jobs.get(get_db().cursor(), job_id)
+        if not job:
+            return jsonify({"error": "Report not found"}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/reports/<job_id>/download", methods=["GET"])
+@require_auth(query_token=True)
+def download_report(job_id):
+    """GET /api/reports/{id}/download - The finished report file"""
+    try:
+        job, path = _report_jobs.artifact(get_db().cursor(), job_id)
+        if not job:
+            return jsonify({"error": "Report not found"}), 404
+        if job["status"] != 'done':
+            return jsonify({"error": f"Report is {job['status']}", "job": job}), 409
+        try:
+            # Open before answering: eviction may remove the file at any moment after this
+            artifact = open(path, 'rb') if path else None
+        except FileNotFoundError:
+            artifact = None
+        if artifact is None:
+            return jsonify({"error": "Report has expired from the cache; request it again"}), 410
+        extension, mimetype = report_jobs.FORMATS[job["format"]]
+        return send_file(artifact, mimetype=mimetype, as_attachment=True,
+                         download_name=f"visitors_report.{extension}", max_age=0)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/users/<int:user_id>", methods=["DELETE"])
+@require_auth('admin')
 def delete_user(user_id):
     """DELETE /api/users/{id} - Delete user"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
 
-        execute_query(cursor, "DELETE FROM users WHERE id = ?", (user_id,))
+        run(cursor, queries.USER_DELETE, (user_id,))
         conn.commit()
+        user_status_cache.invalidate(user_id)
 
         if cursor.rowcount == 0:
-            conn.close()
             return jsonify({"error": "User not found"}), 404
 
-        conn.close()
         return jsonify({"message": "User deleted successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # Visitor endpoints
+VISITORS_PAGE_DEFAULT = int(os.getenv('VISITORS_PAGE_DEFAULT', 100))
+VISITORS_PAGE_MAX = int(os.getenv('VISITORS_PAGE_MAX', 500))
+
 @app.route("/api/visitors", methods=["GET"])
+@require_auth()
+@conditional_on('visitors')
 def get_visitors():
-    """GET /api/visitors - Get all visitors"""
+    """GET /api/visitors - List visitors, newest first, one keyset page at a time"""
     try:
-        conn = get_db_connection()
+        try:
+            limit = int(request.args.get('limit', VISITORS_PAGE_DEFAULT))
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = min(limit, VISITORS_PAGE_MAX)
+
+        try:
+            conditions, params = build_visitor_filters()
+            if request.args.get('cursor'):
+                last_check_in, last_id = decode_cursor(request.args['cursor'])
+                conditions.append("(check_in_time, id) < (?, ?)")
+                params.extend([last_check_in, last_id])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        query = f"SELECT {queries.VISITOR_COLUMNS} FROM visitors"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # Fetch one extra row to know whether another page exists
+        query += " ORDER BY check_in_time DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        conn = get_db()
         cursor = conn.cursor()
-        execute_query(cursor, "SELECT * FROM visitors ORDER BY check_in_time DESC")
+        # One prepared statement per combination of filters in use
+        run(cursor, queries.dynamic(query, 'visitors_page'), tuple(params))
         visitors = cursor.fetchall()
-        conn.close()
 
-        visitor_list = []
-        for visitor in visitors:
-            visitor_list.append({
-                "id": visitor[0],
-                "name": visitor[1],
-                "email": visitor[2],
-                "phone": visitor[3],
-                "purpose": visitor[4],
-                "check_in_time": f"{visitor[5]}Z" if visitor[5] else None,
-                "check_out_time": f"{visitor[6]}Z" if visitor[6] else None,
-                "host_name": visitor[7],
-                "company": visitor[8],
-                "created_at": f"{visitor[9]}Z" if visitor[9] else None,
-                "updated_at": f"{visitor[10]}Z" if visitor[10] else None
-            })
-
-        return jsonify(visitor_list), 200
+        next_cursor = None
+        if len(visitors) > limit:
+            visitors = visitors[:limit]
+            next_cursor = encode_cursor(visitors[-1][5], visitors[-1][0])
+
+        return json_bytes(serializers.envelope(
+            visitors=serializers.visitors.dumps_rows(visitors),
+            next_cursor=next_cursor
+        ))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+VISITOR_INPUT_FIELDS = ('name', 'email', 'phone', 'purpose', 'host_name', 'company')
+BULK_VISITORS_MAX = int(os.getenv('BULK_VISITORS_MAX', 500))
+
+def clean_visitor_input(data):
+    """Validate one visitor payload; returns (values tuple, None) or (None, error message)"""
+    if not isinstance(data, dict):
+        return None, "Visitor must be a JSON object"
+    if not data.get('name') or not data.get('purpose'):
+        return None, "Name and purpose are required"
+    values = []
+    for field in VISITOR_INPUT_FIELDS:
+        value = data.get(field)
+        if isinstance(value, (dict, list)):
+            return None, f"{field} must be a string"
+        values.append(None if value is None else str(value))
+    return tuple(values), None
+
 @app.route("/api/visitors", methods=["POST"])
+@require_auth()
 @validate_json
 def create_visitor():
     """POST /api/visitors - Create new visitor"""
     try:
         data = request.get_json()
 
-        if not data or not data.get('name') or not data.get('purpose'):
-            return jsonify({"error": "Name and purpose are required"}), 400
+        values, error = clean_visitor_input(data)
+        if error:
+            return jsonify({"error": error}), 400
 
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
 
-        execute_query(cursor, """
-            INSERT INTO visitors (name, email, phone, purpose, host_name, company)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            data['name'],
-            data.get('email'),
-            data.get('phone'),
-            data['purpose'],
-            data.get('host_name'),
-            data.get('company')
-        ))
+        run(cursor, queries.VISITOR_INSERT, values)
+        new_visitor = cursor.fetchone()
+        rollups.record_check_in(cursor, new_visitor[5], new_visitor[4])
+        visitor = serializers.visitors.to_dict(new_visitor)
+        live_feed.publish(cursor, [{"type": "check_in", "id": visitor["id"], "visitor": visitor}])
+        conn.commit()
+
+        return json_bytes(serializers.visitors.dumps_row(new_visitor), 201)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/visitors/bulk", methods=["POST"])
+@require_auth()
+@validate_json
+def create_visitors_bulk():
+    """POST /api/visitors/bulk - Check in many visitors with a single INSERT"""
+    try:
+        data = request.get_json()
+        items = data.get('visitors') if isinstance(data, dict) else data
+
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Expected a non-empty list of visitors"}), 400
+        if len(items) > BULK_VISITORS_MAX:
+            return jsonify({"error": f"At most {BULK_VISITORS_MAX} visitors per request"}), 400
+
+        rows = []
+        indexes = []
+        errors = []
+        for index, item in enumerate(items):
+            values, error = clean_visitor_input(item)
+            if error:
+                errors.append({"index": index, "error": error})
+            else:
+                rows.append(values)
+                indexes.append(index)
+
+        if not rows:
+            return jsonify({"created": [], "errors": errors}), 400
+
+        conn = get_db()
+        cursor = conn.cursor()
 
+        # One statement and one round trip for the whole batch: each column travels as an array
+        columns = list(zip(*rows))
+        run(cursor, queries.VISITOR_INSERT_BULK, tuple(list(column) for column in columns))
+        # Each row comes back with its 1-based position in `rows`, which maps to its request index
+        inserted = cursor.fetchall()
+        new_visitors = [row[1:] for row in inserted]
+        rollups.record_check_ins(cursor, [(visitor[5], visitor[4]) for visitor in new_visitors])
+        visitors = [serializers.visitors.to_dict(visitor) for visitor in new_visitors]
+        live_feed.publish(cursor, [{"type": "check_in", "id": visitor["id"], "visitor": visitor} for visitor in visitors])
         conn.commit()
-        # Fetch mostly recently created visitor for this purpose and name
-        # (Avoiding lastrowid/returning for cross-db simplicity on insert only)
-        execute_query(cursor, "SELECT * FROM visitors WHERE name = ? AND purpose = ? ORDER BY id DESC LIMIT 1", (data['name'], data['purpose']))
-        new_visitor = cursor.fetchone()
-        conn.close()
 
-        return jsonify({
-            "id": new_visitor[0],
-            "name": new_visitor[1],
-            "email": new_visitor[2],
-            "phone": new_visitor[3],
-            "purpose": new_visitor[4],
-            "check_in_time": f"{new_visitor[5]}Z" if new_visitor[5] else None,
-            "check_out_time": f"{new_visitor[6]}Z" if new_visitor[6] else None,
-            "host_name": new_visitor[7],
-            "company": new_visitor[8],
-            "created_at": f"{new_visitor[9]}Z" if new_visitor[9] else None,
-            "updated_at": f"{new_visitor[10]}Z" if new_visitor[10] else None
-        }), 201
+        created = []
+        for row, visitor in zip(inserted, visitors):
+            created.append(dict(visitor, index=indexes[row[0] - 1]))
+
+        return json_bytes(serializers.dumps({"created": created, "errors": errors}), 201)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/visitors/search", methods=["GET"])
+@require_auth()
+def search_visitors():
+    """GET /api/visitors/search - Visitors matching q in name, email, phone, company or host, best first"""
+    try:
+        try:
+            limit = int(request.args.get('limit', search.SEARCH_PAGE_DEFAULT))
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = min(limit, search.SEARCH_PAGE_MAX)
+
+        try:
+            search.clean_query(request.args.get('q'))
+            conditions, params = build_visitor_filters()
+            after = search.decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        cursor = get_db().cursor()
+        visitors, next_cursor, truncated = search.search(cursor, request.args['q'], conditions, params, after, limit)
+        return json_bytes(serializers.envelope(
+            visitors=serializers.visitors.dumps_rows(visitors),
+            next_cursor=next_cursor,
+            truncated=truncated
+        ))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/visitors/stats", methods=["GET"])
+@require_auth()
+def get_visitor_stats():
+    """GET /api/visitors/stats - Visit totals, average duration and per-day/month series from rollups"""
+    try:
+        group = request.args.get('group', 'day')
+        if group not in ('day', 'month'):
+            return jsonify({"error": "Invalid group: expected 'day' or 'month'"}), 400
+        try:
+            start_date = parse_date_arg('start_date')
+            end_date = parse_date_arg('end_date')
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        conn = get_db()
+        cursor = conn.cursor()
+        stats = rollups.query_stats(
+            cursor,
+            start_date.date() if start_date else None,
+            end_date.date() if end_date else None,
+            group
+        )
+        return jsonify(stats), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/visitors/<int:visitor_id>", methods=["GET"])
+@require_auth()
 def get_visitor(visitor_id):
     """GET /api/visitors/{id} - Get visitor by ID"""
     try:
-        conn = get_db_connection()
+        try:
+            check_in_time = check_in_hint()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        conn = get_db()
         cursor = conn.cursor()
-        execute_query(cursor, "SELECT * FROM visitors WHERE id = ?", (visitor_id,))
+        if check_in_time:
+            run(cursor, queries.VISITOR_BY_ID_AT, (visitor_id, check_in_time))
+        else:
+            run(cursor, queries.VISITOR_BY_ID, (visitor_id,))
         visitor = cursor.fetchone()
-        conn.close()
 
         if not visitor:
             return jsonify({"error": "Visitor not found"}), 404
 
-        return jsonify({
-            "id": visitor[0],
-            "name": visitor[1],
-            "email": visitor[2],
-            "phone": visitor[3],
-            "purpose": visitor[4],
-            "check_in_time": f"{visitor[5]}Z" if visitor[5] else None,
-            "check_out_time": f"{visitor[6]}Z" if visitor[6] else None,
-            "host_name": visitor[7],
-            "company": visitor[8],
-            "created_at": f"{visitor[9]}Z" if visitor[9] else None,
-            "updated_at": f"{visitor[10]}Z" if visitor[10] else None
-        }), 200
+        return json_bytes(serializers.visitors.dumps_row(visitor))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/visitors/<int:visitor_id>/checkout", methods=["POST"])
+@require_auth()
 def checkout_visitor(visitor_id):
     """POST /api/visitors/{id}/checkout - Check out visitor"""
     try:
-        conn = get_db_connection()
+        try:
+            check_in_time = check_in_hint()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        conn = get_db()
         cursor = conn.cursor()
 
-        execute_query(cursor, """
-            UPDATE visitors
-            SET check_out_time = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ? AND check_out_time IS NULL
-        """, (visitor_id,))
-
-        conn.commit()
+        if check_in_time:
+            run(cursor, queries.VISITOR_CHECKOUT_AT, (visitor_id, check_in_time))
+        else:
+            run(cursor, queries.VISITOR_CHECKOUT, (visitor_id,))
+        visit = cursor.fetchone()
 
-        if cursor.rowcount == 0:
-            conn.close()
+        if not visit:
             return jsonify({"error": "Visitor not found or already checked out"}), 404
 
-        conn.close()
-        return jsonify({"message": "Visitor checked out successfully"}), 200
+        rollups.record_check_out(cursor, visit[5], visit[6])
+        visitor = serializers.visitors.to_dict(visit)
+        live_feed.publish(cursor, [{"type": "check_out", "id": visitor_id, "visitor": visitor}])
+        conn.commit()
+
+        return json_bytes(serializers.dumps({"message": "Visitor checked out successfully", "visitor": visitor}))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/visitors/<int:visitor_id>", methods=["DELETE"])
+@require_auth()
 def delete_visitor(visitor_id):
     """DELETE /api/visitors/{id} - Delete visitor"""
     try:
-        conn = get_db_connection()
+        try:
+            check_in_time = check_in_hint()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        conn = get_db()
         cursor = conn.cursor()
 
-        execute_query(cursor, "DELETE FROM visitors WHERE id = ?", (visitor_id,))
-        conn.commit()
+        if check_in_time:
+            run(cursor, queries.VISITOR_DELETE_AT, (visitor_id, check_in_time))
+        else:
+            run(cursor, queries.VISITOR_DELETE, (visitor_id,))
+        visit = cursor.fetchone()
 
-        if cursor.rowcount == 0:
-            conn.close()
+        if not visit:
             return jsonify({"error": "Visitor not found"}), 404
 
-        conn.close()
+        rollups.record_delete(cursor, visit[0], visit[1], visit[2])
+        live_feed.publish(cursor, [{"type": "delete", "id": visitor_id}])
+        conn.commit()
+
         return jsonify({"message": "Visitor deleted successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-# Settings endpoints
-@app.route("/api/settings", methods=["GET"])
-def get_settings():
-    """GET /api/settings - Get system settings"""
+CHANGES_PAGE_DEFAULT = int(os.getenv('CHANGES_PAGE_DEFAULT', 500))
+CHANGES_PAGE_MAX = int(os.getenv('CHANGES_PAGE_MAX', 5000))
+
+@app.route("/api/visitors/changes", methods=["GET"])
+@require_auth()
+def get_visitor_changes():
+    """GET /api/visitors/changes - Visitors added/updated and ids deleted since a sync token"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        execute_query(cursor, "SELECT * FROM settings WHERE id = 1")
+        try:
+            limit = int(request.args.get('limit', CHANGES_PAGE_DEFAULT))
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = min(limit, CHANGES_PAGE_MAX)
+
+        cursor = get_db().cursor()
+        try:
+            visitors, deleted, next_token, has_more = changes.fetch_changes(cursor, request.args.get('since'), limit)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except changes.TokenExpired as e:
+            return jsonify({"error": str(e), "resync": True}), 410
+
+        # Keep calling with next_token while has_more; once caught up, poll with it later
+        return json_bytes(serializers.envelope(
+            visitors=serializers.visitors.dumps_rows(visitors),
+            deleted=deleted,
+            next_token=next_token,
+            has_more=has_more
+        ))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Live visitor events (Server-Sent Events)
+# A stream holds its worker thread for its whole life; run gunicorn with --worker-class gthread
+# (or gevent) so streams don't starve ordinary requests. SSE_MAX_DURATION bounds how long any
+# one client holds a thread; EventSource reconnects on its own after the stream ends.
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', 15))
+SSE_MAX_DURATION = float(os.getenv('SSE_MAX_DURATION', 300))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 3000))
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 100))
+SSE_MAX_SUBSCRIBERS = int(os.getenv('SSE_MAX_SUBSCRIBERS', 100))
+
+_live_feed = None
+_live_feed_lock = threading.Lock()
+
+def get_live_feed():
+    """Get the process-wide live feed (its listener thread starts on first subscribe)"""
+    global _live_feed
+    if _live_feed is None:
+        with _live_feed_lock:
+            if _live_feed is None:
+                _live_feed = live_feed.LiveFeed(
+                    get_db_connection,
+                    queue_size=SSE_QUEUE_SIZE,
+                    max_subscribers=SSE_MAX_SUBSCRIBERS
+                )
+    return _live_feed
+
+@app.route("/api/visitors/stream", methods=["GET"])
+@require_auth(query_token=True)
+def stream_visitor_events():
+    """GET /api/visitors/stream - Currently-inside snapshot, then check_in/check_out/delete events"""
+    feed = get_live_feed()
+    # Subscribe before reading the snapshot so no event falls between the two
+    subscription = feed.subscribe()
+    if subscription is None:
+        return jsonify({"error": "Too many live subscribers, try again later"}), 503, {'Retry-After': '10'}
+
+    try:
+        cursor = get_db().cursor()
+        run(cursor, queries.VISITORS_INSIDE)
+        snapshot = serializers.visitors.dumps_rows(cursor.fetchall()).decode('utf-8')
+    except Exception as e:
+        feed.unsubscribe(subscription)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        # The stream outlives the handler; don't keep a pooled connection for it
+        release_db(None)
+
+    def generate():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            yield live_feed.format_sse("snapshot", snapshot)
+            deadline = time.monotonic() + SSE_MAX_DURATION
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = subscription.get(timeout=min(SSE_HEARTBEAT, remaining))
+                if subscription.overflowed:
+                    # Fell behind: tell the client to refetch instead of replaying a backlog
+                    yield live_feed.format_sse("resync", "{}")
+                    break
+                if event is None:
+                    # Comment line; also how a disconnected client is noticed
+                    yield ": heartbeat\n\n"
+                    continue
+                yield live_feed.format_sse(*event)
+        finally:
+            feed.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# Settings endpoints
+# Each worker caches the settings row. After SETTINGS_CACHE_TTL seconds it re-checks only the
+# version column, so an update made through any worker is picked up everywhere within the TTL.
+SETTINGS_CACHE_TTL = float(os.getenv('SETTINGS_CACHE_TTL', 2))
+
+_settings_cache = {"version": None, "settings": None, "checked_at": 0.0}
+_settings_lock = threading.Lock()
+
+def get_cached_settings():
+    """Return (version, settings dict), hitting the database at most once per TTL"""
+    with _settings_lock:
+        version = _settings_cache["version"]
+        settings = _settings_cache["settings"]
+        checked_at = _settings_cache["checked_at"]
+    if version is not None and time.monotonic() - checked_at < SETTINGS_CACHE_TTL:
+        return version, settings
+
+    cursor = get_db().cursor()
+    run(cursor, queries.SETTINGS_VERSION)
+    row = cursor.fetchone()
+    if not row:
+        return None, None
+
+    if row[0] != version:
+        run(cursor, queries.SETTINGS_ROW)
         row = cursor.fetchone()
-        conn.close()
-        
-        if not row:
-            return jsonify({"error": "Settings not initialized"}), 500
-            
+        version = row[0]
         settings = {
             "organizationName": row[1],
             "email": row[2],
@@ -1021,35 +1424,52 @@ def get_settings():
             "requireEmail": bool(row[7]),
             "requireOrganization": bool(row[8])
         }
-        return jsonify(settings), 200
+
+    with _settings_lock:
+        _settings_cache.update(version=version, settings=settings, checked_at=time.monotonic())
+    return version, settings
+
+def invalidate_settings_cache():
+    """Force the next read to re-check the database"""
+    with _settings_lock:
+        _settings_cache["checked_at"] = 0.0
+
+@app.route("/api/settings", methods=["GET"])
+def get_settings():
+    """GET /api/settings - Get system settings (supports If-None-Match)"""
+    try:
+        version, settings = get_cached_settings()
+        
+        if settings is None:
+            return jsonify({"error": "Settings not initialized"}), 500
+
+        etag = f"settings-{version}"
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(settings)
+        response.set_etag(etag, weak=True)
+        # Let clients keep a copy but revalidate it every time
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/settings", methods=["PUT"])
+@require_auth('admin')
 @validate_json
 def update_settings():
     """PUT /api/settings - Update system settings"""
     try:
         data = request.json
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
         # Determine strictness of booleans based on DB type (Postgres needs explicit bools usually, SQLite 0/1)
         # However, Python SQLite adapter handles bools as 0/1. Postgres adapter handles bools as True/False.
         # execute_query abstraction handles some, but let's pass raw values and let driver handle.
         
-        execute_query(cursor, """
-            UPDATE settings SET
-                organization_name = ?,
-                email = ?,
-                phone = ?,
-                push_notifications = ?,
-                email_notifications = ?,
-                auto_checkout = ?,
-                require_email = ?,
-                require_organization = ?
-            WHERE id = 1
-        """, (
+        run(cursor, queries.SETTINGS_UPDATE, (
             data.get('organizationName'),
             data.get('email'),
             data.get('phone'),
@@ -1061,7 +1481,7 @@ def update_settings():
         ))
         
         conn.commit()
-        conn.close()
+        invalidate_settings_cache()
         return jsonify({"message": "Settings updated successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1075,20 +1495,33 @@ def index():
     return jsonify({
         "app": "Visitor Tracker Backend API",
         "version": "1.0.0",
+        "auth": "POST /api/login returns a token; send it as 'Authorization: Bearer <token>'",
         "endpoints": {
+            "POST /api/login": "Sign in (returns the user, a session token and its expiry)",
             "GET /api/users": "List all users",
             "POST /api/users": "Create new user",
             "GET /api/users/{id}": "Get user by ID",
             "PUT /api/users/{id}": "Update user",
             "POST /api/users/{id}/toggle-status": "Toggle user status",
             "DELETE /api/users/{id}": "Delete user",
-            "GET /api/visitors": "List all visitors",
+            "GET /api/visitors": "List visitors (keyset-paginated: limit, cursor, start_date, end_date, status, host, purpose)",
             "POST /api/visitors": "Create new visitor",
-            "GET /api/visitors/{id}": "Get visitor by ID",
-            "POST /api/visitors/{id}/checkout": "Check out visitor",
+            "POST /api/visitors/bulk": "Check in many visitors at once ({visitors: [...]}, per-row errors)",
+            "GET /api/visitors/search": "Ranked search over name, email, phone, company and host (q, limit, cursor, plus the list filters)",
+            "GET /api/visitors/{id}": "Get visitor by ID (optional check_in_time reads only its month's partition)",
+            "POST /api/visitors/{id}/checkout": "Check out visitor (optional check_in_time, as for GET)",
             "GET /api/visitors/report": "Download visitor report",
+            "POST /api/reports": "Queue a visitor report ({format, start_date, end_date, status, host, purpose}); returns a job",
+            "GET /api/reports/{id}": "Report job status (download_url once done)",
+            "GET /api/reports/{id}/download": "Download a finished report",
+            "GET /api/visitors/stats": "Visit totals and per-day/month series (start_date, end_date, group)",
+            "GET /api/visitors/stream": "Live visitor events (Server-Sent Events)",
+            "GET /api/visitors/changes": "Visitors changed and ids deleted since a sync token (since, limit)",
             "DELETE /api/visitors/{id}": "Delete visitor",
-            "GET /api/health": "Health check"
+            "GET /api/health": "Health check",
+            "GET /api/metrics": "Prometheus metrics (requests, queries, pool waits, reports)",
+            "GET /api/debug/queries": "Per-statement query timings, admin only (reset=1 to clear)",
+            "GET /api/debug/slow-queries": "Recent slow statements with sampled plans, admin only (reset=1 to clear)"
         }
     }), 200
 
@@ -1102,53 +1535,43 @@ def debug_init():
     except Exception as e:
         return jsonify({"error": f"Initialization failed: {str(e)}"}), 500
 
+# The debug seed writes into the live visitors table, so it is off unless a deployment opts in
+DEBUG_SEED_ENABLED = os.getenv('DEBUG_SEED_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# Largest ?count the debug seed accepts; bigger loads belong to seed_visitors.py
+DEBUG_SEED_MAX = int(os.getenv('DEBUG_SEED_MAX', 100000))
+
 @app.route("/api/debug/seed", methods=["GET"])
+@require_auth('admin')
 def debug_seed():
-    """GET /api/debug/seed - Add dummy visitor data for testing"""
+    """GET /api/debug/seed?count=20&days=30&seed=42 - Add synthetic visitors (COPY via seed_visitors.py)"""
+    if not DEBUG_SEED_ENABLED:
+        return jsonify({"error": "Debug seeding is disabled (set DEBUG_SEED_ENABLED=true)"}), 404
+    conn = get_db()
     try:
-        conn = get_db_connection()
-        conn.autocommit = True
         cursor = conn.cursor()
         
         # Check if visitors exist
         execute_query(cursor, "SELECT COUNT(*) FROM visitors")
         if cursor.fetchone()[0] > 0:
+            conn.rollback()
             return jsonify({"message": "Visitors already exist. Skipping seed."}), 200
-            
-        print("Seeding dummy visitors...")
-        purposes = ['Meeting', 'Delivery', 'Interview', 'Maintenance', 'Visit']
-        
-        # Generate 20 dummy visitors
-        for i in range(20):
-            days_ago = random.randint(0, 30)
-            check_in = datetime.now() - timedelta(days=days_ago, hours=random.randint(1, 4))
-            # Randomly checkout some
-            check_out = check_in + timedelta(hours=random.randint(1, 3)) if random.random() > 0.3 else None
-            
-            execute_query(cursor, """
-                INSERT INTO visitors (name, email, phone, purpose, check_in_time, check_out_time, host_name, company)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                f"Visitor {i+1}", 
-                f"visitor{i+1}@example.com", 
-                f"555-01{i:02d}", 
-                random.choice(purposes),
-                check_in,
-                check_out,
-                "Admin Host",
-                "Test Corp"
-            ))
-            
-        conn.close()
-        return jsonify({"message": "Seeded 20 test visitors successfully"}), 200
+        conn.rollback()
+
+        count = min(max(request.args.get('count', 20, type=int), 1), DEBUG_SEED_MAX)
+        days = min(max(request.args.get('days', 30, type=int), 1), 3650)
+        generator = seed_visitors.VisitorGenerator(count, days, seed=request.args.get('seed', 42, type=int))
+        print(f"Seeding {count} dummy visitors...")
+        rows = seed_visitors.load(conn, generator)
+        return jsonify({"message": f"Seeded {rows} test visitors successfully"}), 200
     except Exception as e:
+        conn.rollback()
         return jsonify({"error": f"Seeding failed: {str(e)}"}), 500
 
 @app.route("/api/debug/schema", methods=["GET"])
 def debug_schema():
     """GET /api/debug/schema - Dump table columns"""
     try:
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
         
         # Get users columns
@@ -1158,19 +1581,43 @@ def debug_schema():
         else:
             user_cols = ["Unknown"]
             
-        conn.close()
         return jsonify({"users_columns": user_cols}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/debug/queries", methods=["GET"])
+@require_auth('admin')
+def debug_queries():
+    """GET /api/debug/queries - Per-statement timings for this worker (?reset=1 clears them)"""
+    reset = request.args.get('reset', '').lower() in ('1', 'true', 'yes')
+    return jsonify({
+        "timing_enabled": queries.QUERY_TIMING,
+        "pid": os.getpid(),
+        "statements": queries.timings(reset=reset)
+    }), 200
+
+@app.route("/api/debug/slow-queries", methods=["GET"])
+@require_auth('admin')
+def debug_slow_queries():
+    """GET /api/debug/slow-queries - Slow statements seen by this worker, newest first (?reset=1 clears them)"""
+    reset = request.args.get('reset', '').lower() in ('1', 'true', 'yes')
+    return jsonify({
+        "pid": os.getpid(),
+        "settings": slow_queries.stats(),
+        "entries": slow_queries.entries(reset=reset)
+    }), 200
+
 # Initialize database on startup (for both local and production Gunicorn)
-print("Initializing database...")
-try:
-    with app.app_context():
-        init_db()
-    print("SUCCESS: Database initialized")
-except Exception as e:
-    print(f"WARNING: Database initialization failed: {e}")
+# Report pool processes are spawned: under `python api_server.py` each one imports this file
+# again as __mp_main__, and must not run the migrations again
+if __name__ != '__mp_main__':
+    print("Initializing database...")
+    try:
+        with app.app_context():
+            init_db()
+        print("SUCCESS: Database initialized")
+    except Exception as e:
+        print(f"WARNING: Database initialization failed: {e}")
 
 if __name__ == "__main__":
     print("="*50)
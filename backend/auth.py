@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Authentication for the Visitor Tracker API
+- Session tokens are HMAC-SHA256 signed and carry their own expiry, so checking one
+  needs no database access.
+- A user's status and role are cached for a few seconds. Deactivating or deleting a
+  user locks them out within that window, immediately on the worker that made the
+  change.
+- Passwords are stored as PBKDF2-SHA256 hashes. Hashing runs on a small bounded thread
+  pool, so a burst of logins is turned away early instead of tying up request threads.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import queries
+
+TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', 12 * 3600))
+STATUS_CACHE_TTL = float(os.getenv('AUTH_STATUS_CACHE_TTL', 5))
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', 260000))
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+HASH_SCHEME = 'pbkdf2_sha256'
+
+# Signing key shared by every worker, generated on first start unless AUTH_SECRET is set
+SETUP_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS app_secrets (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    INSERT INTO app_secrets (name, value)
+    VALUES ('auth_signing_key', replace(gen_random_uuid()::text || gen_random_uuid()::text, '-', ''))
+    ON CONFLICT (name) DO NOTHING
+    """,
+]
+
+SIGNING_KEY = queries.statement("auth_signing_key", "SELECT value FROM app_secrets WHERE name = 'auth_signing_key'")
+
+
+class AuthError(Exception):
+    """Missing, malformed, forged or expired token"""
+
+
+class HasherBusy(Exception):
+    """Too many password hashes queued; the caller should retry later"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenSigner:
+    """Issues and verifies `<payload>.<signature>` tokens"""
+
+    def __init__(self, secret, ttl=TOKEN_TTL):
+        self._secret = secret if isinstance(secret, bytes) else secret.encode('utf-8')
+        self.ttl = ttl
+
+    def _sign(self, payload):
+        return hmac.new(self._secret, payload.encode('ascii'), hashlib.sha256).digest()
+
+    def issue(self, user_id, role):
+        """Return (token, expiry as a unix timestamp)"""
+        expires = int(time.time()) + self.ttl
+        payload = _b64encode(json.dumps({"uid": user_id, "role": role, "exp": expires}, separators=(',', ':')).encode())
+        return f"{payload}.{_b64encode(self._sign(payload))}", expires
+
+    def verify(self, token):
+        """Claims of a valid token; raises AuthError otherwise"""
+        try:
+            payload, signature = token.split('.')
+            valid = hmac.compare_digest(_b64decode(signature), self._sign(payload))
+        except (ValueError, TypeError, UnicodeEncodeError):
+            raise AuthError("Malformed token")
+        if not valid:
+            raise AuthError("Invalid token")
+        claims = json.loads(_b64decode(payload))
+        if claims.get("exp", 0) < time.time():
+            raise AuthError("Token expired")
+        return claims
+
+
+def load_signing_key(cursor):
+    """AUTH_SECRET if set, otherwise the key stored by SETUP_SQL"""
+    secret = os.getenv('AUTH_SECRET')
+    if secret:
+        return secret
+    queries.run(cursor, SIGNING_KEY)
+    row = cursor.fetchone()
+    if not row:
+        raise RuntimeError("No auth signing key: set AUTH_SECRET or run python migrations.py --migrate")
+    return row[0]
+
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(HASH_SCHEME + '$')
+
+
+def hash_password(password, iterations=PASSWORD_HASH_ITERATIONS, salt=None):
+    """PBKDF2 hash in `pbkdf2_sha256$iterations$salt$digest` form (runs on the calling thread)"""
+    salt = salt or secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('ascii'), iterations)
+    return f"{HASH_SCHEME}${iterations}${salt}${_b64encode(digest)}"
+
+
+def check_password(password, stored):
+    """(matches, needs rehash) for a stored hash or a legacy plain-text password"""
+    if not is_hashed(stored):
+        # Rows written before hashing was introduced; upgraded on the next successful login
+        return hmac.compare_digest(password.encode('utf-8'), (stored or '').encode('utf-8')), True
+    try:
+        _, iterations, salt, _ = stored.split('$')
+        iterations = int(iterations)
+        candidate = hash_password(password, iterations, salt)
+        return hmac.compare_digest(candidate, stored), iterations != PASSWORD_HASH_ITERATIONS
+    except (ValueError, TypeError):
+        # A damaged hash can never match; a failed login beats a 500
+        print("WARNING: Malformed password hash; treating it as no match")
+        return False, False
+
+
+class PasswordHasher:
+    """PBKDF2 hashing on a bounded pool (hashlib releases the GIL while it works)"""
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING,
+                 timeout=PASSWORD_HASH_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._counts = {"hashed": 0, "verified": 0, "rejected": 0}
+
+    def _get_executor(self):
+        # Thread pools do not survive fork; each worker process makes its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counts["rejected"] += 1
+            raise HasherBusy("Too many password checks in progress")
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(self.timeout)
+
+    def hash(self, password):
+        result = self._submit(hash_password, password)
+        with self._lock:
+            self._counts["hashed"] += 1
+        return result
+
+    def verify(self, password, stored):
+        """Return (matches, needs_rehash)"""
+        result = self._submit(check_password, password, stored)
+        with self._lock:
+            self._counts["verified"] += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, workers=self.workers)
+
+
+class StatusCache:
+    """Short-lived per-process cache of user id -> (status, role)"""
+
+    def __init__(self, ttl=STATUS_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0}
+
+    def get(self, user_id, load):
+        """Cached (status, role), calling load(user_id) on a miss (None = no such user)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._counts["hits"] += 1
+                return entry[0]
+            self._counts["misses"] += 1
+        state = load(user_id)
+        with self._lock:
+            self._entries[user_id] = (state, now)
+        return state
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, size=len(self._entries), ttl=self.ttl)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Auto checkout for visitors who never checked out
+When settings.auto_checkout is on, open visits older than AUTO_CHECKOUT_AFTER_HOURS are
+closed with check_out_time = check_in_time + the cutoff. Durations stay bounded by the
+cutoff instead of growing with how long the visit was left open.
+
+One scheduler thread runs in the whole deployment, in the worker holding a Postgres
+advisory lock; the lock belongs to that thread's connection. Other workers keep no thread
+or connection for it. While serving requests they check pg_locks once per interval, and
+start a thread to contend for the lock only when nobody holds it. A thread that loses
+the race exits again. So when the leader dies, its lock goes with its session and a
+worker takes over within an interval. Each sweep is one
+set-based UPDATE ... RETURNING per batch. The rollups and the live feed are updated in
+the same transaction. The leader also creates upcoming visitor partitions (partitions.py),
+so it runs even with AUTO_CHECKOUT_ENABLED=false; that flag only stops the sweeps.
+
+Run a single sweep by hand (ignores the settings flag) with:
+
+    python auto_checkout.py --sweep [--after-hours 12]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import partitions
+import queries
+import rollups
+import live_feed
+import metrics
+import serializers
+
+log = logging.getLogger(__name__)
+
+# false: the leader only maintains partitions and never sweeps
+AUTO_CHECKOUT_ENABLED = os.getenv('AUTO_CHECKOUT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+AUTO_CHECKOUT_INTERVAL = float(os.getenv('AUTO_CHECKOUT_INTERVAL', 300))
+AUTO_CHECKOUT_AFTER_HOURS = float(os.getenv('AUTO_CHECKOUT_AFTER_HOURS', 12))
+AUTO_CHECKOUT_BATCH = int(os.getenv('AUTO_CHECKOUT_BATCH', 1000))
+# The leader also keeps upcoming visitor partitions created, whatever AUTO_CHECKOUT_ENABLED says
+PARTITION_CHECK_INTERVAL = 3600
+
+# Arbitrary application-wide key for pg_try_advisory_lock ("vtac")
+LEADER_LOCK_KEY = 0x76746163
+
+ENABLED = queries.statement("auto_checkout_enabled", "SELECT auto_checkout FROM settings WHERE id = 1")
+TRY_LEAD = queries.statement("auto_checkout_try_lead", "SELECT pg_try_advisory_lock(?)")
+# A bigint advisory key shows in pg_locks as classid (high 32 bits) and objid (low 32 bits)
+LEADER_HELD = queries.statement("auto_checkout_leader_held", """
+    SELECT EXISTS (
+        SELECT 1 FROM pg_locks
+        WHERE locktype = 'advisory' AND granted AND objsubid = 1
+          AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+          AND classid = (?::bigint >> 32)::oid AND objid = (?::bigint & 4294967295)::oid
+    )
+""")
+
+# Oldest first so a backlog drains in check-in order; SKIP LOCKED leaves rows that a
+# manual checkout is updating right now to that checkout
+SWEEP = queries.statement("auto_checkout_sweep", f"""
+    WITH due AS (
+        SELECT id, check_in_time FROM visitors
+        WHERE check_out_time IS NULL
+          AND check_in_time < CURRENT_TIMESTAMP - make_interval(secs => ?)
+        ORDER BY check_in_time
+        LIMIT ?
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE visitors AS v
+    SET check_out_time = v.check_in_time + make_interval(secs => ?), updated_at = CURRENT_TIMESTAMP
+    FROM due
+    WHERE v.id = due.id AND v.check_in_time = due.check_in_time
+    RETURNING {", ".join("v." + field for field in queries.VISITOR_FIELDS)}
+""")
+
+
+def sweep(conn, after_hours=AUTO_CHECKOUT_AFTER_HOURS, batch_size=AUTO_CHECKOUT_BATCH):
+    """Check out every visit open longer than after_hours, one committed batch at a time; returns rows swept"""
+    cutoff = after_hours * 3600
+    total = 0
+    while True:
+        cursor = conn.cursor()
+        try:
+            queries.run(cursor, SWEEP, (cutoff, batch_size, cutoff))
+            visits = cursor.fetchall()
+            rollups.record_check_outs(cursor, [(visit[5], visit[6]) for visit in visits])
+            live_feed.publish(cursor, [
+                {"type": "check_out", "id": visit[0], "visitor": serializers.visitors.to_dict(visit)}
+                for visit in visits
+            ])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += len(visits)
+        if len(visits) < batch_size:
+            return total
+
+
+class AutoCheckout:
+    """Scheduler thread, started in a worker only while no process leads; sweeps while it holds the leader lock"""
+
+    def __init__(self, connect, interval=AUTO_CHECKOUT_INTERVAL, after_hours=AUTO_CHECKOUT_AFTER_HOURS,
+                 batch_size=AUTO_CHECKOUT_BATCH):
+        self._connect = connect
+        self.interval = interval
+        self.after_hours = after_hours
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._leader = False
+        self._next_leader_check = 0.0
+        self._next_partition_check = 0.0
+        self._counts = {
+            "sweeps": 0,
+            "rows_swept": 0,
+            "errors": 0,
+            "sweep_seconds_total": 0.0,
+            "last_sweep_seconds": None,
+            "last_sweep_rows": None,
+            "last_sweep_at": None,
+        }
+
+    def check(self):
+        """Start the thread here if no process leads; called on requests, queries at most once per interval"""
+        # Threads do not survive fork: the pid tells whether this process runs one
+        if self._pid == os.getpid() or time.monotonic() < self._next_leader_check:
+            return
+        with self._lock:
+            if self._pid == os.getpid() or time.monotonic() < self._next_leader_check:
+                return
+            self._next_leader_check = time.monotonic() + self.interval
+        # On a connection of its own: a failure here must not leave the request's transaction aborted
+        try:
+            conn = self._connect()
+            try:
+                cursor = conn.cursor()
+                queries.run(cursor, LEADER_HELD, (LEADER_LOCK_KEY, LEADER_LOCK_KEY))
+                held = cursor.fetchone()[0]
+            finally:
+                conn.close()
+        except Exception as e:
+            log.warning("Could not check for an auto checkout leader: %s", e)
+            return
+        if not held:
+            self.start()
+
+    def start(self):
+        """Start the scheduler thread in this process unless it already runs one"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._leader = False
+            threading.Thread(target=self._run, name="auto-checkout", daemon=True).start()
+
+    def _record(self, rows, seconds):
+        with self._lock:
+            self._counts["sweeps"] += 1
+            self._counts["rows_swept"] += rows
+            self._counts["sweep_seconds_total"] += seconds
+            self._counts["last_sweep_seconds"] = round(seconds, 4)
+            self._counts["last_sweep_rows"] = rows
+            self._counts["last_sweep_at"] = time.time()
+
+    def _tick(self, conn):
+        """Try to lead, keep partitions created, then sweep if auto checkout is switched on; False when another process leads"""
+        cursor = conn.cursor()
+        if not self._leader:
+            queries.run(cursor, TRY_LEAD, (LEADER_LOCK_KEY,))
+            self._leader = cursor.fetchone()[0]
+            conn.commit()
+            if not self._leader:
+                return False
+            log.info("Auto checkout leader is process %d", os.getpid())
+
+        if time.monotonic() >= self._next_partition_check:
+            for name in partitions.ensure_partitions(cursor):
+                log.info("Created partition %s", name)
+            conn.commit()
+            self._next_partition_check = time.monotonic() + PARTITION_CHECK_INTERVAL
+
+        if not AUTO_CHECKOUT_ENABLED:
+            return True
+        queries.run(cursor, ENABLED)
+        row = cursor.fetchone()
+        conn.commit()
+        if not row or not row[0]:
+            return True
+
+        started = time.perf_counter()
+        rows = sweep(conn, self.after_hours, self.batch_size)
+        seconds = time.perf_counter() - started
+        self._record(rows, seconds)
+        metrics.observe_sweep(rows, seconds)
+        if rows:
+            log.info("Auto checkout closed %d visits open longer than %gh in %.3fs", rows, self.after_hours, seconds)
+        return True
+
+    def _run(self):
+        conn = None
+        while True:
+            try:
+                if conn is None:
+                    conn = self._connect()
+                if not self._tick(conn):
+                    # Another process leads: stop, and let check() look again later
+                    conn.close()
+                    with self._lock:
+                        self._pid = None
+                        self._next_leader_check = time.monotonic() + self.interval
+                    return
+            except Exception as e:
+                log.warning("Auto checkout sweep failed: %s", e)
+                with self._lock:
+                    self._counts["errors"] += 1
+                # Closing the connection releases the lock if we held it; leadership is contested again
+                self._leader = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+            time.sleep(self.interval)
+
+    def stats(self):
+        """Sweep counters for this process (only the leader sweeps)"""
+        with self._lock:
+            counts = dict(self._counts)
+        counts["sweep_seconds_total"] = round(counts["sweep_seconds_total"], 4)
+        counts["leader"] = self._leader
+        counts["interval"] = self.interval
+        counts["after_hours"] = self.after_hours
+        return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check out visitors who never checked out")
+    parser.add_argument('--sweep', action='store_true', help="Run one sweep now")
+    parser.add_argument('--after-hours', type=float, default=AUTO_CHECKOUT_AFTER_HOURS,
+                        help="Close visits open longer than this")
+    args = parser.parse_args()
+
+    if not args.sweep:
+        parser.print_help()
+        sys.exit(1)
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        swept = sweep(conn, args.after_hours)
+        print(f"✓ Checked out {swept} visits open longer than {args.after_hours:g} hours")
+    except Exception as e:
+        print(f"✗ Error running auto checkout: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
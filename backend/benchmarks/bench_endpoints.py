@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Benchmark: HTTP latency and throughput of the main endpoints against a seeded Postgres
+For each dataset size a throwaway database is created on the server in DATABASE_URL,
+the API is started against it (gunicorn when installed, otherwise Flask's threaded
+server), visitors are seeded, and each endpoint is loaded at each concurrency level for
+a fixed time. The database is dropped afterwards.
+
+    python benchmarks/bench_endpoints.py [--sizes 10000 1000000 10000000] [--concurrency 1 8 32]
+        [--duration 10] [--endpoints visitors_list health ...] [--output results.json]
+        [--compare baseline.json]
+
+Results are written as JSON (with the git commit) so two runs can be compared:
+
+    python benchmarks/bench_endpoints.py --output before.json
+    git checkout my-branch
+    python benchmarks/bench_endpoints.py --output after.json --compare before.json
+
+The connecting role needs CREATEDB. Requests are signed in as the main admin the migrations create.
+"""
+
+import argparse
+import collections
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+import psycopg2
+
+import migrations
+import partitions
+
+SEED_BATCH = 1000000
+# Open visits the checkout endpoint can work through
+CHECKOUT_POOL = 200000
+
+# Server-side generated visitors, newest first: about 5% still open, spread over `days`
+SEED_SQL = """
+    INSERT INTO visitors (name, email, phone, purpose, check_in_time, check_out_time, host_name, company)
+    SELECT 'Visitor ' || g, 'visitor' || g || '@example.com', '98' || lpad(g::text, 8, '0'),
+           (ARRAY['Meeting', 'Delivery', 'Interview', 'Maintenance', 'Visit'])[1 + g %% 5],
+           ts, CASE WHEN g %% 20 = 0 THEN NULL ELSE ts + make_interval(mins => 15 + g %% 120) END,
+           'Host ' || (g %% 50), 'Company ' || (g %% 500)
+    FROM (
+        SELECT g, LOCALTIMESTAMP - make_interval(secs => g * %s) AS ts
+        FROM generate_series(%s, %s) AS g
+    ) AS generated
+"""
+
+
+def scenarios(report_days):
+    """name -> (method, path or callable(ids) -> path, JSON body or None)"""
+    since = (date.today() - timedelta(days=report_days)).isoformat()
+    return collections.OrderedDict([
+        ('health', ('GET', '/api/health', None)),
+        ('settings', ('GET', '/api/settings', None)),
+        ('visitors_list', ('GET', '/api/visitors?limit=100', None)),
+        ('visitor_create', ('POST', '/api/visitors', {"name": "Bench Visitor", "purpose": "Meeting", "host_name": "Host 1"})),
+        ('visitor_checkout', ('POST', lambda ids: f"/api/visitors/{ids.pop()}/checkout", {})),
+        ('report_csv', ('GET', f'/api/visitors/report?format=csv&start_date={since}', None)),
+        ('report_excel', ('GET', f'/api/visitors/report?format=excel&start_date={since}', None)),
+        ('report_pdf', ('GET', f'/api/visitors/report?format=pdf&start_date={since}', None)),
+    ])
+
+
+class OpenVisits:
+    """Open visit ids for the checkout endpoint, reopened after each run so every run starts with the same pool"""
+
+    def __init__(self, ids):
+        self._ids = collections.deque(ids)
+        self._used = collections.deque()
+        self.exhausted = False
+
+    def pop(self):
+        try:
+            visitor_id = self._ids.pop()
+        except IndexError:
+            self.exhausted = True
+            raise
+        self._used.append(visitor_id)
+        return visitor_id
+
+    def reopen(self, url):
+        used = list(self._used)
+        self._used.clear()
+        if used:
+            conn = psycopg2.connect(url)
+            conn.cursor().execute("UPDATE visitors SET check_out_time = NULL WHERE id = ANY(%s)", (used,))
+            conn.commit()
+            conn.close()
+        self._ids.extend(used)
+        self.exhausted = False
+
+
+def database_url(base_url, name):
+    """base_url with its database swapped for `name`"""
+    parts = urlsplit(base_url)
+    return urlunsplit(parts._replace(path='/' + name))
+
+
+def admin_connection(base_url):
+    conn = psycopg2.connect(base_url)
+    conn.autocommit = True
+    return conn
+
+
+def seed(url, count, days):
+    """Insert `count` visitors spread over the last `days` days, then refresh rollups and statistics"""
+    import rollups
+    conn = psycopg2.connect(url)
+    cursor = conn.cursor()
+    today = date.today()
+    month = partitions.month_start(today - timedelta(days=days + 1))
+    while month <= today:
+        cursor.execute(partitions.create_partition_sql(month))
+        month = partitions.month_start(month, 1)
+    conn.commit()
+
+    spacing = days * 86400.0 / max(count, 1)
+    started = time.perf_counter()
+    for first in range(1, count + 1, SEED_BATCH):
+        last = min(first + SEED_BATCH - 1, count)
+        cursor.execute(SEED_SQL, (spacing, first, last))
+        conn.commit()
+        print(f"  seeded {last:>10} visitors ({time.perf_counter() - started:.0f}s)", file=sys.stderr)
+    rollups.rebuild(cursor)
+    conn.commit()
+    conn.autocommit = True
+    cursor.execute("VACUUM ANALYZE visitors")
+
+    cursor.execute(f"""
+        SELECT id FROM visitors WHERE check_out_time IS NULL
+        ORDER BY check_in_time DESC LIMIT {CHECKOUT_POOL}
+    """)
+    open_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return open_ids
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(url, port, workers, threads, log):
+    """Start the API against `url`; returns the process once /api/health answers"""
+    env = dict(os.environ, DATABASE_URL=url, AUTO_CHECKOUT_ENABLED='false', QUERY_TIMING='false')
+    try:
+        import gunicorn  # noqa: F401
+        command = [sys.executable, '-m', 'gunicorn', '--worker-class', 'gthread', '-w', str(workers),
+                   '--threads', str(threads), '-b', f'127.0.0.1:{port}', '--timeout', '600', 'api_server:app']
+        server = f"gunicorn {workers}x{threads}"
+    except ImportError:
+        command = [sys.executable, '-c',
+                   f"import api_server; api_server.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+        server = "flask threaded"
+    proc = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API server exited with {proc.returncode}; see {log.name}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/api/health')
+            if connection.getresponse().status == 200:
+                return proc, server
+        except OSError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError(f"API server did not start; see {log.name}")
+
+
+def sign_in(port):
+    """Session token of the main admin (every measured endpoint but health and settings needs one)"""
+    _, email, password = migrations.MAIN_ADMIN
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    connection.request('POST', '/api/login', body=json.dumps({"email": email, "password": password}),
+                       headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    connection.close()
+    if response.status != 200:
+        raise RuntimeError(f"Could not sign in as {email}: {body.get('error')}")
+    return body["token"]
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def load(port, method, target, body, concurrency, duration, warmup, ids, token):
+    """Drive one endpoint from `concurrency` keep-alive connections; returns the summary"""
+    payload = json.dumps(body).encode() if body is not None else None
+    headers = {'Authorization': f"Bearer {token}"}
+    if payload is not None:
+        headers['Content-Type'] = 'application/json'
+    measure_from = time.monotonic() + warmup
+    stop_at = measure_from + duration
+    latencies = []
+    counts = collections.Counter()
+    lock = threading.Lock()
+
+    def worker():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+        own_latencies = []
+        own_counts = collections.Counter()
+        while True:
+            started = time.monotonic()
+            if started >= stop_at:
+                break
+            try:
+                path = target(ids) if callable(target) else target
+            except IndexError:
+                # Ran out of open visits to check out
+                break
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                size = len(response.read())
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+                size, ok = 0, False
+            finished = time.monotonic()
+            if started >= measure_from:
+                own_latencies.append(finished - started)
+                own_counts['ok' if ok else 'errors'] += 1
+                own_counts['bytes'] += size
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            counts.update(own_counts)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # In-flight requests finish after stop_at; count the time they actually took
+    elapsed = max(time.monotonic() - measure_from, 1e-9)
+
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "requests": counts['ok'] + counts['errors'],
+        "errors": counts['errors'],
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(counts['ok'] / elapsed, 1),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "mean_ms": ms(sum(latencies) / len(latencies) if latencies else None),
+        "bytes_per_request": round(counts['bytes'] / counts['ok']) if counts['ok'] else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_results(results):
+    print(f"{'size':>9} {'endpoint':<17} {'conc':>4} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for r in results:
+        note = '  (ran out of open visits)' if r.get('exhausted') else ''
+        print(f"{r['size']:>9} {r['endpoint']:<17} {r['concurrency']:>4} {r['throughput_rps']:>9} "
+              f"{r['p50_ms'] or '-':>9} {r['p95_ms'] or '-':>9} {r['p99_ms'] or '-':>9} {r['errors']:>7}{note}")
+
+
+def compare(results, baseline_path):
+    """Print p50/p95/throughput changes against an earlier results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {(r['size'], r['endpoint'], r['concurrency']): r for r in baseline['results']}
+
+    def change(new, old):
+        if not new or not old:
+            return '-'
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit')})")
+    print(f"{'size':>9} {'endpoint':<17} {'conc':>4} {'req/s':>9} {'p50':>9} {'p95':>9}")
+    for r in results:
+        old = before.get((r['size'], r['endpoint'], r['concurrency']))
+        if not old:
+            continue
+        print(f"{r['size']:>9} {r['endpoint']:<17} {r['concurrency']:>4} "
+              f"{change(r['throughput_rps'], old['throughput_rps']):>9} "
+              f"{change(r['p50_ms'], old['p50_ms']):>9} {change(r['p95_ms'], old['p95_ms']):>9}")
+
+
+def main():
+    all_scenarios = scenarios(0)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000], help="Visitors to seed (one database each)")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=10, help="Measured seconds per endpoint and concurrency")
+    parser.add_argument('--warmup', type=float, default=2, help="Unmeasured seconds before each measurement")
+    parser.add_argument('--endpoints', nargs='+', choices=list(all_scenarios), default=list(all_scenarios))
+    parser.add_argument('--days', type=int, default=365, help="Days of history the seeded visitors cover")
+    parser.add_argument('--report-days', type=int, default=7, help="Date range of the report requests")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers")
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument('--output', default='bench_endpoints.json')
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    parser.add_argument('--keep-db', action='store_true', help="Leave the seeded databases in place")
+    args = parser.parse_args()
+
+    base_url = os.getenv('DATABASE_URL')
+    if not base_url:
+        parser.error("DATABASE_URL must point at a Postgres server where a throwaway database can be created")
+
+    plan = scenarios(args.report_days)
+    results = []
+    meta = {
+        "commit": git_commit(),
+        "started_at": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "duration": args.duration,
+        "warmup": args.warmup,
+        "report_days": args.report_days,
+    }
+
+    for size in args.sizes:
+        name = f"vt_bench_{size}_{os.getpid()}"
+        url = database_url(base_url, name)
+        admin = admin_connection(base_url)
+        admin.cursor().execute(f"CREATE DATABASE {name}")
+        log = tempfile.NamedTemporaryFile('w', prefix='bench_server_', suffix='.log', delete=False)
+        proc = None
+        try:
+            # The server's start-up creates the schema; seed once it is up
+            port = free_port()
+            proc, meta["server"] = start_server(url, port, args.workers, args.threads, log)
+            print(f"Seeding {size} visitors into {name}", file=sys.stderr)
+            ids = OpenVisits(seed(url, size, args.days))
+            token = sign_in(port)
+            for endpoint in args.endpoints:
+                method, target, body = plan[endpoint]
+                for concurrency in args.concurrency:
+                    summary = load(port, method, target, body, concurrency, args.duration, args.warmup, ids, token)
+                    if endpoint == 'visitor_checkout':
+                        # True if the open visits ran out and the run ended early (shorten --duration)
+                        summary["exhausted"] = ids.exhausted
+                        ids.reopen(url)
+                    results.append(dict(size=size, endpoint=endpoint, concurrency=concurrency, **summary))
+                    print(f"  {endpoint:<17} c={concurrency:<3} {summary['throughput_rps']:>9} req/s "
+                          f"p95 {summary['p95_ms']} ms", file=sys.stderr)
+        finally:
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(30)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+            log.close()
+            if not args.keep_db:
+                admin.cursor().execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+            admin.close()
+
+    with open(args.output, 'w') as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print_results(results)
+    print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Excel report export, legacy pandas path vs write-only streaming engine
+Each case runs in a fresh subprocess so peak RSS is measured per case.
+
+    python benchmarks/bench_excel_export.py [--rows 10000 100000 1000000] [--engines legacy streaming]
+
+Rows are synthetic visitor tuples shaped like the cursor rows the report endpoint reads,
+so no database is needed. The legacy engine requires pandas to be installed.
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PURPOSES = ['Meeting', 'Delivery', 'Interview', 'Maintenance', 'Visit']
+
+
+def synthetic_rows(count):
+    """Yield visitor rows in the column order of SELECT * FROM visitors"""
+    start = datetime(2025, 1, 1, 8, 0, 0)
+    for i in range(count):
+        check_in = start + timedelta(minutes=7 * i)
+        check_out = check_in + timedelta(minutes=45) if i % 4 else None
+        yield (
+            i + 1, f"Visitor {i + 1}", f"visitor{i + 1}@example.com", f"98{i:08d}",
+            PURPOSES[i % len(PURPOSES)], check_in, check_out, "Host Name", "Test Corp",
+            check_in, check_out or check_in
+        )
+
+
+def run_legacy(count, output):
+    """The previous implementation: list of dicts -> DataFrame -> pd.ExcelWriter"""
+    import pandas as pd
+    from report_export import REPORT_COLUMNS
+
+    visitors = list(synthetic_rows(count))  # previously cursor.fetchall()
+    data = []
+    for v in visitors:
+        data.append({column: (v[i] if v[i] is not None else "") for i, column in enumerate(REPORT_COLUMNS)})
+    df = pd.DataFrame(data)
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Visitors')
+
+
+def run_streaming(count, output):
+    """The write-only engine used by /api/visitors/report?format=excel"""
+    from report_export import stream_xlsx
+    for chunk in stream_xlsx(synthetic_rows(count)):
+        output.write(chunk)
+
+
+ENGINES = {'legacy': run_legacy, 'streaming': run_streaming}
+
+
+class CountingSink:
+    """Stands in for the client socket: counts streamed bytes without keeping them"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def tell(self):
+        return self.size
+
+
+def run_case(engine, count):
+    """Run one case in this process and print its result as JSON"""
+    # The legacy path built the whole file in a BytesIO; the streaming path sends chunks as they are made
+    output = io.BytesIO() if engine == 'legacy' else CountingSink()
+    started = time.perf_counter()
+    ENGINES[engine](count, output)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "engine": engine,
+        "rows": count,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(count / elapsed) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "bytes": output.tell()
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=['legacy', 'streaming'])
+    parser.add_argument('--run', nargs=2, metavar=('ENGINE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_case(args.run[0], int(args.run[1]))
+        return
+
+    print(f"{'engine':<10} {'rows':>9} {'seconds':>9} {'rows/sec':>10} {'peak RSS MB':>12} {'size MB':>8}")
+    for count in args.rows:
+        for engine in args.engines:
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', engine, str(count)],
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'
+                print(f"{engine:<10} {count:>9} ERROR: {error}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{engine:<10} {count:>9} {result['seconds']:>9.2f} {result['rows_per_sec']:>10} "
+                  f"{result['peak_rss_mb']:>12.1f} {result['bytes'] / 1048576:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark: PDF report export, legacy single-Table reportlab path vs the report engine
+Each case runs in a fresh subprocess so peak RSS is measured per case.
+
+    python benchmarks/bench_pdf_export.py [--rows 10000 100000] [--engines legacy report]
+
+Rows are synthetic visitor tuples shaped like the cursor rows the report endpoint reads,
+newest first like the report query, so no database is needed.
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PURPOSES = ['Meeting', 'Delivery', 'Interview', 'Maintenance', 'Visit']
+
+
+def synthetic_rows(count):
+    """Yield visitor rows in the column order of SELECT * FROM visitors, newest check-in first"""
+    start = datetime(2025, 1, 1, 8, 0, 0)
+    for i in range(count, 0, -1):
+        check_in = start + timedelta(minutes=7 * i)
+        check_out = check_in + timedelta(minutes=45) if i % 4 else None
+        yield (
+            i, f"Visitor {i}", f"visitor{i}@example.com", f"98{i:08d}",
+            PURPOSES[i % len(PURPOSES)], check_in, check_out, "Host Name", "Test Corp",
+            check_in, check_out or check_in
+        )
+
+
+def run_legacy(count, output):
+    """The previous implementation: every row in one reportlab Table, one doc.build(); returns pages"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet
+    from report_export import REPORT_COLUMNS
+
+    visitors = list(synthetic_rows(count))  # previously cursor.fetchall()
+    doc = SimpleDocTemplate(output, pagesize=landscape(letter))
+    styles = getSampleStyleSheet()
+    elements = [Paragraph("Visitor Report", styles['Title']), Spacer(1, 12)]
+    table_data = [REPORT_COLUMNS[:9]]
+    for v in visitors:
+        table_data.append([
+            str(v[0]), v[1][:20], (v[2] or "")[:20], v[3] or "", v[4],
+            v[5].strftime('%Y-%m-%d %H:%M'), v[6].strftime('%Y-%m-%d %H:%M') if v[6] else "",
+            (v[7] or "")[:15], (v[8] or "")[:15]
+        ])
+    t = Table(table_data)
+    t.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ]))
+    elements.append(t)
+    doc.build(elements)
+    return doc.page
+
+
+def run_report(count, output):
+    """The engine used by /api/visitors/report?format=pdf (pages streamed as they fill); returns pages"""
+    from report_export import stream_pdf
+    pages = None
+    for chunk in stream_pdf(synthetic_rows(count)):
+        output.write(chunk)
+        match = re.search(rb'/Count (\d+) /Kids', chunk)
+        pages = int(match.group(1)) if match else pages
+    return pages
+
+
+ENGINES = {'legacy': run_legacy, 'report': run_report}
+
+
+class CountingSink:
+    """Stands in for the client socket: counts streamed bytes without keeping them"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def tell(self):
+        return self.size
+
+
+def run_case(engine, count):
+    """Run one case in this process and print its result as JSON"""
+    output = io.BytesIO() if engine == 'legacy' else CountingSink()
+    started = time.perf_counter()
+    pages = ENGINES[engine](count, output)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        "engine": engine,
+        "rows": count,
+        "pages": pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "bytes": output.tell()
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=['legacy', 'report'])
+    parser.add_argument('--timeout', type=float, default=1200, help="Seconds before a case is abandoned")
+    parser.add_argument('--run', nargs=2, metavar=('ENGINE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_case(args.run[0], int(args.run[1]))
+        return
+
+    print(f"{'engine':<10} {'rows':>9} {'pages':>7} {'seconds':>9} {'pages/sec':>10} {'peak RSS MB':>12} {'size MB':>8}")
+    for count in args.rows:
+        for engine in args.engines:
+            try:
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--run', engine, str(count)],
+                    capture_output=True, text=True, timeout=args.timeout
+                )
+            except subprocess.TimeoutExpired:
+                print(f"{engine:<10} {count:>9} TIMEOUT after {args.timeout:g}s")
+                continue
+            if proc.returncode != 0:
+                error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'
+                print(f"{engine:<10} {count:>9} ERROR: {error}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{engine:<10} {count:>9} {result['pages']:>7} {result['seconds']:>9.2f} {result['pages_per_sec']:>10} "
+                  f"{result['peak_rss_mb']:>12.1f} {result['bytes'] / 1048576:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: visitor list serialisation, legacy dict + jsonify path vs serializers.py
+Each engine runs in a fresh subprocess, because the JSON backend is chosen at import.
+
+    python benchmarks/bench_serializers.py [--rows 100000] [--repeat 5] [--engines legacy stdlib orjson]
+
+Rows are synthetic visitor tuples in VISITOR_COLUMNS order, so no database is needed.
+The orjson engine requires orjson to be installed.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PURPOSES = ['Meeting', 'Delivery', 'Interview', 'Maintenance', 'Visit']
+
+
+def synthetic_rows(count):
+    """Visitor rows as the cursor returns them (VISITOR_COLUMNS order)"""
+    start = datetime(2025, 1, 1, 8, 0, 0, 123456)
+    rows = []
+    for i in range(count):
+        check_in = start + timedelta(minutes=7 * i)
+        check_out = check_in + timedelta(minutes=45) if i % 4 else None
+        rows.append((
+            i + 1, f"Visitor {i + 1}", f"visitor{i + 1}@example.com", f"98{i:08d}",
+            PURPOSES[i % len(PURPOSES)], check_in, check_out, "Host Name", "Test Corp",
+            check_in, check_out or check_in
+        ))
+    return rows
+
+
+def run_legacy(rows):
+    """The previous path: visitor_to_dict per row, then Flask's jsonify encoder"""
+    from flask import Flask
+    encoder = Flask(__name__).json
+
+    def visitor_to_dict(visitor):
+        return {
+            "id": visitor[0],
+            "name": visitor[1],
+            "email": visitor[2],
+            "phone": visitor[3],
+            "purpose": visitor[4],
+            "check_in_time": f"{visitor[5]}Z" if visitor[5] else None,
+            "check_out_time": f"{visitor[6]}Z" if visitor[6] else None,
+            "host_name": visitor[7],
+            "company": visitor[8],
+            "created_at": f"{visitor[9]}Z" if visitor[9] else None,
+            "updated_at": f"{visitor[10]}Z" if visitor[10] else None
+        }
+
+    def encode():
+        return encoder.dumps({"visitors": [visitor_to_dict(v) for v in rows], "next_cursor": None}).encode('utf-8')
+    return encode
+
+
+def run_serializers(rows):
+    """serializers.py with whichever backend JSON_BACKEND selected"""
+    import serializers
+
+    def encode():
+        return serializers.envelope(visitors=serializers.visitors.dumps_rows(rows), next_cursor=None)
+    return encode
+
+
+ENGINES = {
+    'legacy': (run_legacy, 'auto'),
+    'stdlib': (run_serializers, 'stdlib'),
+    'orjson': (run_serializers, 'auto'),
+}
+
+
+def run_case(engine, count, repeat):
+    """Run one engine in this process and print its best time as JSON"""
+    if engine == 'orjson':
+        import orjson  # noqa: F401  (fail clearly if it is not installed)
+    rows = synthetic_rows(count)
+    encode = ENGINES[engine][0](rows)
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(encode())
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    print(json.dumps({
+        "engine": engine,
+        "rows": count,
+        "seconds": round(best, 4),
+        "rows_per_sec": round(count / best),
+        "bytes": size
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=['legacy', 'stdlib', 'orjson'])
+    parser.add_argument('--run', nargs=2, metavar=('ENGINE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_case(args.run[0], int(args.run[1]), args.repeat)
+        return
+
+    print(f"{'engine':<8} {'rows':>9} {'best s':>8} {'rows/sec':>11} {'vs legacy':>10} {'size MB':>8}")
+    for count in args.rows:
+        baseline = None
+        for engine in args.engines:
+            env = dict(os.environ, JSON_BACKEND=ENGINES[engine][1])
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', engine, str(count), '--repeat', str(args.repeat)],
+                capture_output=True, text=True, env=env
+            )
+            if proc.returncode != 0:
+                error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'
+                print(f"{engine:<8} {count:>9} ERROR: {error}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            if engine == 'legacy':
+                baseline = result['seconds']
+            speedup = f"{baseline / result['seconds']:.1f}x" if baseline else '-'
+            print(f"{engine:<8} {count:>9} {result['seconds']:>8.3f} {result['rows_per_sec']:>11} "
+                  f"{speedup:>10} {result['bytes'] / 1048576:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: worker cold start (api_server import time and time to first response)
+Each run uses a fresh interpreter, like a newly forked gunicorn worker importing the app.
+
+    python benchmarks/bench_startup.py [--runs 5] [--path /api/health] [--max-import-ms 800]
+
+With --max-import-ms the script exits non-zero when the median import time exceeds the
+budget, so it can gate CI against import-time regressions.
+"""
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+
+def lazy_modules():
+    """api_server.LAZY_MODULES, read from the source so the app is not imported here"""
+    with open(os.path.join(BACKEND_DIR, 'api_server.py')) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'LAZY_MODULES' for t in node.targets):
+            return list(ast.literal_eval(node.value))
+    raise RuntimeError('LAZY_MODULES not found in api_server.py')
+
+
+# Modules that should only be loaded by the endpoints that need them
+HEAVY_MODULES = lazy_modules()
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import api_server
+imported = time.perf_counter()
+response = api_server.app.test_client().get({path!r})
+responded = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "first_response_ms": (responded - started) * 1000,
+    "status": response.status_code,
+    "loaded": [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+
+def run_once(path):
+    """Import the app and serve one request in a fresh interpreter"""
+    proc = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(path=path, heavy=HEAVY_MODULES)],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip() or 'probe failed')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/api/health', help="Endpoint used for time-to-first-response")
+    parser.add_argument('--max-import-ms', type=float, help="Fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    results = [run_once(args.path) for _ in range(args.runs)]
+    import_ms = statistics.median(r['import_ms'] for r in results)
+    first_response_ms = statistics.median(r['first_response_ms'] for r in results)
+
+    print(f"runs:                       {args.runs}")
+    print(f"median import time:         {import_ms:.1f} ms")
+    print(f"median time to {args.path}: {first_response_ms:.1f} ms (status {results[-1]['status']})")
+    print(f"heavy modules loaded:       {', '.join(results[-1]['loaded']) or 'none'}")
+
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"FAIL: import time {import_ms:.1f} ms exceeds budget of {args.max_import_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
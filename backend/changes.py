@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Change feed backing GET /api/visitors/changes
+Triggers stamp every inserted or updated visitor with the id of the writing transaction
+(xid8) and turn deletes into tombstones. Clients sync from an opaque token:
+
+    GET /api/visitors/changes                 full copy, page by page
+    GET /api/visitors/changes?since=<token>   only what changed since the token
+
+Tokens are based on the reader's snapshot xmin rather than on a plain sequence. A
+sequence number is taken at write time but becomes visible at commit time, so a reader
+could skip a slow transaction's rows. Every transaction below xmin has already finished.
+A transaction that was still running is at or above xmin, so the next sync picks it up.
+The cost is that a few rows around the boundary may be sent twice. Clients apply
+changes by id, so repeats are harmless.
+
+Tombstones older than the retention window are pruned with:
+
+    python changes.py --prune [--days 30]
+
+Clients holding a token from before the prune horizon get 410 and must do a full sync.
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+
+import queries
+
+TOMBSTONE_RETENTION_DAYS = int(os.getenv('TOMBSTONE_RETENTION_DAYS', 30))
+
+SETUP_SQL = [
+    # Rows that predate the change feed get xid 0 and are only sent by a full sync
+    "ALTER TABLE visitors ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT '0'",
+    "CREATE INDEX IF NOT EXISTS idx_visitors_change ON visitors (change_xid, id)",
+    """
+    CREATE TABLE IF NOT EXISTS visitor_tombstones (
+        id INTEGER PRIMARY KEY,
+        change_xid xid8 NOT NULL,
+        deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Lets a report's data version cover only its date range (table_versions.py)
+    "ALTER TABLE visitor_tombstones ADD COLUMN IF NOT EXISTS check_in_time TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS idx_visitor_tombstones_change ON visitor_tombstones (change_xid, id)",
+    """
+    CREATE TABLE IF NOT EXISTS visitor_sync_state (
+        id INTEGER PRIMARY KEY,
+        pruned_xid xid8 NOT NULL DEFAULT '0'
+    )
+    """,
+    "INSERT INTO visitor_sync_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING",
+    """
+    CREATE OR REPLACE FUNCTION visitors_stamp_change() RETURNS trigger AS $$
+    BEGIN
+        NEW.change_xid := pg_current_xact_id();
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION visitors_record_tombstone() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO visitor_tombstones (id, change_xid, check_in_time) VALUES (OLD.id, pg_current_xact_id(), OLD.check_in_time)
+        ON CONFLICT (id) DO UPDATE
+        SET change_xid = EXCLUDED.change_xid, check_in_time = EXCLUDED.check_in_time, deleted_at = CURRENT_TIMESTAMP;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    # TRUNCATE leaves no tombstones: move the horizon past it, so every client resyncs
+    """
+    CREATE OR REPLACE FUNCTION visitors_truncated() RETURNS trigger AS $$
+    BEGIN
+        UPDATE visitor_sync_state SET pruned_xid = GREATEST(pruned_xid, pg_current_xact_id()) WHERE id = 1;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS visitors_stamp_change ON visitors",
+    """
+    CREATE TRIGGER visitors_stamp_change BEFORE INSERT OR UPDATE ON visitors
+    FOR EACH ROW EXECUTE FUNCTION visitors_stamp_change()
+    """,
+    "DROP TRIGGER IF EXISTS visitors_record_tombstone ON visitors",
+    """
+    CREATE TRIGGER visitors_record_tombstone AFTER DELETE ON visitors
+    FOR EACH ROW EXECUTE FUNCTION visitors_record_tombstone()
+    """,
+    "DROP TRIGGER IF EXISTS visitors_truncated ON visitors",
+    """
+    CREATE TRIGGER visitors_truncated AFTER TRUNCATE ON visitors
+    FOR EACH STATEMENT EXECUTE FUNCTION visitors_truncated()
+    """,
+]
+
+SNAPSHOT_XMIN = queries.statement("changes_snapshot_xmin", """
+    SELECT pg_snapshot_xmin(pg_current_snapshot())::text, (SELECT pruned_xid::text FROM visitor_sync_state WHERE id = 1)
+""")
+
+_ROWS_SQL = f"""
+    (SELECT change_xid, {queries.VISITOR_COLUMNS}, FALSE AS deleted
+     FROM visitors
+     WHERE (change_xid, id) > (?::xid8, ?)
+     ORDER BY change_xid, id
+     LIMIT ?)
+"""
+_TOMBSTONES_SQL = """
+    (SELECT change_xid, id, NULL::text, NULL::text, NULL::text, NULL::text, NULL::timestamp, NULL::timestamp,
+            NULL::text, NULL::text, NULL::timestamp, NULL::timestamp, TRUE AS deleted
+     FROM visitor_tombstones
+     WHERE (change_xid, id) > (?::xid8, ?)
+     ORDER BY change_xid, id
+     LIMIT ?)
+"""
+CHANGES = queries.statement("changes_page", f"""
+    SELECT c.change_xid::text, c.* FROM ({_ROWS_SQL} UNION ALL {_TOMBSTONES_SQL}) AS c
+    ORDER BY c.change_xid, c.id
+    LIMIT ?
+""")
+# A full sync has nothing to delete on the client, so it skips tombstones
+CHANGES_FULL = queries.statement("changes_page_full", f"""
+    SELECT c.change_xid::text, c.* FROM {_ROWS_SQL} AS c
+    ORDER BY c.change_xid, c.id
+""")
+
+PRUNE = queries.statement("changes_prune_tombstones", """
+    WITH pruned AS (
+        DELETE FROM visitor_tombstones
+        WHERE deleted_at < CURRENT_TIMESTAMP - make_interval(days => ?)
+        RETURNING change_xid
+    )
+    UPDATE visitor_sync_state
+    SET pruned_xid = GREATEST(pruned_xid, COALESCE((SELECT MAX(change_xid) FROM pruned), '0'))
+    WHERE id = 1
+    RETURNING (SELECT COUNT(*) FROM pruned)
+""")
+
+
+class TokenExpired(Exception):
+    """The token predates pruned tombstones; the client must do a full sync"""
+
+
+def encode_token(after_xid, after_id, resume_xid, full):
+    raw = json.dumps([after_xid, after_id, resume_xid, full], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Parse a sync token, raising ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        after_xid, after_id, resume_xid, full = json.loads(raw)
+        int(after_xid)
+        if resume_xid is not None:
+            int(resume_xid)
+        return str(after_xid), int(after_id), resume_xid, bool(full)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid since token")
+
+
+def fetch_changes(cursor, token=None, limit=500):
+    """One page of changes: (visitor row tuples, deleted ids, next token, has_more)"""
+    if token:
+        after_xid, after_id, resume_xid, full = decode_token(token)
+    else:
+        after_xid, after_id, resume_xid, full = '0', 0, None, True
+
+    # Taken before reading any rows: everything below it had finished by then
+    queries.run(cursor, SNAPSHOT_XMIN)
+    xmin, pruned_xid = cursor.fetchone()
+    pruned_xid = int(pruned_xid or 0)
+    if not full and pruned_xid and int(after_xid) <= pruned_xid:
+        raise TokenExpired("Deleted visitors since this token have been pruned; sync again without since")
+    resume_xid = xmin if resume_xid is None else str(min(int(resume_xid), int(xmin)))
+
+    if full:
+        queries.run(cursor, CHANGES_FULL, (after_xid, after_id, limit + 1))
+    else:
+        queries.run(cursor, CHANGES, (after_xid, after_id, limit + 1, after_xid, after_id, limit + 1, limit + 1))
+    rows = cursor.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    visitors = []
+    deleted = []
+    for row in rows:
+        # row: change_xid text, change_xid, visitor columns..., deleted
+        if row[-1]:
+            deleted.append(row[2])
+        else:
+            visitors.append(row[2:-1])
+
+    if has_more:
+        next_token = encode_token(rows[-1][0], rows[-1][2], resume_xid, full)
+    else:
+        # Caught up: next time start from the oldest xmin seen during this sync
+        next_token = encode_token(resume_xid, 0, None, False)
+    return visitors, deleted, next_token, has_more
+
+
+def prune_tombstones(cursor, days=TOMBSTONE_RETENTION_DAYS):
+    """Delete tombstones older than `days` and advance the prune horizon; returns rows pruned"""
+    queries.run(cursor, PRUNE, (days,))
+    return cursor.fetchone()[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain the visitor change feed")
+    parser.add_argument('--prune', action='store_true', help="Delete tombstones past the retention window")
+    parser.add_argument('--days', type=int, default=TOMBSTONE_RETENTION_DAYS, help="Retention in days")
+    args = parser.parse_args()
+
+    if not args.prune:
+        parser.print_help()
+        sys.exit(1)
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        pruned = prune_tombstones(cursor, args.days)
+        conn.commit()
+        print(f"✓ Pruned {pruned} tombstones older than {args.days} days")
+    except Exception as e:
+        conn.rollback()
+        print(f"✗ Error pruning tombstones: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
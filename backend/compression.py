@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Negotiated response compression (gzip, or brotli when the optional `brotli` package is installed)
+"""
+
+import gzip
+import os
+
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL_GZIP = int(os.getenv('COMPRESS_LEVEL_GZIP', 5))
+COMPRESS_LEVEL_BROTLI = int(os.getenv('COMPRESS_LEVEL_BROTLI', 4))
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv', 'text/plain')
+
+_brotli = None
+
+
+def _get_brotli():
+    """The brotli module, or False if it isn't installed (imported on first use)"""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli
+
+
+def negotiate(accept_encodings):
+    """Pick 'br' or 'gzip' from a werkzeug Accept-Encoding header (None for identity)"""
+    if accept_encodings['br'] and _get_brotli():
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return _get_brotli().compress(data, quality=COMPRESS_LEVEL_BROTLI)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL_GZIP)
+
+
+def compress_response(response, accept_encodings):
+    """Compress a buffered response in place when it is worth it"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    # The body varies with Accept-Encoding even when we send it uncompressed
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # A strong ETag names exact bytes; after re-encoding only a weak one still holds
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
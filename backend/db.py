@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+PostgreSQL connections for the API and its command-line tools
+Importing this module only reads .env. Unlike importing api_server, it does not
+migrate the schema or start anything, so CLIs (auto_checkout.py, rollups.py, ...)
+connect through here.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+import queries
+
+load_dotenv()
+
+
+def get_db_connection():
+    """Get database connection (Strict PostgreSQL Only)"""
+    # Resolve URL at runtime to ensure latest Env Vars are picked up
+    db_url = os.getenv('DATABASE_URL') or os.getenv('Database_URL')
+
+    if not db_url:
+        # Halt execution if NO DB URL is present
+        raise RuntimeError("CRITICAL ERROR: DATABASE_URL environment variable is not set. Application cannot start without a PostgreSQL database (SQLite fallback disabled to prevent data loss).")
+
+    if not psycopg2:
+        # Halt execution if driver is missing
+        raise RuntimeError("CRITICAL ERROR: psycopg2 driver not installed. Cannot connect to PostgreSQL.")
+
+    try:
+        # PreparingConnection tracks which named statements this connection has PREPAREd
+        conn = psycopg2.connect(db_url, connection_factory=queries.PreparingConnection)
+        return conn
+    except Exception as e:
+        print(f"CRITICAL ERROR: Failed to connect to PostgreSQL: {e}")
+        raise RuntimeError(f"Database connection failed: {e}")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+PostgreSQL connection pool for the Visitor Tracker API
+Keeps a bounded set of psycopg2 connections per worker process
+"""
+
+import os
+import threading
+import time
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no connection becomes available within the acquire timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe, fork-aware pool of psycopg2 connections"""
+
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=5.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: need 0 <= minconn <= maxconn and maxconn >= 1")
+
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._idle = []
+        self._in_use = set()
+        # Connections inherited across fork(). They are never used or closed in the
+        # child (closing would terminate the parent's session), only kept referenced.
+        self._orphans = []
+
+        # Stats
+        self._acquired_total = 0
+        self._timeouts_total = 0
+        self._discarded_total = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        self._fill()
+
+    def _fill(self):
+        """Open connections until minconn are available"""
+        while len(self._idle) + len(self._in_use) < self.minconn:
+            self._idle.append(self._connect())
+
+    def _check_pid(self):
+        """Reset pool state after a fork (e.g. gunicorn --preload)"""
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+        self._orphans.extend(self._idle)
+        self._orphans.extend(self._in_use)
+        self._idle = []
+        self._in_use = set()
+        self._pid = pid
+        self._cond = threading.Condition()
+
+    def getconn(self, timeout=None):
+        """Borrow a connection, waiting up to `timeout` seconds for one to be free"""
+        timeout = self.timeout if timeout is None else timeout
+        self._check_pid()
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    if conn.closed:
+                        self._discarded_total += 1
+                        continue
+                    break
+                if len(self._in_use) < self.maxconn:
+                    # Reserve the slot before connecting outside the lock
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts_total += 1
+                    raise PoolTimeout(
+                        f"Timed out after {timeout:.1f}s waiting for a database connection "
+                        f"(pool max {self.maxconn})"
+                    )
+                self._cond.wait(remaining)
+
+            placeholder = object()
+            self._in_use.add(conn if conn is not None else placeholder)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            finally:
+                with self._cond:
+                    self._in_use.discard(placeholder)
+                    if conn is not None:
+                        self._in_use.add(conn)
+                    else:
+                        self._cond.notify()
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._acquired_total += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if os.getpid() != self._pid:
+            # Borrowed before a fork; the parent owns it
+            return
+
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != 0:  # TRANSACTION_STATUS_IDLE
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except Exception:
+                close = True
+
+        with self._cond:
+            self._in_use.discard(conn)
+            if close or conn.closed or len(self._idle) >= self.maxconn:
+                self._discarded_total += 1
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        """Close every idle connection (in-use connections close when returned)"""
+        with self._cond:
+            for conn in self._idle:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._idle = []
+
+    def stats(self):
+        """Snapshot of pool usage for sizing"""
+        with self._cond:
+            acquired = self._acquired_total
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "acquired_total": acquired,
+                "timeouts_total": self._timeouts_total,
+                "discarded_total": self._discarded_total,
+                "wait_avg_ms": round(self._wait_total / acquired * 1000, 3) if acquired else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
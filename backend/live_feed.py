@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Live visitor events for GET /api/visitors/stream
+The visitor write endpoints publish events with pg_notify inside their transaction, so they
+are only delivered once committed. Each worker process keeps one LISTEN connection and fans
+events out to its SSE subscribers through small bounded queues.
+"""
+
+import json
+import os
+import queue
+import select
+import threading
+import time
+
+import queries
+import serializers
+
+CHANNEL = 'visitor_events'
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+PUBLISH = queries.statement("live_feed_publish", f"""
+    SELECT pg_notify('{CHANNEL}', payload) FROM unnest(?::text[]) AS payload
+""")
+
+
+def _encode(event):
+    payload = serializers.dumps(event)
+    if len(payload) > MAX_PAYLOAD_BYTES:
+        # Too big to send whole (long free-text fields); clients fetch the visitor by id instead
+        payload = serializers.dumps({"type": event["type"], "id": event["id"], "partial": True})
+    return payload.decode('utf-8')
+
+
+def publish(cursor, events):
+    """Queue events (dicts with "type" and "id") for delivery when the current transaction commits"""
+    payloads = [_encode(event) for event in events]
+    if payloads:
+        queries.run(cursor, PUBLISH, (payloads,))
+
+
+class Subscription:
+    """One subscriber's queue of (event type, JSON payload) pairs"""
+
+    def __init__(self, queue_size):
+        self._queue = queue.Queue(maxsize=queue_size)
+        # Set when the subscriber fell too far behind and was cut off; it must resync
+        self.overflowed = False
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within the timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LiveFeed:
+    """Process-wide LISTEN connection fanning notifications out to subscribers"""
+
+    def __init__(self, connect, channel=CHANNEL, queue_size=100, max_subscribers=100,
+                 reconnect_delay=1.0, ready_timeout=5.0):
+        self._connect = connect
+        self.channel = channel
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.reconnect_delay = reconnect_delay
+        self.ready_timeout = ready_timeout
+
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._ready = threading.Event()
+        self._pid = None
+        self._counts = {"delivered": 0, "overflowed": 0, "rejected": 0, "reconnects": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._counts[key] += amount
+
+    def _ensure_started(self):
+        """Start the listener thread lazily, once per process (threads do not survive fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._subscribers = set()
+            self._ready = threading.Event()
+            threading.Thread(target=self._run, name="live-feed-listener", daemon=True).start()
+
+    def subscribe(self):
+        """Register a subscriber; returns None when this process is at max_subscribers"""
+        self._ensure_started()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self._counts["rejected"] += 1
+                return None
+            subscription = Subscription(self.queue_size)
+            self._subscribers.add(subscription)
+        # Events committed before LISTEN is active would be missed, so wait for it
+        self._ready.wait(self.ready_timeout)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _broadcast(self, event_type, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription._queue.put_nowait((event_type, payload))
+                self._count("delivered")
+            except queue.Full:
+                # A slow client must not hold events (or the listener) back: cut it off
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+                self._count("overflowed")
+
+    def _run(self):
+        first = True
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.channel}")
+                if not first:
+                    # Anything published while we were disconnected is lost
+                    self._count("reconnects")
+                    self._broadcast("resync", "{}")
+                first = False
+                self._ready.set()
+                while True:
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            event_type = json.loads(notify.payload).get("type", "message")
+                        except ValueError:
+                            event_type = "message"
+                        self._broadcast(event_type, notify.payload)
+            except Exception as e:
+                print(f"WARNING: Live feed listener error, reconnecting: {e}")
+                self._ready.clear()
+                time.sleep(self.reconnect_delay)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def stats(self):
+        """Subscriber count and delivery counters for this process"""
+        with self._lock:
+            counts = dict(self._counts)
+            counts["subscribers"] = len(self._subscribers)
+        counts["listening"] = self._ready.is_set()
+        counts["max_subscribers"] = self.max_subscribers
+        return counts
+
+
+def format_sse(event_type, data):
+    """One Server-Sent Events message"""
+    return f"event: {event_type}\ndata: {data}\n\n"
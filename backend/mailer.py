@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Background email dispatch for the Visitor Tracker API
+A bounded queue feeds a small pool of worker threads; each worker keeps one
+authenticated SMTP session open and reuses it across messages
+"""
+
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+
+OVERFLOW_POLICIES = ('drop_new', 'drop_oldest')
+
+
+def smtp_session_factory(server, port, username=None, password=None, starttls=True, timeout=10):
+    """Return a callable that opens a ready-to-send SMTP session"""
+    def connect():
+        session = smtplib.SMTP(server, port, timeout=timeout)
+        try:
+            if starttls:
+                session.starttls()
+            if username and password:
+                session.login(username, password)
+        except Exception:
+            session.close()
+            raise
+        return session
+    return connect
+
+
+def _is_permanent(error):
+    """5xx replies will fail the same way on retry"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500 and not isinstance(error, smtplib.SMTPServerDisconnected)
+    return False
+
+
+class EmailDispatcher:
+    """Thread pool sending queued messages over reused SMTP sessions, with retry and backoff"""
+
+    def __init__(self, connect, sender, workers=2, queue_size=100, overflow='drop_new',
+                 max_retries=3, backoff=1.0, idle_timeout=60.0, on_failure=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+
+        self._connect = connect
+        self.sender = sender
+        self.workers = workers
+        self.overflow = overflow
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        # Called as on_failure(to_addr, message, reason) when a message is dropped or gives up
+        self._on_failure = on_failure
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._stopping = False
+        self._counts = {"queued": 0, "sent": 0, "failed": 0, "dropped": 0, "retries": 0, "connects": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._counts[key] += amount
+
+    def _ensure_started(self):
+        """Start worker threads lazily, once per process (threads do not survive fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"mail-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, to_addr, message):
+        """Queue a message for delivery; returns False if it was dropped by the overflow policy"""
+        self._ensure_started()
+        item = (to_addr, message)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow == 'drop_oldest':
+                try:
+                    dropped = self._queue.get_nowait()
+                    self._queue.task_done()
+                    self._count("dropped")
+                    self._fail(dropped[0], dropped[1], "queue full (dropped oldest)")
+                except queue.Empty:
+                    pass
+                try:
+                    self._queue.put_nowait(item)
+                except queue.Full:
+                    self._count("dropped")
+                    self._fail(to_addr, message, "queue full")
+                    return False
+            else:
+                self._count("dropped")
+                self._fail(to_addr, message, "queue full")
+                return False
+        self._count("queued")
+        return True
+
+    def _fail(self, to_addr, message, reason):
+        print(f"WARNING: Email to {to_addr} not delivered: {reason}")
+        if self._on_failure:
+            try:
+                self._on_failure(to_addr, message, reason)
+            except Exception as e:
+                print(f"WARNING: Email failure handler raised: {e}")
+
+    def _run(self):
+        session = None
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # Servers drop idle sessions anyway; close ours cleanly
+                session = self._close(session)
+                continue
+            if item is None:
+                self._queue.task_done()
+                self._close(session)
+                return
+            try:
+                session = self._deliver(session, *item)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, session, to_addr, message):
+        """Send one message, reconnecting and backing off on transient errors"""
+        attempt = 0
+        while True:
+            try:
+                if session is None:
+                    session = self._connect()
+                    self._count("connects")
+                session.sendmail(self.sender, [to_addr], message.as_string())
+                self._count("sent")
+                return session
+            except Exception as e:
+                permanent = _is_permanent(e)
+                if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    # Session state is unknown after an error; start fresh next time
+                    session = self._close(session)
+                if permanent or attempt >= self.max_retries or self._stopping:
+                    self._count("failed")
+                    self._fail(to_addr, message, str(e))
+                    return session
+                attempt += 1
+                self._count("retries")
+                delay = self.backoff * (2 ** (attempt - 1))
+                time.sleep(delay + random.uniform(0, delay / 2))
+
+    def _close(self, session):
+        if session is not None:
+            try:
+                session.quit()
+            except Exception:
+                try:
+                    session.close()
+                except Exception:
+                    pass
+        return None
+
+    def shutdown(self, timeout=5.0):
+        """Stop the workers after the queued messages are sent (or the timeout passes)"""
+        if self._pid != os.getpid():
+            return
+        # Queued messages still get one attempt, but nothing is retried any more
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+
+    def stats(self):
+        """Delivery counters and current queue depth"""
+        with self._lock:
+            counts = dict(self._counts)
+        counts["queue_depth"] = self._queue.qsize()
+        counts["queue_size"] = self._queue.maxsize
+        counts["workers"] = self.workers
+        counts["overflow"] = self.overflow
+        return counts
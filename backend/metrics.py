@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics for GET /api/metrics
+Counters and histograms are kept in memory by each worker process. Requests are
+measured by app-wide request hooks and statements by queries.run/execute, so handlers
+need no instrumentation. Recording is a dict lookup and an addition under a lock.
+
+gunicorn runs several workers, and a scrape reaches only one of them. With METRICS_DIR
+set, every worker writes its totals there every METRICS_FLUSH_INTERVAL seconds, and a
+scrape adds up the files of all workers. Empty the directory when the service starts.
+Without METRICS_DIR a scrape sees only the worker that answered it, which is fine for a
+single worker.
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+ACQUIRE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+REPORT_SECONDS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+REPORT_BYTES_BUCKETS = (1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+SWEEP_SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+REGISTRY = []
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, series):
+        for key, value in sorted(series.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (the last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return [list(value[0]), value[1]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def render(self, series):
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), key + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {cumulative}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+REQUESTS = Counter('http_requests_total', "HTTP requests by route and status", ('method', 'route', 'status'))
+REQUEST_ERRORS = Counter('http_request_errors_total', "HTTP requests answered with a 5xx status", ('method', 'route'))
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', "Time to produce a response (streamed bodies not included)",
+                            ('method', 'route'), LATENCY_BUCKETS)
+QUERY_SECONDS = Histogram('db_query_duration_seconds', "Database statement execution time", ('statement',), QUERY_BUCKETS)
+POOL_ACQUIRE_SECONDS = Histogram('db_pool_acquire_seconds', "Wait for a pooled database connection", (), ACQUIRE_BUCKETS)
+POOL_TIMEOUTS = Counter('db_pool_timeouts_total', "Requests that gave up waiting for a pooled connection")
+REPORT_SECONDS = Histogram('report_generation_seconds', "Report generation time (mode: stream or job)",
+                           ('format', 'mode'), REPORT_SECONDS_BUCKETS)
+REPORT_BYTES = Histogram('report_size_bytes', "Size of generated reports (mode: stream or job)",
+                         ('format', 'mode'), REPORT_BYTES_BUCKETS)
+SWEEP_ROWS = Counter('auto_checkout_rows_swept_total', "Visits closed by the auto checkout sweep")
+SWEEP_SECONDS = Histogram('auto_checkout_sweep_duration_seconds', "Time per auto checkout sweep (all batches)",
+                          (), SWEEP_SECONDS_BUCKETS)
+
+
+def observe_request(method, route, status, seconds):
+    if not METRICS_ENABLED:
+        return
+    REQUESTS.inc(method, route, str(status))
+    REQUEST_SECONDS.observe(seconds, method, route)
+    if status >= 500:
+        REQUEST_ERRORS.inc(method, route)
+
+
+def observe_query(statement, seconds):
+    if METRICS_ENABLED:
+        QUERY_SECONDS.observe(seconds, statement)
+
+
+def observe_report(fmt, mode, seconds, size):
+    if METRICS_ENABLED:
+        REPORT_SECONDS.observe(seconds, fmt, mode)
+        REPORT_BYTES.observe(size, fmt, mode)
+
+
+def observe_sweep(rows, seconds):
+    if METRICS_ENABLED:
+        SWEEP_ROWS.inc(amount=rows)
+        SWEEP_SECONDS.observe(seconds)
+
+
+def track_report(fmt, chunks):
+    """Pass a streamed report's chunks through, recording its time and size once it completes"""
+    started = time.perf_counter()
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    observe_report(fmt, 'stream', time.perf_counter() - started, size)
+
+
+# --- Sharing totals between worker processes (METRICS_DIR) ---
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+# The flush thread and a scrape may both write this process's file
+_flush_lock = threading.Lock()
+
+
+def snapshot():
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def flush():
+    """Write this process's totals to METRICS_DIR/<pid>.json"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    with _flush_lock:
+        with open(path + '.partial', 'w') as f:
+            json.dump(snapshot(), f)
+        os.replace(path + '.partial', path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception as e:
+            print(f"WARNING: Could not write metrics to {METRICS_DIR}: {e}")
+
+
+def start_flusher():
+    """Start this process's flush thread once (threads do not survive fork)"""
+    global _flusher_pid
+    if not (METRICS_ENABLED and METRICS_DIR) or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def exposition():
+    """Prometheus text format for this process, or for every worker with METRICS_DIR"""
+    if METRICS_DIR:
+        flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"WARNING: Skipping unreadable metrics file {path}: {e}")
+    else:
+        snapshots = [snapshot()]
+
+    lines = []
+    for metric in REGISTRY:
+        series = {}
+        for taken in snapshots:
+            for key, value in taken.get(metric.name, ()):
+                key = tuple(key)
+                series[key] = metric.merge(series.get(key), value)
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render(series))
+    return '\n'.join(lines) + '\n'
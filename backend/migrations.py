@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations
+Every migration applied is recorded in schema_version. At boot each worker reads the
+newest version (init_db) and does nothing more when the schema is current. Only when
+it is behind does it take a Postgres advisory lock and apply the pending migrations,
+each in its own transaction. A worker that waited for the lock re-reads the version and
+finds the work done, so exactly one process migrates.
+
+Migrations 1-12 are the schema init_db used to verify on every boot. They check before
+they create, so they also apply cleanly to databases set up before schema_version
+existed. New migrations go at the end of MIGRATIONS with the next number; never edit or
+renumber one that has shipped.
+
+    python migrations.py --status
+    python migrations.py --migrate [--to N]
+    python migrations.py --redo 6     # apply one (re-runnable) migration again
+"""
+
+import argparse
+import sys
+import time
+
+import auth
+import changes
+import partitions
+import queries
+import report_jobs
+import rollups
+import search
+import table_versions
+
+# Arbitrary application-wide key for pg_advisory_lock ("vtmg")
+MIGRATION_LOCK_KEY = 0x76746d67
+
+SCHEMA_VERSION_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        duration_ms INTEGER
+    )
+"""
+
+MAIN_ADMIN = ("Admin Dhanashri", "akhadedhanashri@gmail.com", "Dhanashri@2026")
+
+
+def _run_all(cursor, statements):
+    for statement in statements:
+        queries.execute(cursor, statement, label='migration')
+
+
+def _exists(cursor, relation):
+    queries.execute(cursor, "SELECT to_regclass(?)", (relation,), label='migration')
+    return cursor.fetchone()[0] is not None
+
+
+def users_table(cursor):
+    _run_all(cursor, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT DEFAULT 'security',
+            status TEXT DEFAULT 'Active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Users tables from before roles existed
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS role TEXT DEFAULT 'security'",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'Active'",
+    ])
+
+
+def users_reset_token(cursor):
+    _run_all(cursor, [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS reset_token TEXT",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS reset_token_expiry TIMESTAMP",
+    ])
+
+
+def settings_table(cursor):
+    _run_all(cursor, [
+        """
+        CREATE TABLE IF NOT EXISTS settings (
+            id SERIAL PRIMARY KEY,
+            organization_name TEXT DEFAULT 'Rachana Girls Hostel',
+            email TEXT DEFAULT 'contact@rachana.org',
+            phone TEXT DEFAULT '+91 22 1234 5678',
+            push_notifications BOOLEAN DEFAULT FALSE,
+            email_notifications BOOLEAN DEFAULT FALSE,
+            auto_checkout BOOLEAN DEFAULT FALSE,
+            require_email BOOLEAN DEFAULT FALSE,
+            require_organization BOOLEAN DEFAULT FALSE
+        )
+        """,
+        # Settings version, bumped by every update; drives the settings cache and its ETag
+        "ALTER TABLE settings ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+        """
+        INSERT INTO settings (id, organization_name, email, phone)
+        SELECT 1, 'Rachana Girls Hostel', 'contact@rachana.org', '+91 22 1234 5678'
+        WHERE NOT EXISTS (SELECT 1 FROM settings)
+        """,
+    ])
+
+
+def partitioned_visitors(cursor):
+    # Created partitioned by month of check_in_time; a plain table is converted
+    queries.execute(cursor, partitions.CREATE_TABLE_SQL, label='migration')
+    if not partitions.is_partitioned(cursor):
+        print("INFO: Converting visitors to a monthly partitioned table")
+        partitions.convert_to_partitioned(cursor)
+        # The old table's triggers went with it
+        _run_all(cursor, changes.SETUP_SQL + table_versions.SETUP_SQL)
+    for name in partitions.ensure_partitions(cursor):
+        print(f"INFO: Created partition {name}")
+
+
+def visitor_list_indexes(cursor):
+    # Keyset pagination and filters on GET /api/visitors
+    _run_all(cursor, [
+        "CREATE INDEX IF NOT EXISTS idx_visitors_check_in ON visitors (check_in_time DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_visitors_inside ON visitors (check_in_time DESC, id DESC) WHERE check_out_time IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_visitors_host ON visitors (host_name, check_in_time DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_visitors_purpose ON visitors (purpose, check_in_time DESC, id DESC)",
+    ])
+
+
+def visitor_search_index(cursor):
+    # Trigram when pg_trgm can be installed, full-text otherwise
+    if _exists(cursor, 'idx_visitors_search_trgm') or _exists(cursor, 'idx_visitors_search_fts'):
+        return
+    print("INFO: Building visitor search index")
+    queries.execute(cursor, search.DOCUMENT_FUNCTION_SQL, label='migration')
+    queries.execute(cursor, "SAVEPOINT search_trigram")
+    try:
+        _run_all(cursor, search.TRIGRAM_SETUP_SQL)
+    except Exception as e:
+        queries.execute(cursor, "ROLLBACK TO SAVEPOINT search_trigram")
+        print(f"WARNING: pg_trgm unavailable, visitor search falls back to full-text: {e}")
+        _run_all(cursor, search.FULLTEXT_SETUP_SQL)
+
+
+def daily_rollups(cursor):
+    if _exists(cursor, 'visitor_daily_stats'):
+        return
+    queries.execute(cursor, rollups.CREATE_TABLE_SQL, label='migration')
+    print("INFO: Backfilling visitor_daily_stats from visitors")
+    rollups.rebuild_daily_stats(cursor)
+
+
+def change_tracking(cursor):
+    if not _exists(cursor, 'visitor_tombstones'):
+        _run_all(cursor, changes.SETUP_SQL)
+
+
+def data_versions(cursor):
+    if not _exists(cursor, 'table_versions'):
+        _run_all(cursor, table_versions.SETUP_SQL)
+
+
+def auth_signing_key(cursor):
+    if not _exists(cursor, 'app_secrets'):
+        _run_all(cursor, auth.SETUP_SQL)
+
+
+def report_job_table(cursor):
+    if not _exists(cursor, 'report_jobs'):
+        _run_all(cursor, report_jobs.SETUP_SQL)
+
+
+def main_admin(cursor):
+    name, email, password = MAIN_ADMIN
+    queries.execute(cursor, """
+        INSERT INTO users (name, email, password, role, status)
+        VALUES (?, ?, ?, 'admin', 'Active')
+        ON CONFLICT (email) DO NOTHING
+    """, (name, email, auth.hash_password(password)), label='migration')
+
+
+def purpose_rollups(cursor):
+    if _exists(cursor, 'visitor_daily_purposes'):
+        return
+    queries.execute(cursor, rollups.PURPOSES_TABLE_SQL, label='migration')
+    print("INFO: Backfilling visitor_daily_purposes from visitors")
+    rollups.rebuild_daily_purposes(cursor)
+
+
+def visitor_versions_from_change_feed(cursor):
+    # Tombstones keep check_in_time, TRUNCATE moves the sync horizon, and the visitors
+    # version is read from change_xid instead of a row every write updates
+    _run_all(cursor, changes.SETUP_SQL + table_versions.UNTRACK_VISITORS_SQL)
+
+
+# (version, description, apply(cursor)); append only
+MIGRATIONS = [
+    (1, "users table", users_table),
+    (2, "password reset token on users", users_reset_token),
+    (3, "settings table and default row", settings_table),
+    (4, "visitors partitioned by month", partitioned_visitors),
+    (5, "visitor list indexes", visitor_list_indexes),
+    (6, "visitor search index", visitor_search_index),
+    (7, "daily visit rollups", daily_rollups),
+    (8, "visitor change tracking", change_tracking),
+    (9, "table data versions", data_versions),
+    (10, "auth signing key", auth_signing_key),
+    (11, "report jobs", report_job_table),
+    (12, "main admin user", main_admin),
+    (13, "daily purpose rollups", purpose_rollups),
+    (14, "visitors version from the change feed", visitor_versions_from_change_feed),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(cursor):
+    """Newest applied migration (0 for a database never migrated)"""
+    if not _exists(cursor, 'schema_version'):
+        return 0
+    queries.execute(cursor, "SELECT COALESCE(MAX(version), 0) FROM schema_version", label='migration')
+    return cursor.fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations (up to target) under the migration lock; returns versions applied"""
+    cursor = conn.cursor()
+    # Blocks while another process migrates; it is released if that process dies
+    queries.execute(cursor, "SELECT pg_advisory_lock(?)", (MIGRATION_LOCK_KEY,), label='migration')
+    conn.commit()
+    applied = []
+    try:
+        queries.execute(cursor, SCHEMA_VERSION_SQL, label='migration')
+        conn.commit()
+        version = current_version(cursor)
+        for number, description, apply in MIGRATIONS:
+            if number <= version or (target is not None and number > target):
+                continue
+            print(f"INFO: Applying migration {number}: {description}")
+            started = time.perf_counter()
+            try:
+                apply(cursor)
+                queries.execute(cursor, """
+                    INSERT INTO schema_version (version, description, duration_ms) VALUES (?, ?, ?)
+                """, (number, description, int((time.perf_counter() - started) * 1000)), label='migration')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(number)
+    finally:
+        queries.execute(cursor, "SELECT pg_advisory_unlock(?)", (MIGRATION_LOCK_KEY,), label='migration')
+        conn.commit()
+    return applied
+
+
+def redo(conn, number):
+    """Apply an already applied migration again, under the migration lock"""
+    found = [migration for migration in MIGRATIONS if migration[0] == number]
+    if not found:
+        raise ValueError(f"No migration {number}")
+    _, description, apply = found[0]
+    cursor = conn.cursor()
+    queries.execute(cursor, "SELECT pg_advisory_lock(?)", (MIGRATION_LOCK_KEY,), label='migration')
+    conn.commit()
+    try:
+        print(f"INFO: Applying migration {number} again: {description}")
+        apply(cursor)
+        queries.execute(cursor, "UPDATE schema_version SET applied_at = CURRENT_TIMESTAMP WHERE version = ?",
+                        (number,), label='migration')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        queries.execute(cursor, "SELECT pg_advisory_unlock(?)", (MIGRATION_LOCK_KEY,), label='migration')
+        conn.commit()
+
+
+def ensure_current(conn):
+    """Boot check: one version read, and migrate only if the schema is behind; returns versions applied"""
+    cursor = conn.cursor()
+    version = current_version(cursor)
+    conn.rollback()
+    if version > LATEST:
+        # An older worker during a rolling deploy; migrations only ever add, so carry on
+        print(f"WARNING: Schema is at version {version}, newer than this code ({LATEST})")
+    if version >= LATEST:
+        return []
+    return migrate(conn)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    parser.add_argument('--status', action='store_true', help="Show applied and pending migrations")
+    parser.add_argument('--migrate', action='store_true', help="Apply pending migrations")
+    parser.add_argument('--to', type=int, help="Stop after this version")
+    parser.add_argument('--redo', type=int, metavar='VERSION',
+                        help="Apply one migration again (e.g. 6 to rebuild a dropped search index)")
+    args = parser.parse_args()
+
+    if not (args.status or args.migrate or args.redo):
+        parser.print_help()
+        sys.exit(1)
+
+    # Not through api_server: importing it would already migrate
+    from db import get_db_connection
+    conn = get_db_connection()
+    try:
+        if args.migrate:
+            applied = migrate(conn, args.to)
+            print(f"✓ Applied {len(applied)} migrations" + (f": {', '.join(map(str, applied))}" if applied else ""))
+        if args.redo:
+            redo(conn, args.redo)
+            print(f"✓ Applied migration {args.redo} again")
+        if args.status:
+            cursor = conn.cursor()
+            applied = {}
+            if current_version(cursor):
+                queries.execute(cursor, "SELECT version, applied_at, duration_ms FROM schema_version")
+                applied = {row[0]: row[1:] for row in cursor.fetchall()}
+            conn.rollback()
+            for number, description, _ in MIGRATIONS:
+                if number in applied:
+                    applied_at, duration_ms = applied[number]
+                    print(f"  {number:>3}  {description:<36} applied {applied_at:%Y-%m-%d %H:%M} ({duration_ms} ms)")
+                else:
+                    print(f"  {number:>3}  {description:<36} pending")
+    except Exception as e:
+        print(f"✗ Error running migrations: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
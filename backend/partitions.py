@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Monthly range partitioning of the visitors table on check_in_time
+Each month is its own partition, visitors_YYYY_MM. visitors_default catches anything
+outside the created months. Queries that filter or order on check_in_time only read the
+partitions they need. VACUUM and index maintenance work month by month.
+
+A migration (migrations.py) creates the partitioned table, or converts an existing plain
+one. It also creates partitions PARTITION_MONTHS_AHEAD months ahead. Each API worker checks
+that window at startup, and the background scheduler leader (auto_checkout.py) keeps it
+moving, whether or not auto checkout itself is enabled. A month whose visits already
+landed in visitors_default gets its partition anyway: the rows are moved into it.
+
+Old months are archived by exporting them to gzipped CSV and dropping the partition:
+
+    python partitions.py --list
+    python partitions.py --archive [--older-than-months 24] [--dir archive] [--keep-tables] [--dry-run]
+
+Archived visits stay in the daily rollups, so /api/visitors/stats still counts them. They
+get tombstones like deleted visitors, so change feed clients (changes.py) drop them too.
+A file can be loaded back with:
+
+    gunzip -c visitors_2024_01.csv.gz | psql "$DATABASE_URL" -c "\\copy visitors FROM STDIN WITH (FORMAT csv, HEADER)"
+"""
+
+import argparse
+import gzip
+import os
+import re
+import sys
+from datetime import date
+
+import queries
+
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', 24))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+
+DEFAULT_PARTITION = 'visitors_default'
+_PARTITION_NAME = re.compile(r'^visitors_(\d{4})_(\d{2})$')
+
+# The partition key has to be part of the primary key; ids still come from one sequence
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS visitors (
+        id SERIAL,
+        name TEXT NOT NULL,
+        email TEXT,
+        phone TEXT,
+        purpose TEXT NOT NULL,
+        check_in_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        check_out_time TIMESTAMP,
+        host_name TEXT,
+        company TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, check_in_time)
+    ) PARTITION BY RANGE (check_in_time)
+"""
+
+TABLE_KIND = queries.statement("partitions_table_kind", "SELECT relkind::text FROM pg_class WHERE oid = to_regclass(?)")
+LIST = queries.statement("partitions_list", """
+    SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass('visitors')
+    ORDER BY c.relname
+""")
+
+
+def month_start(day, offset=0):
+    """First day of the month `offset` months after day's month"""
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"visitors_{month.year:04d}_{month.month:02d}"
+
+
+def create_partition_sql(month, parent='visitors'):
+    return (f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{month_start(month, 1).isoformat()}')")
+
+
+def is_partitioned(cursor):
+    queries.run(cursor, TABLE_KIND, ('visitors',))
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def list_partitions(cursor):
+    """(name, estimated rows, bytes) for every partition, oldest first"""
+    queries.run(cursor, LIST)
+    return cursor.fetchall()
+
+
+def ensure_partitions(cursor, months_ahead=PARTITION_MONTHS_AHEAD, today=None):
+    """Create the default partition and monthly partitions through months_ahead; returns names created"""
+    today = today or date.today()
+    return ensure_months(cursor, today, month_start(today, months_ahead))
+
+
+def ensure_months(cursor, first, last):
+    """Create the default partition and a partition for every month from first to last; returns names created"""
+    existing = {row[0] for row in list_partitions(cursor)}
+    created = []
+    if DEFAULT_PARTITION not in existing:
+        queries.execute(cursor, f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF visitors DEFAULT", label='partition_create')
+        created.append(DEFAULT_PARTITION)
+    months = [month_start(first)]
+    while months[-1] < month_start(last):
+        months.append(month_start(months[-1], 1))
+    for month in months:
+        if partition_name(month) in existing:
+            continue
+        queries.execute(cursor, "SAVEPOINT partition_create")
+        try:
+            if _default_has_month(cursor, month):
+                moved = _create_from_default(cursor, month)
+                print(f"INFO: Moved {moved} visitors from {DEFAULT_PARTITION} into {partition_name(month)}")
+            else:
+                queries.execute(cursor, create_partition_sql(month), label='partition_create')
+            queries.execute(cursor, "RELEASE SAVEPOINT partition_create")
+            created.append(partition_name(month))
+        except Exception as e:
+            queries.execute(cursor, "ROLLBACK TO SAVEPOINT partition_create")
+            print(f"WARNING: Could not create partition {partition_name(month)}: {e}")
+    return created
+
+
+def _default_has_month(cursor, month):
+    queries.execute(cursor, f"""
+        SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE check_in_time >= ? AND check_in_time < ?)
+    """, (month, month_start(month, 1)), label='partition_default_rows')
+    return cursor.fetchone()[0]
+
+
+def _create_from_default(cursor, month):
+    """Create a month's partition when visitors_default already holds rows for it; returns rows moved
+
+    Postgres refuses to add a partition whose rows sit in the default partition, so the
+    default is detached while the month is created and its rows moved over. DETACH locks
+    visitors until the transaction ends; this only happens when partitions fell behind.
+    Detached, the default has no row triggers, so the move writes no tombstones; the rows
+    get a new change_xid on the way in, and sync clients receive them again as updates.
+    """
+    end = month_start(month, 1)
+    queries.execute(cursor, f"ALTER TABLE visitors DETACH PARTITION {DEFAULT_PARTITION}", label='partition_create')
+    queries.execute(cursor, create_partition_sql(month), label='partition_create')
+    queries.execute(cursor, f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE check_in_time >= ? AND check_in_time < ? RETURNING *
+        )
+        INSERT INTO visitors SELECT * FROM moved
+    """, (month, end), label='partition_create')
+    moved = cursor.rowcount
+    queries.execute(cursor, f"ALTER TABLE visitors ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT", label='partition_create')
+    return moved
+
+
+def convert_to_partitioned(cursor, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Rebuild a plain visitors table as a partitioned one (run inside a transaction)
+
+    Columns, defaults and the id sequence carry over. Triggers and indexes are dropped with
+    the old table; the caller recreates them.
+    """
+    queries.execute(cursor, "LOCK TABLE visitors IN ACCESS EXCLUSIVE MODE")
+    # The partition key cannot be NULL
+    queries.execute(cursor, """
+        UPDATE visitors SET check_in_time = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE check_in_time IS NULL
+    """)
+    queries.execute(cursor, "SELECT MIN(check_in_time)::date FROM visitors")
+    first = cursor.fetchone()[0] or date.today()
+
+    queries.execute(cursor, """
+        CREATE TABLE visitors_partitioned (LIKE visitors INCLUDING DEFAULTS) PARTITION BY RANGE (check_in_time)
+    """)
+    queries.execute(cursor, "ALTER TABLE visitors_partitioned ALTER COLUMN check_in_time SET NOT NULL")
+    queries.execute(cursor, "ALTER TABLE visitors_partitioned ADD CONSTRAINT visitors_partitioned_pkey PRIMARY KEY (id, check_in_time)")
+    queries.execute(cursor, f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF visitors_partitioned DEFAULT")
+    month = month_start(first)
+    last = month_start(date.today(), months_ahead)
+    while month <= last:
+        queries.execute(cursor, create_partition_sql(month, 'visitors_partitioned'))
+        month = month_start(month, 1)
+
+    queries.execute(cursor, "INSERT INTO visitors_partitioned SELECT * FROM visitors")
+    queries.execute(cursor, "ALTER SEQUENCE visitors_id_seq OWNED BY NONE")
+    queries.execute(cursor, "DROP TABLE visitors")
+    queries.execute(cursor, "ALTER TABLE visitors_partitioned RENAME TO visitors")
+    queries.execute(cursor, "ALTER TABLE visitors RENAME CONSTRAINT visitors_partitioned_pkey TO visitors_pkey")
+    queries.execute(cursor, "ALTER SEQUENCE visitors_id_seq OWNED BY visitors.id")
+
+
+def archivable(cursor, older_than_months=ARCHIVE_AFTER_MONTHS, today=None):
+    """Monthly partitions that ended at least older_than_months ago, oldest first"""
+    cutoff = month_start(today or date.today(), -older_than_months)
+    names = []
+    for name, _, _ in list_partitions(cursor):
+        match = _PARTITION_NAME.match(name)
+        if match and month_start(date(int(match.group(1)), int(match.group(2)), 1), 1) <= cutoff:
+            names.append(name)
+    return names
+
+
+def archive_partition(conn, name, directory=ARCHIVE_DIR, keep_table=False):
+    """Export one partition to <directory>/<name>.csv.gz, then detach it (and drop it); returns rows exported"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    partial = path + '.partial'
+    cursor = conn.cursor()
+    try:
+        # Block writes to the month while it is exported, so nothing is lost between COPY and DETACH
+        queries.execute(cursor, f"LOCK TABLE {name} IN SHARE MODE")
+        with gzip.open(partial, 'wb') as out:
+            cursor.copy_expert(f"COPY (SELECT * FROM {name} ORDER BY check_in_time, id) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+        rows = cursor.rowcount
+        with open(partial, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(partial, path)
+
+        # Detaching fires no row triggers: record the month's visitors as deleted for the change
+        # feed, which also moves the visitors data version on for conditional GETs
+        queries.execute(cursor, f"""
+            INSERT INTO visitor_tombstones (id, change_xid, check_in_time)
+            SELECT id, pg_current_xact_id(), check_in_time FROM {name}
+            ON CONFLICT (id) DO UPDATE
+            SET change_xid = EXCLUDED.change_xid, check_in_time = EXCLUDED.check_in_time, deleted_at = CURRENT_TIMESTAMP
+        """, label='partition_tombstones')
+        queries.execute(cursor, f"ALTER TABLE visitors DETACH PARTITION {name}")
+        if not keep_table:
+            queries.execute(cursor, f"DROP TABLE {name}")
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of the visitors table")
+    parser.add_argument('--list', action='store_true', help="Show partitions with estimated rows and size")
+    parser.add_argument('--ensure', action='store_true', help="Create partitions for upcoming months")
+    parser.add_argument('--archive', action='store_true', help="Export old partitions to gzipped CSV and drop them")
+    parser.add_argument('--older-than-months', type=int, default=ARCHIVE_AFTER_MONTHS, help="Archive months that ended this long ago")
+    parser.add_argument('--dir', default=ARCHIVE_DIR, help="Directory for archive files")
+    parser.add_argument('--keep-tables', action='store_true', help="Detach archived partitions but keep them as plain tables")
+    parser.add_argument('--dry-run', action='store_true', help="Only print what would be archived")
+    args = parser.parse_args()
+
+    if not (args.list or args.ensure or args.archive):
+        parser.print_help()
+        sys.exit(1)
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        if not is_partitioned(cursor):
+            print("✗ visitors is not partitioned yet; run python migrations.py --migrate")
+            sys.exit(1)
+        if args.ensure:
+            created = ensure_partitions(cursor)
+            conn.commit()
+            print(f"✓ Created {len(created)} partitions" + (f": {', '.join(created)}" if created else ""))
+        if args.list:
+            for name, rows, size in list_partitions(cursor):
+                print(f"  {name:<20} ~{max(rows, 0):>10} rows {size / 1048576:>9.1f} MB")
+        if args.archive:
+            names = archivable(cursor, args.older_than_months)
+            conn.rollback()
+            if not names:
+                print(f"✓ Nothing older than {args.older_than_months} months to archive")
+            for name in names:
+                if args.dry_run:
+                    print(f"  would archive {name}")
+                    continue
+                rows = archive_partition(conn, name, args.dir, args.keep_tables)
+                print(f"✓ Archived {name}: {rows} rows -> {os.path.join(args.dir, name + '.csv.gz')}")
+    except SystemExit:
+        raise
+    except Exception as e:
+        conn.rollback()
+        print(f"✗ Error managing partitions: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Query layer for the Visitor Tracker API
+SQL is written with ? placeholders and translated once, when the statement is defined.
+Each pooled connection PREPAREs a statement the first time it runs it and then only
+sends EXECUTE. Statements defined at import are a fixed set and stay prepared. SQL
+assembled at runtime (dynamic) can take many forms, so each connection keeps at most
+DYNAMIC_STATEMENT_LIMIT of those prepared and DEALLOCATEs the least recently used.
+Rows are turned into JSON by serializers.py.
+"""
+
+import collections
+import hashlib
+import os
+import threading
+import time
+
+import metrics
+import slow_queries
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:
+    psycopg2 = None
+
+QUERY_TIMING = os.getenv('QUERY_TIMING', 'true').lower() in ('1', 'true', 'yes')
+DYNAMIC_STATEMENT_LIMIT = 256
+
+
+def translate(sql):
+    """? placeholders -> psycopg2 %s (literal % doubled so it survives formatting)"""
+    return sql.replace('%', '%%').replace('?', '%s')
+
+
+def _number_placeholders(sql):
+    """? placeholders -> $1, $2, ... for PREPARE"""
+    parts = sql.split('?')
+    numbered = [parts[0]]
+    for index, part in enumerate(parts[1:], start=1):
+        numbered.append(f"${index}{part}")
+    return ''.join(numbered)
+
+
+class Statement:
+    """A SQL statement with every form we send pre-built"""
+    __slots__ = ('name', 'label', 'dynamic', 'param_count', 'plain_sql', 'prepare_sql', 'execute_sql')
+
+    def __init__(self, name, sql, label=None, dynamic=False):
+        self.name = name
+        self.label = label or name
+        self.dynamic = dynamic
+        self.param_count = sql.count('?')
+        self.plain_sql = translate(sql)
+        self.prepare_sql = f"PREPARE {name} AS {_number_placeholders(sql)}"
+        placeholders = ', '.join(['%s'] * self.param_count)
+        self.execute_sql = f"EXECUTE {name} ({placeholders})" if self.param_count else f"EXECUTE {name}"
+
+
+STATEMENTS = {}
+_translated = {}
+_dynamic = collections.OrderedDict()
+_dynamic_lock = threading.Lock()
+
+
+def statement(name, sql):
+    """Define a named statement (at import time)"""
+    if name in STATEMENTS:
+        raise ValueError(f"Duplicate statement name {name!r}")
+    stmt = Statement(name, sql)
+    STATEMENTS[name] = stmt
+    return stmt
+
+
+def dynamic(sql, label):
+    """Statement for SQL assembled at runtime (e.g. optional filters), cached by its text
+
+    The name comes from the text, so a statement dropped from this cache and made again
+    still matches what connections have prepared.
+    """
+    with _dynamic_lock:
+        stmt = _dynamic.get(sql)
+        if stmt is None:
+            if len(_dynamic) >= DYNAMIC_STATEMENT_LIMIT:
+                _dynamic.popitem(last=False)
+            name = "dyn_" + hashlib.sha1(sql.encode()).hexdigest()[:16]
+            stmt = _dynamic[sql] = Statement(name, sql, label, dynamic=True)
+        else:
+            _dynamic.move_to_end(sql)
+    return stmt
+
+
+if psycopg2:
+    class PreparingConnection(psycopg2.extensions.connection):
+        """psycopg2 connection that remembers which statements it has PREPAREd"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared = set()
+            # Names of prepared dynamic statements, least recently used first
+            self.dynamic_prepared = collections.OrderedDict()
+
+        def prepare(self, cursor, stmt):
+            """PREPARE stmt on this connection if it isn't yet; a dynamic one past the limit evicts the oldest"""
+            if stmt.name in self.prepared:
+                if stmt.dynamic:
+                    self.dynamic_prepared.move_to_end(stmt.name)
+                return
+            if stmt.dynamic:
+                while len(self.dynamic_prepared) >= DYNAMIC_STATEMENT_LIMIT:
+                    oldest, _ = self.dynamic_prepared.popitem(last=False)
+                    cursor.execute(f"DEALLOCATE {oldest}")
+                    self.prepared.discard(oldest)
+            # Prepared statements outlive transactions, so this happens once per connection
+            cursor.execute(stmt.prepare_sql)
+            self.prepared.add(stmt.name)
+            if stmt.dynamic:
+                self.dynamic_prepared[stmt.name] = None
+else:
+    PreparingConnection = None
+
+
+def run(cursor, stmt, params=()):
+    """Execute a Statement, preparing it on this connection the first time"""
+    started = time.perf_counter()
+    try:
+        prepared = getattr(cursor.connection, 'prepared', None)
+        # Server-side (named) cursors can only DECLARE a plain query
+        if prepared is None or cursor.name:
+            cursor.execute(stmt.plain_sql, params)
+        else:
+            cursor.connection.prepare(cursor, stmt)
+            cursor.execute(stmt.execute_sql, params)
+    finally:
+        seconds = time.perf_counter() - started
+        _observe(stmt.label, seconds)
+    if seconds >= slow_queries.THRESHOLD:
+        executed_sql = stmt.plain_sql if prepared is None or cursor.name else stmt.execute_sql
+        slow_queries.record(cursor, stmt.label, stmt.plain_sql, executed_sql, params, seconds)
+
+
+def execute(cursor, sql, params=(), label='adhoc'):
+    """Execute one-off SQL (DDL, scripts) unprepared, translating each distinct text once"""
+    plain_sql = _translated.get(sql)
+    if plain_sql is None:
+        if len(_translated) >= DYNAMIC_STATEMENT_LIMIT:
+            _translated.clear()
+        plain_sql = _translated[sql] = translate(sql)
+    started = time.perf_counter()
+    try:
+        cursor.execute(plain_sql, params)
+    finally:
+        seconds = time.perf_counter() - started
+        _observe(label, seconds)
+    if seconds >= slow_queries.THRESHOLD:
+        slow_queries.record(cursor, label, plain_sql, plain_sql, params, seconds)
+
+
+# Per-statement timing
+_timings = {}
+_timings_lock = threading.Lock()
+
+
+def _observe(label, seconds):
+    """Every statement feeds the Prometheus histogram, and the debug table when QUERY_TIMING is on"""
+    metrics.observe_query(label, seconds)
+    if QUERY_TIMING:
+        record_timing(label, seconds)
+
+
+def record_timing(label, seconds):
+    with _timings_lock:
+        entry = _timings.get(label)
+        if entry is None:
+            _timings[label] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+
+def timings(reset=False):
+    """Per-statement call counts and durations, slowest total first"""
+    with _timings_lock:
+        snapshot = dict(_timings)
+        if reset:
+            _timings.clear()
+    rows = [
+        {
+            "statement": label,
+            "calls": calls,
+            "total_ms": round(total * 1000, 3),
+            "avg_ms": round(total / calls * 1000, 3),
+            "max_ms": round(slowest * 1000, 3),
+        }
+        for label, (calls, total, slowest) in snapshot.items()
+    ]
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows
+
+
+# Tables
+VISITOR_FIELDS = ("id", "name", "email", "phone", "purpose", "check_in_time", "check_out_time",
+                  "host_name", "company", "created_at", "updated_at")
+VISITOR_COLUMNS = ", ".join(VISITOR_FIELDS)
+
+USER_FIELDS = ("id", "name", "email", "role", "status", "created_at", "updated_at")
+USER_COLUMNS = ", ".join(USER_FIELDS)
+
+
+# Health
+COUNT_USERS = statement("count_users", "SELECT COUNT(*) FROM users")
+COUNT_VISITORS = statement("count_visitors", "SELECT COUNT(*) FROM visitors")
+
+# Users and authentication
+USER_LOGIN = statement("user_login", "SELECT id, name, email, role, status, password FROM users WHERE email = ?")
+# Rehash on login; only replaces the exact value that was verified
+USER_UPGRADE_PASSWORD = statement("user_upgrade_password", "UPDATE users SET password = ? WHERE id = ? AND password = ?")
+USER_AUTH_STATE = statement("user_auth_state", "SELECT status, role FROM users WHERE id = ?")
+USER_PASSWORD_BY_ID = statement("user_password_by_id", "SELECT password FROM users WHERE id = ?")
+USER_SET_PASSWORD = statement("user_set_password", "UPDATE users SET password = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?")
+USER_BY_EMAIL = statement("user_by_email", "SELECT id, name FROM users WHERE email = ?")
+USER_SET_RESET_TOKEN = statement("user_set_reset_token", "UPDATE users SET reset_token = ?, reset_token_expiry = ? WHERE id = ?")
+USER_BY_RESET_TOKEN = statement("user_by_reset_token", "SELECT id, reset_token_expiry FROM users WHERE reset_token = ?")
+USER_RESET_PASSWORD = statement("user_reset_password", """
+    UPDATE users
+    SET password = ?, reset_token = NULL, reset_token_expiry = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+""")
+USERS_ALL = statement("users_all", f"SELECT {USER_COLUMNS} FROM users ORDER BY created_at DESC")
+USER_INSERT = statement("user_insert", f"""
+    INSERT INTO users (name, email, password, role, status)
+    VALUES (?, ?, ?, ?, ?)
+    RETURNING {USER_COLUMNS}
+""")
+USER_BY_ID = statement("user_by_id", f"SELECT {USER_COLUMNS} FROM users WHERE id = ?")
+USER_STATUS_BY_ID = statement("user_status_by_id", "SELECT status FROM users WHERE id = ?")
+USER_SET_STATUS = statement("user_set_status", "UPDATE users SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?")
+USER_DELETE = statement("user_delete", "DELETE FROM users WHERE id = ?")
+
+# Visitors
+VISITOR_INSERT = statement("visitor_insert", f"""
+    INSERT INTO visitors (name, email, phone, purpose, host_name, company)
+    VALUES (?, ?, ?, ?, ?, ?)
+    RETURNING {VISITOR_COLUMNS}
+""")
+# Rows come back as (position in the arrays, visitor columns...). RETURNING cannot see the
+# input's ordinality, so ids are drawn first and the inserted rows are joined back on them.
+VISITOR_INSERT_BULK = statement("visitor_insert_bulk", f"""
+    WITH input AS (
+        SELECT nextval(pg_get_serial_sequence('visitors', 'id')) AS id, t.*
+        FROM unnest(?::text[], ?::text[], ?::text[], ?::text[], ?::text[], ?::text[])
+            WITH ORDINALITY AS t (name, email, phone, purpose, host_name, company, ordinal)
+    ), inserted AS (
+        INSERT INTO visitors (id, name, email, phone, purpose, host_name, company)
+        SELECT id, name, email, phone, purpose, host_name, company FROM input
+        RETURNING {VISITOR_COLUMNS}
+    )
+    SELECT input.ordinal, inserted.* FROM inserted JOIN input ON input.id = inserted.id
+    ORDER BY input.ordinal
+""")
+# The primary key is (id, check_in_time), so a lookup by id alone probes every monthly
+# partition. The *_AT variants take the visit's check_in_time too and read only its month.
+VISITOR_BY_ID = statement("visitor_by_id", f"SELECT {VISITOR_COLUMNS} FROM visitors WHERE id = ?")
+VISITOR_BY_ID_AT = statement("visitor_by_id_at", f"SELECT {VISITOR_COLUMNS} FROM visitors WHERE id = ? AND check_in_time = ?")
+VISITORS_INSIDE = statement("visitors_inside", f"""
+    SELECT {VISITOR_COLUMNS} FROM visitors
+    WHERE check_out_time IS NULL
+    ORDER BY check_in_time DESC, id DESC
+""")
+_VISITOR_CHECKOUT_SQL = f"""
+    UPDATE visitors
+    SET check_out_time = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ? AND check_out_time IS NULL{{}}
+    RETURNING {VISITOR_COLUMNS}
+"""
+VISITOR_CHECKOUT = statement("visitor_checkout", _VISITOR_CHECKOUT_SQL.format(""))
+VISITOR_CHECKOUT_AT = statement("visitor_checkout_at", _VISITOR_CHECKOUT_SQL.format(" AND check_in_time = ?"))
+VISITOR_DELETE = statement("visitor_delete", "DELETE FROM visitors WHERE id = ? RETURNING check_in_time, check_out_time, purpose")
+VISITOR_DELETE_AT = statement("visitor_delete_at", """
+    DELETE FROM visitors WHERE id = ? AND check_in_time = ? RETURNING check_in_time, check_out_time, purpose
+""")
+
+# Settings
+SETTINGS_VERSION = statement("settings_version", "SELECT version FROM settings WHERE id = 1")
+SETTINGS_ROW = statement("settings_row", """
+    SELECT version, organization_name, email, phone, push_notifications, email_notifications,
+           auto_checkout, require_email, require_organization
+    FROM settings WHERE id = 1
+""")
+SETTINGS_UPDATE = statement("settings_update", """
+    UPDATE settings SET
+        organization_name = ?,
+        email = ?,
+        phone = ?,
+        push_notifications = ?,
+        email_notifications = ?,
+        auto_checkout = ?,
+        require_email = ?,
+        require_organization = ?,
+        version = version + 1
+    WHERE id = 1
+""")
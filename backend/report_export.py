@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Visitor report export engines
+Rows are read from a server-side cursor in batches and written out incrementally,
+so memory stays flat regardless of how many visitors a report covers
+"""
+
+import csv
+import io
+import os
+import re
+import zipfile
+import zlib
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+REPORT_COLUMNS = ["ID", "Name", "Email", "Phone", "Purpose", "Check-in", "Check-out", "Host", "Company", "Created", "Updated"]
+REPORT_BATCH_SIZE = int(os.getenv('REPORT_BATCH_SIZE', 2000))
+XLSX_COLUMN_WIDTHS = [8, 24, 28, 16, 18, 20, 20, 20, 20, 20, 20]
+XLSX_DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+XLSX_COMPRESS_LEVEL = int(os.getenv('XLSX_COMPRESS_LEVEL', 1))
+
+
+def open_report_cursor(conn, name='visitor_report'):
+    """Named (server-side) cursor: Postgres keeps the result set, we pull it in batches"""
+    cursor = conn.cursor(name=name)
+    cursor.itersize = REPORT_BATCH_SIZE
+    return cursor
+
+
+def iter_rows(cursor, first_batch=None, batch_size=REPORT_BATCH_SIZE):
+    """Yield rows batch by batch, starting with an already fetched first batch"""
+    batch = first_batch if first_batch is not None else cursor.fetchmany(batch_size)
+    while batch:
+        yield from batch
+        batch = cursor.fetchmany(batch_size)
+
+
+def _csv_cells(row):
+    """Visitor row as CSV cells (None becomes an empty cell)"""
+    return ["" if value is None else value for value in row[:len(REPORT_COLUMNS)]]
+
+
+def stream_csv(rows, batch_size=REPORT_BATCH_SIZE):
+    """Generate the CSV report as text chunks of about `batch_size` rows each"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_COLUMNS)
+    # Send the header straight away so the download starts immediately
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    pending = 0
+    for row in rows:
+        writer.writerow(_csv_cells(row))
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if pending:
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable byte sink that hands written data back in chunks"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+_XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': _XML_HEADER + (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': _XML_HEADER + (
+        f'<Relationships xmlns="{_PKG_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': _XML_HEADER + (
+        f'<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">'
+        '<sheets><sheet name="Visitors" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': _XML_HEADER + (
+        f'<Relationships xmlns="{_PKG_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{_REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_REL_NS}/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Cell formats: 0 = default, 1 = date/time, 2 = bold header
+    'xl/styles.xml': _XML_HEADER + (
+        f'<styleSheet xmlns="{_MAIN_NS}">'
+        f'<numFmts count="1"><numFmt numFmtId="164" formatCode="{XLSX_DATE_FORMAT}"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_text(value):
+    return escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+
+
+def _xlsx_row(number, values, refs):
+    """SpreadsheetML for one row; None values are left as empty cells"""
+    parts = [f'<row r="{number}">']
+    for ref, value in zip(refs, values):
+        if value is None:
+            continue
+        if isinstance(value, datetime):
+            serial = (value.replace(tzinfo=None) - _EXCEL_EPOCH).total_seconds() / 86400
+            parts.append(f'<c r="{ref}{number}" s="1"><v>{serial!r}</v></c>')
+        elif isinstance(value, bool):
+            parts.append(f'<c r="{ref}{number}" t="b"><v>{int(value)}</v></c>')
+        elif isinstance(value, (int, float)):
+            parts.append(f'<c r="{ref}{number}"><v>{value!r}</v></c>')
+        else:
+            parts.append(f'<c r="{ref}{number}" t="inlineStr"><is><t xml:space="preserve">{_xlsx_text(value)}</t></is></c>')
+    parts.append('</row>')
+    return ''.join(parts)
+
+
+def stream_xlsx(rows, batch_size=REPORT_BATCH_SIZE):
+    """Generate the Excel report as byte chunks, writing the .xlsx zip incrementally"""
+    sink = _ChunkSink()
+    refs = [chr(ord('A') + index) for index in range(len(REPORT_COLUMNS))]
+    width = len(REPORT_COLUMNS)
+
+    # An unseekable sink makes zipfile write data descriptors, so nothing is rewritten later
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=XLSX_COMPRESS_LEVEL) as zf:
+        for name, xml in _XLSX_STATIC_PARTS.items():
+            zf.writestr(name, xml)
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            cols = ''.join(
+                f'<col min="{index + 1}" max="{index + 1}" width="{col_width}" customWidth="1"/>'
+                for index, col_width in enumerate(XLSX_COLUMN_WIDTHS)
+            )
+            header = ''.join(
+                f'<c r="{ref}1" s="2" t="inlineStr"><is><t>{_xlsx_text(title)}</t></is></c>'
+                for ref, title in zip(refs, REPORT_COLUMNS)
+            )
+            sheet.write((
+                _XML_HEADER + f'<worksheet xmlns="{_MAIN_NS}">'
+                '<sheetViews><sheetView workbookViewId="0">'
+                '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                '<selection pane="bottomLeft"/></sheetView></sheetViews>'
+                f'<cols>{cols}</cols><sheetData><row r="1">{header}</row>'
+            ).encode('utf-8'))
+            yield sink.drain()
+
+            batch = []
+            number = 1
+            for row in rows:
+                number += 1
+                batch.append(_xlsx_row(number, row[:width], refs))
+                if len(batch) >= batch_size:
+                    sheet.write(''.join(batch).encode('utf-8'))
+                    batch = []
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            if batch:
+                sheet.write(''.join(batch).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+
+    yield sink.drain()
+
+
+# PDF: landscape US Letter in points, a fixed number of lines per page
+PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT = 792, 612
+PDF_MARGIN = 36
+PDF_FONT_SIZE = 8
+PDF_ROW_HEIGHT = 13
+# zlib level for page content; 0 writes pages uncompressed
+PDF_COMPRESS_LEVEL = int(os.getenv('PDF_COMPRESS_LEVEL', 6))
+# (title, row index, width in points); the widths fill the 720pt between the margins
+PDF_COLUMNS = [
+    ("ID", 0, 40), ("Name", 1, 110), ("Email", 2, 130), ("Phone", 3, 70), ("Purpose", 4, 70),
+    ("Check-in (UTC)", 5, 75), ("Check-out (UTC)", 6, 75), ("Host", 7, 75), ("Company", 8, 75),
+]
+PDF_TABLE_WIDTH = sum(width for _, _, width in PDF_COLUMNS)
+_PDF_TABLE_TOP = PDF_PAGE_HEIGHT - PDF_MARGIN - 24
+PDF_ROWS_PER_PAGE = int((_PDF_TABLE_TOP - PDF_ROW_HEIGHT - PDF_MARGIN) // PDF_ROW_HEIGHT)
+# Standard Type 1 fonts (no embedding needed) and their resource names on every page
+_PDF_FONTS = {'Helvetica': b'F1', 'Helvetica-Bold': b'F2'}
+_PDF_CELL_PADDING = 3
+# Finished pages are sent once this much output is waiting
+_PDF_FLUSH_BYTES = 64 * 1024
+
+
+_pdf_widths = {}
+
+
+def _pdf_char_widths(font):
+    """Glyph widths (1/1000 em) of a standard font, indexed by WinAnsiEncoding byte"""
+    widths = _pdf_widths.get(font)
+    if widths is None:
+        from reportlab.pdfbase import pdfmetrics
+        widths = _pdf_widths[font] = tuple(pdfmetrics.getFont(font).widths)
+    return widths
+
+
+def _pdf_fit(text, width, font='Helvetica'):
+    """Text encoded for the page, cut to fit `width` points (with an ellipsis when cut)"""
+    data = str(text).encode('cp1252', 'replace')
+    widths = _pdf_char_widths(font)
+    limit = (width - 2 * _PDF_CELL_PADDING) * 1000 / PDF_FONT_SIZE
+    # No glyph in these fonts is wider than 1015 units, so short text always fits
+    if len(data) * 1015 <= limit or sum(map(widths.__getitem__, data)) <= limit:
+        return data
+    limit -= widths[0x85]
+    total = 0
+    for index, byte in enumerate(data):
+        total += widths[byte]
+        if total > limit:
+            return data[:index] + b'\x85'
+    return data
+
+
+def _pdf_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M')
+    return value
+
+
+def _pdf_string(data):
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+class _PdfCanvas:
+    """Drawing operations for one page, collected as its content stream (text is cp1252 bytes)"""
+
+    def __init__(self):
+        self._ops = []
+
+    def fill_rect(self, x, y, width, height, gray):
+        self._ops.append(b'%.2f g %.1f %.1f %.1f %.1f re f\n' % (gray, x, y, width, height))
+
+    def draw_string(self, x, y, text, font='Helvetica', size=PDF_FONT_SIZE, gray=0):
+        self._ops.append(b'BT /%s %d Tf %.2f g %.1f %.1f Td %s Tj ET\n' % (
+            _PDF_FONTS[font], size, gray, x, y, _pdf_string(text)))
+
+    def draw_row(self, y, cells, font='Helvetica', gray=0):
+        """One table line: cells are (x, encoded text) pairs, drawn in a single text object"""
+        parts = [b'BT /%s %d Tf %.2f g' % (_PDF_FONTS[font], PDF_FONT_SIZE, gray)]
+        for x, text in cells:
+            parts.append(b' 1 0 0 1 %.1f %.1f Tm %s Tj' % (x + _PDF_CELL_PADDING, y + 4, _pdf_string(text)))
+        parts.append(b' ET\n')
+        self._ops.append(b''.join(parts))
+
+    def draw_form(self, name, x, y):
+        self._ops.append(b'q 1 0 0 1 %.1f %.1f cm /%s Do Q\n' % (x, y, name))
+
+    def content(self):
+        return b''.join(self._ops)
+
+
+class _PdfWriter:
+    """Writes numbered PDF objects in order, keeping only their byte offsets once sent"""
+
+    def __init__(self):
+        self._offsets = {}
+        self._position = 0
+        self._next_number = 1
+        self._chunks = []
+        self.pending = 0
+
+    def reserve(self):
+        """Number for an object written later (pages refer to objects that come after them)"""
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._position += len(data)
+        self.pending += len(data)
+
+    def obj(self, number, body):
+        self._offsets[number] = self._position
+        self.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def stream(self, number, dictionary, data):
+        if PDF_COMPRESS_LEVEL > 0:
+            data = zlib.compress(data, PDF_COMPRESS_LEVEL)
+            dictionary += b' /Filter /FlateDecode'
+        self.obj(number, b'<< %s /Length %d >>\nstream\n%s\nendstream' % (dictionary, len(data), data))
+
+    def drain(self):
+        """Bytes written since the last drain"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.pending = 0
+        return data
+
+    def finish(self, root, info):
+        """Cross-reference table and trailer; every reserved object must have been written"""
+        xref = self._position
+        size = self._next_number
+        lines = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+        lines.extend(b'%010d 00000 n \n' % self._offsets[number] for number in range(1, size))
+        self.write(b''.join(lines))
+        self.write(b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                   % (size, root, info, xref))
+
+
+def stream_pdf(rows, subtitle=None, generated_at=None):
+    """Generate the PDF report page by page as byte chunks
+
+    Each page holds PDF_ROWS_PER_PAGE lines under a repeated heading and column header. A
+    subtotal line closes every check-in day (rows arrive newest first) and a total line
+    ends the report. A page is drawn, compressed and sent as soon as it is full; only the
+    byte offsets of finished objects are kept, so memory stays flat however many rows
+    there are. The footer reads "Page N of M": every page draws a shared form XObject for
+    M, and that form is written after the last page, once M is known.
+    """
+    generated_at = generated_at or datetime.utcnow()
+    writer = _PdfWriter()
+    catalog, pages_root, info = writer.reserve(), writer.reserve(), writer.reserve()
+    fonts = {name: writer.reserve() for name in _PDF_FONTS}
+    page_count_form = writer.reserve()
+
+    writer.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    writer.obj(catalog, b'<< /Type /Catalog /Pages %d 0 R >>' % pages_root)
+    for name, number in fonts.items():
+        writer.obj(number, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>'
+                   % name.encode('ascii'))
+    resources = b'<< /Font << %s >> /XObject << /PageCount %d 0 R >> >>' % (
+        b' '.join(b'/%s %d 0 R' % (_PDF_FONTS[name], number) for name, number in fonts.items()), page_count_form)
+    # The download starts before the first page is done
+    yield writer.drain()
+
+    x_positions = [PDF_MARGIN + sum(width for _, _, width in PDF_COLUMNS[:i]) for i in range(len(PDF_COLUMNS))]
+    header_cells = [(x, _pdf_fit(title, width, 'Helvetica-Bold')) for x, (title, _, width) in zip(x_positions, PDF_COLUMNS)]
+    heading = b'Visitor Report' + (b' - ' + _pdf_fit(subtitle, 500, 'Helvetica-Bold') if subtitle else b'')
+    stamp = _pdf_fit(f"Generated {generated_at.strftime('%Y-%m-%d %H:%M')} UTC", 200)
+    footer_x = PDF_PAGE_WIDTH - PDF_MARGIN - 60
+
+    page_ids = []
+    canvas = None
+    line = 0
+
+    def finish_page():
+        label = b'Page %d of ' % (len(page_ids) + 1)
+        label_width = sum(map(_pdf_char_widths('Helvetica').__getitem__, label)) * PDF_FONT_SIZE / 1000
+        canvas.draw_string(PDF_MARGIN, PDF_MARGIN / 2, stamp, gray=0.4)
+        canvas.draw_string(footer_x, PDF_MARGIN / 2, label, gray=0.4)
+        canvas.draw_form(b'PageCount', footer_x + label_width, PDF_MARGIN / 2)
+        content, page_id = writer.reserve(), writer.reserve()
+        writer.stream(content, b'', canvas.content())
+        writer.obj(page_id, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R /Resources %s >>'
+                   % (pages_root, PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT, content, resources))
+        page_ids.append(page_id)
+
+    def next_line():
+        """y of the next table line, finishing the page and starting another when it is full"""
+        nonlocal canvas, line
+        if canvas is not None and line >= PDF_ROWS_PER_PAGE:
+            finish_page()
+            canvas = None
+        if canvas is None:
+            canvas = _PdfCanvas()
+            canvas.draw_string(PDF_MARGIN, PDF_PAGE_HEIGHT - PDF_MARGIN - 10, heading, font='Helvetica-Bold', size=12)
+            canvas.fill_rect(PDF_MARGIN, _PDF_TABLE_TOP - PDF_ROW_HEIGHT, PDF_TABLE_WIDTH, PDF_ROW_HEIGHT, 0.5)
+            canvas.draw_row(_PDF_TABLE_TOP - PDF_ROW_HEIGHT, header_cells, font='Helvetica-Bold', gray=1)
+            line = 0
+        line += 1
+        return _PDF_TABLE_TOP - PDF_ROW_HEIGHT * (line + 1)
+
+    def summary_line(label, visits, checked_out):
+        y = next_line()
+        canvas.fill_rect(PDF_MARGIN, y, PDF_TABLE_WIDTH, PDF_ROW_HEIGHT, 0.85)
+        text = f"{label}: {visits} visit{'s' if visits != 1 else ''}, {checked_out} checked out, {visits - checked_out} inside"
+        canvas.draw_row(y, [(PDF_MARGIN, _pdf_fit(text, PDF_TABLE_WIDTH, 'Helvetica-Bold'))], font='Helvetica-Bold')
+
+    def subtotal(day, visits, checked_out):
+        summary_line(f"Subtotal {day.isoformat() if day else 'no check-in'}", visits, checked_out)
+
+    day = None
+    day_visits = day_checked_out = 0
+    total_visits = total_checked_out = 0
+    for row in rows:
+        row_day = row[5].date() if row[5] else None
+        if day_visits and row_day != day:
+            subtotal(day, day_visits, day_checked_out)
+            day_visits = day_checked_out = 0
+        day = row_day
+        day_visits += 1
+        day_checked_out += row[6] is not None
+        total_visits += 1
+        total_checked_out += row[6] is not None
+
+        y = next_line()
+        if line % 2 == 0:
+            canvas.fill_rect(PDF_MARGIN, y, PDF_TABLE_WIDTH, PDF_ROW_HEIGHT, 0.95)
+        canvas.draw_row(y, [
+            (x, _pdf_fit(_pdf_cell(row[index]), width))
+            for x, (_, index, width) in zip(x_positions, PDF_COLUMNS)
+        ])
+        if writer.pending >= _PDF_FLUSH_BYTES:
+            yield writer.drain()
+
+    if day_visits:
+        subtotal(day, day_visits, day_checked_out)
+    summary_line("Total", total_visits, total_checked_out)
+    finish_page()
+
+    # Every page is out: now the page count can be written
+    writer.stream(page_count_form, b'/Type /XObject /Subtype /Form /BBox [0 0 60 12] /Resources %s' % resources,
+                  b'BT /F1 %d Tf 0.40 g 0 0 Td (%d) Tj ET' % (PDF_FONT_SIZE, len(page_ids)))
+    writer.obj(pages_root, b'<< /Type /Pages /Count %d /Kids [%s] >>' % (
+        len(page_ids), b' '.join(b'%d 0 R' % page_id for page_id in page_ids)))
+    writer.obj(info, b'<< /Title (Visitor Report) /Producer (Visitor Tracker) /CreationDate (D:%s) >>'
+               % generated_at.strftime('%Y%m%d%H%M%SZ').encode('ascii'))
+    writer.finish(catalog, info)
+    yield writer.drain()
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Asynchronous report jobs for POST /api/reports
+A request records a job row and hands the work to a small process pool, so a long report
+ties up neither a request thread nor the GIL of an API worker. Job rows live in Postgres,
+so any worker can answer GET /api/reports/<id>, whichever one started the job.
+
+Finished files are cached on local disk under a key derived from the format, the query
+and the data version of the visitors in the report's date range (table_versions), so
+today's check-ins leave last month's report cached. The same report for unchanged data
+is served from the cache; a job for a key already being generated is shared instead of
+started twice. While that version cannot be used, the report is built but not shared. Least recently used files are removed once the cache passes
+REPORT_CACHE_MAX_MB.
+
+The cache is per host: with several API hosts, point REPORT_CACHE_DIR at shared storage.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import metrics
+import queries
+import report_export
+import serializers
+import table_versions
+
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 2))
+REPORT_CACHE_DIR = os.getenv('REPORT_CACHE_DIR', 'report_cache')
+REPORT_CACHE_MAX_MB = float(os.getenv('REPORT_CACHE_MAX_MB', 1024))
+# A job still pending or running after this long is reported as failed (its worker died)
+REPORT_JOB_TIMEOUT = float(os.getenv('REPORT_JOB_TIMEOUT', 1800))
+REPORT_JOB_RETENTION_DAYS = float(os.getenv('REPORT_JOB_RETENTION_DAYS', 7))
+
+# format -> (file extension, content type)
+FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'pdf': ('pdf', 'application/pdf'),
+}
+
+SETUP_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS report_jobs (
+        id TEXT PRIMARY KEY,
+        format TEXT NOT NULL,
+        cache_key TEXT NOT NULL,
+        filters TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        rows INTEGER,
+        bytes BIGINT,
+        error TEXT,
+        created_by INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    """,
+    # At most one unfinished job per report; a second request joins the first
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_report_jobs_active ON report_jobs (cache_key)
+    WHERE status IN ('pending', 'running')
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_report_jobs_created_at ON report_jobs (created_at)",
+]
+
+JOB_COLUMNS = "id, format, status, rows, bytes, error, cache_key, created_at, started_at, finished_at"
+
+INSERT_JOB = queries.statement("report_job_insert", f"""
+    INSERT INTO report_jobs (id, format, cache_key, filters, status, bytes, created_by, finished_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, CASE WHEN ? = 'done' THEN CURRENT_TIMESTAMP END)
+    ON CONFLICT (cache_key) WHERE status IN ('pending', 'running') DO NOTHING
+    RETURNING {JOB_COLUMNS}
+""")
+ACTIVE_JOB = queries.statement("report_job_active", f"""
+    SELECT {JOB_COLUMNS} FROM report_jobs WHERE cache_key = ? AND status IN ('pending', 'running')
+""")
+EXPIRE_STALE = queries.statement("report_job_expire_stale", """
+    UPDATE report_jobs SET status = 'failed', error = 'Timed out', finished_at = CURRENT_TIMESTAMP
+    WHERE cache_key = ? AND status IN ('pending', 'running')
+      AND created_at < CURRENT_TIMESTAMP - make_interval(secs => ?)
+""")
+GET_JOB = queries.statement("report_job_get", f"""
+    SELECT {JOB_COLUMNS},
+           status IN ('pending', 'running') AND created_at < CURRENT_TIMESTAMP - make_interval(secs => ?)
+    FROM report_jobs WHERE id = ?
+""")
+START_JOB = queries.statement("report_job_start", """
+    UPDATE report_jobs SET status = 'running', started_at = CURRENT_TIMESTAMP WHERE id = ?
+""")
+FINISH_JOB = queries.statement("report_job_finish", """
+    UPDATE report_jobs SET status = 'done', cache_key = ?, rows = ?, bytes = ?, finished_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+""")
+FAIL_JOB = queries.statement("report_job_fail", """
+    UPDATE report_jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+    WHERE id = ? AND status IN ('pending', 'running')
+""")
+PRUNE_JOBS = queries.statement("report_job_prune", """
+    DELETE FROM report_jobs WHERE created_at < CURRENT_TIMESTAMP - make_interval(secs => ?)
+""")
+
+
+def cache_key(fmt, sql, params, subtitle, version):
+    """Content address of a report: same format, query and data version give the same file"""
+    raw = json.dumps([fmt, sql, list(params), subtitle, version], default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def check_in_range(filters):
+    """[start, end) of check_in_time covered by a report's start_date/end_date filters (None for open)"""
+    start, end = filters.get('start_date'), filters.get('end_date')
+    start = datetime.strptime(start, '%Y-%m-%d') if start else None
+    end = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else None
+    return start, end
+
+
+def report_version(cursor, job_id, check_range):
+    """Data version a report is cached under; unique to the job while the real one is unsettled"""
+    version = table_versions.visitors_version(cursor, *check_range)
+    return version if version is not None else f"job-{job_id}"
+
+
+def job_dict(row):
+    """API representation of a report_jobs row (selected with JOB_COLUMNS)"""
+    job_id, fmt, status, rows, size, error, _, created_at, started_at, finished_at = row[:10]
+    if len(row) > 10 and row[10]:
+        status, error = 'failed', 'Timed out'
+    return {
+        "id": job_id,
+        "format": fmt,
+        "status": status,
+        "rows": rows,
+        "bytes": size,
+        "error": error,
+        "created_at": serializers.utc_iso(created_at) if created_at else None,
+        "started_at": serializers.utc_iso(started_at) if started_at else None,
+        "finished_at": serializers.utc_iso(finished_at) if finished_at else None,
+        "download_url": f"/api/reports/{job_id}/download" if status == 'done' else None,
+    }
+
+
+class ArtifactCache:
+    """Finished report files named by cache key; the least recently used go first"""
+
+    def __init__(self, directory=REPORT_CACHE_DIR, max_bytes=REPORT_CACHE_MAX_MB * 1048576):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key, fmt):
+        return os.path.join(self.directory, f"{key}.{FORMATS[fmt][0]}")
+
+    def get(self, key, fmt):
+        """Path of a cached file (marking it recently used), or None"""
+        path = self.path(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def store(self, key, fmt, chunks):
+        """Write a file from byte/str chunks; readers only ever see complete files. Returns its size"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key, fmt)
+        partial = f"{path}.{os.getpid()}.partial"
+        try:
+            with open(partial, 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            size = os.path.getsize(partial)
+            os.replace(partial, path)
+        except Exception:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        self.evict()
+        return size
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as scan:
+                return [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in scan if entry.is_file()]
+        except FileNotFoundError:
+            return []
+
+    def evict(self):
+        """Remove least recently used files until the cache fits max_bytes; returns files removed"""
+        entries = []
+        stale_before = time.time() - REPORT_JOB_TIMEOUT
+        for mtime, size, path in self._entries():
+            # Left behind by a generator that died mid-write
+            if path.endswith('.partial') and mtime < stale_before:
+                self._remove(path)
+            elif not path.endswith('.partial'):
+                entries.append((mtime, size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        # Oldest first; the newest file is kept even if it alone is over the limit
+        for mtime, size, path in sorted(entries)[:-1]:
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+                removed += 1
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stats(self):
+        entries = [entry for entry in self._entries() if not entry[2].endswith('.partial')]
+        return {
+            "files": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": int(self.max_bytes),
+        }
+
+
+# --- Runs in the pool's worker processes ---
+
+_worker_conn = None
+
+
+def _worker_connection():
+    """One connection per pool process, reused across jobs"""
+    global _worker_conn
+    if _worker_conn is None or _worker_conn.closed:
+        from db import get_db_connection
+        _worker_conn = get_db_connection()
+    return _worker_conn
+
+
+def generate(job_id, fmt, sql, params, subtitle, check_range=(None, None)):
+    """Build one report into the cache and record the outcome on its job row
+
+    Returns (seconds, bytes) when a file was built, for the API process's metrics.
+    """
+    conn = _worker_connection()
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    try:
+        queries.run(cursor, START_JOB, (job_id,))
+        conn.commit()
+
+        # The version and the rows come from one snapshot, so the file is cached under
+        # exactly the data it contains (the version may be newer than when the job was queued)
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        try:
+            key = cache_key(fmt, sql, params, subtitle, report_version(cursor, job_id, check_range))
+            cache = ArtifactCache()
+            counted = [0]
+
+            def rows():
+                for row in report_export.iter_rows(row_cursor):
+                    counted[0] += 1
+                    yield row
+
+            if cache.get(key, fmt):
+                size, count = os.path.getsize(cache.path(key, fmt)), None
+            else:
+                row_cursor = report_export.open_report_cursor(conn)
+                queries.run(row_cursor, queries.dynamic(sql, 'visitor_report'), tuple(params))
+                if fmt == 'excel':
+                    chunks = report_export.stream_xlsx(rows())
+                elif fmt == 'pdf':
+                    chunks = report_export.stream_pdf(rows(), subtitle)
+                else:
+                    chunks = report_export.stream_csv(rows())
+                size = cache.store(key, fmt, chunks)
+                count = counted[0]
+            conn.commit()
+        finally:
+            conn.rollback()
+            conn.set_session(isolation_level='DEFAULT', readonly=False)
+
+        queries.run(cursor, FINISH_JOB, (key, count, size, job_id))
+        conn.commit()
+        seconds = time.perf_counter() - started
+        print(f"INFO: Report {job_id} ({fmt}) done: {count if count is not None else 'cached'} rows, "
+              f"{size} bytes in {seconds:.2f}s")
+        return (seconds, size) if count is not None else None
+    except Exception as e:
+        conn.rollback()
+        print(f"WARNING: Report {job_id} ({fmt}) failed: {e}")
+        queries.run(cursor, FAIL_JOB, (str(e), job_id))
+        conn.commit()
+
+
+# --- Runs in the API process ---
+
+class ReportJobs:
+    """Queues report jobs on a per-process pool and serves finished files from the cache"""
+
+    def __init__(self, connect, workers=REPORT_WORKERS, cache=None):
+        self._connect = connect
+        self.workers = workers
+        self.cache = cache or ArtifactCache()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+        self._counts = {"submitted": 0, "joined": 0, "cache_hits": 0, "pool_errors": 0}
+
+    def _get_executor(self):
+        # Pools do not survive fork. Spawned children start clean instead of inheriting this
+        # process's threads, pooled connections and locks.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def submit(self, conn, fmt, sql, params, subtitle=None, filters=None, user_id=None):
+        """Start (or join, or answer from the cache) a report; returns (job dict, queued now)"""
+        cursor = conn.cursor()
+        if time.monotonic() >= self._next_prune:
+            queries.run(cursor, PRUNE_JOBS, (REPORT_JOB_RETENTION_DAYS * 86400,))
+            self._next_prune = time.monotonic() + 3600
+
+        filters = filters or {}
+        check_range = check_in_range(filters)
+        job_id = uuid.uuid4().hex
+        key = cache_key(fmt, sql, params, subtitle, report_version(cursor, job_id, check_range))
+        path = self.cache.get(key, fmt)
+        status = 'done' if path else 'pending'
+        size = os.path.getsize(path) if path else None
+        filters = json.dumps(filters, default=str)
+
+        queries.run(cursor, EXPIRE_STALE, (key, REPORT_JOB_TIMEOUT))
+        row = None
+        inserted = False
+        # The join can miss if the running job finishes between the two statements; try again
+        for _ in range(3):
+            queries.run(cursor, INSERT_JOB, (job_id, fmt, key, filters, status, size, user_id, status))
+            row = cursor.fetchone()
+            inserted = row is not None
+            if inserted:
+                break
+            # Someone asked for the same report moments ago; share their job
+            queries.run(cursor, ACTIVE_JOB, (key,))
+            row = cursor.fetchone()
+            if row is not None:
+                break
+        conn.commit()
+        if row is None:
+            raise RuntimeError("Could not create report job")
+
+        job = job_dict(row)
+        if not inserted:
+            self._count("joined")
+            return job, False
+        if status == 'done':
+            self._count("cache_hits")
+            return job, False
+
+        try:
+            future = self._get_executor().submit(generate, job["id"], fmt, sql, list(params), subtitle, check_range)
+        except Exception as e:
+            self._fail(job["id"], e)
+            raise
+        future.add_done_callback(lambda f: self._finished(job["id"], fmt, f))
+        self._count("submitted")
+        return job, True
+
+    def _finished(self, job_id, fmt, future):
+        """Record a built report's time and size; generate() records its own errors, this catches a dead pool process"""
+        error = future.exception()
+        if error is None:
+            if future.result():
+                metrics.observe_report(fmt, 'job', *future.result())
+            return
+        print(f"WARNING: Report {job_id} worker failed: {error}")
+        self._count("pool_errors")
+        with self._lock:
+            # A broken pool refuses new work; the next submit starts a fresh one
+            self._pid = None
+        self._fail(job_id, error)
+
+    def _fail(self, job_id, error):
+        try:
+            conn = self._connect()
+            try:
+                queries.run(conn.cursor(), FAIL_JOB, (str(error) or type(error).__name__, job_id))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"WARNING: Could not mark report {job_id} failed: {e}")
+
+    def get(self, cursor, job_id):
+        """Job dict, or None for an unknown id"""
+        queries.run(cursor, GET_JOB, (REPORT_JOB_TIMEOUT, job_id))
+        row = cursor.fetchone()
+        return job_dict(row) if row else None
+
+    def artifact(self, cursor, job_id):
+        """(job dict, path of its file or None if evicted); job is None for an unknown id"""
+        queries.run(cursor, GET_JOB, (REPORT_JOB_TIMEOUT, job_id))
+        row = cursor.fetchone()
+        if row is None:
+            return None, None
+        job = job_dict(row)
+        if job["status"] != 'done':
+            return job, None
+        return job, self.cache.get(row[6], job["format"])
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts["workers"] = self.workers
+        counts["cache"] = self.cache.stats()
+        return counts
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Daily visitor rollups backing GET /api/visitors/stats
+Maintained incrementally by the visitor write endpoints; rebuild for backfill with:
+
+    python rollups.py --rebuild [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+
+Days are the UTC date of check_in_time (timestamps are stored in UTC). Check-ins are
+also counted per day and purpose in visitor_daily_purposes, for the purpose breakdown.
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+import queries
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS visitor_daily_stats (
+        day DATE PRIMARY KEY,
+        check_ins INTEGER NOT NULL DEFAULT 0,
+        check_outs INTEGER NOT NULL DEFAULT 0,
+        total_duration_seconds DOUBLE PRECISION NOT NULL DEFAULT 0
+    )
+"""
+
+PURPOSES_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS visitor_daily_purposes (
+        day DATE NOT NULL,
+        purpose TEXT NOT NULL,
+        check_ins INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, purpose)
+    )
+"""
+
+PURPOSE_UPSERT = queries.statement("rollup_purpose_upsert", """
+    INSERT INTO visitor_daily_purposes AS p (day, purpose, check_ins)
+    VALUES (?::date, ?, ?)
+    ON CONFLICT (day, purpose) DO UPDATE SET check_ins = p.check_ins + EXCLUDED.check_ins
+""")
+
+UPSERT = queries.statement("rollup_upsert", """
+    INSERT INTO visitor_daily_stats AS s (day, check_ins, check_outs, total_duration_seconds)
+    VALUES (?::date, ?, ?, ?)
+    ON CONFLICT (day) DO UPDATE SET
+        check_ins = s.check_ins + EXCLUDED.check_ins,
+        check_outs = s.check_outs + EXCLUDED.check_outs,
+        total_duration_seconds = s.total_duration_seconds + EXCLUDED.total_duration_seconds
+""")
+
+
+def _duration_seconds(check_in_time, check_out_time):
+    return max((check_out_time - check_in_time).total_seconds(), 0.0)
+
+
+def _record_purposes(cursor, visits, delta):
+    """Add delta per (check_in_time, purpose) visit, one upsert per distinct day and purpose"""
+    per_key = {}
+    for check_in_time, purpose in visits:
+        if check_in_time is not None:
+            key = (check_in_time.date(), purpose or '')
+            per_key[key] = per_key.get(key, 0) + delta
+    for (day, purpose), count in sorted(per_key.items()):
+        queries.run(cursor, PURPOSE_UPSERT, (day, purpose, count))
+
+
+def record_check_in(cursor, check_in_time, purpose):
+    """Count a new visit on its check-in day (call inside the INSERT's transaction)"""
+    if check_in_time is None:
+        return
+    queries.run(cursor, UPSERT, (check_in_time, 1, 0, 0.0))
+    _record_purposes(cursor, [(check_in_time, purpose)], 1)
+
+
+def record_check_ins(cursor, visits):
+    """Count a batch of new (check_in_time, purpose) visits with one upsert per distinct check-in day"""
+    per_day = {}
+    for check_in_time, _ in visits:
+        if check_in_time is not None:
+            per_day[check_in_time.date()] = per_day.get(check_in_time.date(), 0) + 1
+    for day, count in sorted(per_day.items()):
+        queries.run(cursor, UPSERT, (day, count, 0, 0.0))
+    _record_purposes(cursor, visits, 1)
+
+
+def record_check_out(cursor, check_in_time, check_out_time):
+    """Count a completed visit and its duration on its check-in day"""
+    if check_in_time is None or check_out_time is None:
+        return
+    queries.run(cursor, UPSERT, (check_in_time, 0, 1, _duration_seconds(check_in_time, check_out_time)))
+
+
+def record_check_outs(cursor, visits):
+    """Count a batch of completed (check_in_time, check_out_time) visits, one upsert per check-in day"""
+    per_day = {}
+    for check_in_time, check_out_time in visits:
+        if check_in_time is None or check_out_time is None:
+            continue
+        count, seconds = per_day.get(check_in_time.date(), (0, 0.0))
+        per_day[check_in_time.date()] = (count + 1, seconds + _duration_seconds(check_in_time, check_out_time))
+    for day, (count, seconds) in sorted(per_day.items()):
+        queries.run(cursor, UPSERT, (day, 0, count, seconds))
+
+
+def record_delete(cursor, check_in_time, check_out_time, purpose):
+    """Remove a deleted visit from its day's totals"""
+    if check_in_time is None:
+        return
+    _record_purposes(cursor, [(check_in_time, purpose)], -1)
+    if check_out_time is None:
+        queries.run(cursor, UPSERT, (check_in_time, -1, 0, 0.0))
+    else:
+        queries.run(cursor, UPSERT, (check_in_time, -1, -1, -_duration_seconds(check_in_time, check_out_time)))
+
+
+def _rebuild_range(start_date, end_date):
+    """(day WHERE clause, visits WHERE clause, params) for rebuilding [start_date, end_date]"""
+    day_conditions = []
+    visit_conditions = ["check_in_time IS NOT NULL"]
+    params = []
+    if start_date:
+        day_conditions.append("day >= %s")
+        visit_conditions.append("check_in_time >= %s")
+        params.append(start_date)
+    if end_date:
+        day_conditions.append("day <= %s")
+        visit_conditions.append("check_in_time < %s::date + 1")
+        params.append(end_date)
+    day_where = (" WHERE " + " AND ".join(day_conditions)) if day_conditions else ""
+    return day_where, " AND ".join(visit_conditions), tuple(params)
+
+
+def rebuild_daily_stats(cursor, start_date=None, end_date=None):
+    """Recompute visitor_daily_stats from the visitors table for [start_date, end_date] (all days if omitted)"""
+    day_where, visit_where, params = _rebuild_range(start_date, end_date)
+
+    # Block incremental updates until this transaction commits, so none are lost or double counted
+    cursor.execute("LOCK TABLE visitor_daily_stats IN EXCLUSIVE MODE")
+    cursor.execute("DELETE FROM visitor_daily_stats" + day_where, params)
+    cursor.execute(f"""
+        INSERT INTO visitor_daily_stats (day, check_ins, check_outs, total_duration_seconds)
+        SELECT
+            check_in_time::date,
+            COUNT(*),
+            COUNT(check_out_time),
+            COALESCE(SUM(GREATEST(EXTRACT(EPOCH FROM (check_out_time - check_in_time)), 0)), 0)
+        FROM visitors
+        WHERE {visit_where}
+        GROUP BY check_in_time::date
+    """, params)
+    return cursor.rowcount
+
+
+def rebuild_daily_purposes(cursor, start_date=None, end_date=None):
+    """Recompute visitor_daily_purposes for [start_date, end_date] (all days if omitted)"""
+    day_where, visit_where, params = _rebuild_range(start_date, end_date)
+    cursor.execute("LOCK TABLE visitor_daily_purposes IN EXCLUSIVE MODE")
+    cursor.execute("DELETE FROM visitor_daily_purposes" + day_where, params)
+    cursor.execute(f"""
+        INSERT INTO visitor_daily_purposes (day, purpose, check_ins)
+        SELECT check_in_time::date, COALESCE(purpose, ''), COUNT(*)
+        FROM visitors
+        WHERE {visit_where}
+        GROUP BY check_in_time::date, COALESCE(purpose, '')
+    """, params)
+
+
+def rebuild(cursor, start_date=None, end_date=None):
+    """Recompute both rollup tables for [start_date, end_date]; returns the days rebuilt"""
+    days = rebuild_daily_stats(cursor, start_date, end_date)
+    rebuild_daily_purposes(cursor, start_date, end_date)
+    return days
+
+
+def query_stats(cursor, start_date=None, end_date=None, group='day'):
+    """Aggregate rollups for a date range into the /api/visitors/stats payload"""
+    conditions = []
+    params = []
+    if start_date:
+        conditions.append("day >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append("day <= ?")
+        params.append(end_date)
+    where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+    bucket = "date_trunc('month', day)::date" if group == 'month' else "day"
+
+    queries.run(cursor, queries.dynamic(f"""
+        SELECT {bucket} AS bucket, SUM(check_ins), SUM(check_outs), SUM(total_duration_seconds)
+        FROM visitor_daily_stats{where}
+        GROUP BY bucket
+        ORDER BY bucket
+    """, 'visitor_stats'), tuple(params))
+    rows = cursor.fetchall()
+
+    def avg_minutes(total_seconds, completed):
+        return round(total_seconds / completed / 60, 1) if completed else None
+
+    buckets = []
+    total_visits = total_checked_out = 0
+    total_seconds = 0.0
+    for bucket, check_ins, check_outs, seconds in rows:
+        if not check_ins and not check_outs:
+            continue
+        total_visits += check_ins
+        total_checked_out += check_outs
+        total_seconds += seconds
+        buckets.append({
+            "date": bucket.isoformat(),
+            "visits": int(check_ins),
+            "checked_out": int(check_outs),
+            "avg_duration_minutes": avg_minutes(seconds, check_outs)
+        })
+
+    queries.run(cursor, queries.dynamic(f"""
+        SELECT purpose, SUM(check_ins) AS visits
+        FROM visitor_daily_purposes{where}
+        GROUP BY purpose
+        HAVING SUM(check_ins) > 0
+        ORDER BY visits DESC, purpose
+    """, 'visitor_stats_purposes'), tuple(params))
+    purposes = [{"purpose": purpose, "visits": int(visits)} for purpose, visits in cursor.fetchall()]
+
+    return {
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "group": group,
+        "total_visits": int(total_visits),
+        "checked_out": int(total_checked_out),
+        "currently_inside": int(total_visits - total_checked_out),
+        "avg_duration_minutes": avg_minutes(total_seconds, total_checked_out),
+        "series": buckets,
+        "purposes": purposes
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain the visitor_daily_stats rollup table")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute rollups from the visitors table")
+    parser.add_argument('--start', help="First day to rebuild (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Last day to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        sys.exit(1)
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from db import get_db_connection
+
+    start = datetime.strptime(args.start, '%Y-%m-%d').date() if args.start else None
+    end = datetime.strptime(args.end, '%Y-%m-%d').date() if args.end else None
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(CREATE_TABLE_SQL)
+        cursor.execute(PURPOSES_TABLE_SQL)
+        days = rebuild(cursor, start, end)
+        conn.commit()
+        print(f"✓ Rebuilt visitor_daily_stats and visitor_daily_purposes ({days} days)")
+    except Exception as e:
+        conn.rollback()
+        print(f"✗ Error rebuilding rollups: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Ranked visitor search for GET /api/visitors/search
+Name, email, phone, company and host are folded into one lower-cased document by an
+IMMUTABLE function. An expression GIN index over it serves every query:
+
+- trigram (pg_trgm): fuzzy word matches (`<%`) plus plain substring matches, so typos
+  and phone or email fragments are found. Substring hits rank above fuzzy ones.
+- full-text: used when pg_trgm cannot be installed. Every query word must match the
+  start of a word.
+
+A migration builds whichever index it can. Searches use whichever index exists. To switch to
+trigram after installing pg_trgm, drop idx_visitors_search_fts and run
+`python migrations.py --redo 6`, then restart.
+
+Every match is ranked in SQL and pages are keyset-paginated on (rank, check_in_time, id),
+so the best match among the newest SEARCH_MAX_CANDIDATES matches comes first. The cap
+bounds the cost of very broad queries ("sanjay"); the response says `truncated` when more
+rows matched than were ranked. SEARCH_MAX_CANDIDATES=0 ranks every match.
+"""
+
+import base64
+import json
+import os
+import re
+from datetime import datetime
+
+import queries
+
+SEARCH_MIN_LENGTH = int(os.getenv('SEARCH_MIN_LENGTH', 3))
+SEARCH_PAGE_DEFAULT = int(os.getenv('SEARCH_PAGE_DEFAULT', 20))
+SEARCH_PAGE_MAX = int(os.getenv('SEARCH_PAGE_MAX', 100))
+# pg_trgm word similarity (0-1) a fuzzy match needs; lower finds more, and slower
+SEARCH_SIMILARITY = float(os.getenv('SEARCH_SIMILARITY', 0.5))
+# Newest matches ranked per search; 0 ranks them all
+SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', 5000))
+
+DOCUMENT = "visitor_search_document(name, email, phone, company, host_name)"
+
+DOCUMENT_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION visitor_search_document(name text, email text, phone text, company text, host_name text)
+    RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT lower(coalesce(name, '') || ' ' || coalesce(email, '') || ' ' || coalesce(phone, '') || ' ' ||
+                     coalesce(company, '') || ' ' || coalesce(host_name, ''))
+    $$
+"""
+
+TRIGRAM_SETUP_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS idx_visitors_search_trgm ON visitors USING gin ({DOCUMENT} gin_trgm_ops)",
+]
+
+FULLTEXT_SETUP_SQL = [
+    f"CREATE INDEX IF NOT EXISTS idx_visitors_search_fts ON visitors USING gin (to_tsvector('simple', {DOCUMENT}))",
+]
+
+MODE = queries.statement("search_mode", "SELECT to_regclass('idx_visitors_search_trgm') IS NOT NULL")
+SET_SIMILARITY = queries.statement("search_set_similarity", """
+    SELECT set_config('pg_trgm.word_similarity_threshold', ?, true)
+""")
+
+# (match condition, rank expression); both take the query text as parameters
+_TRIGRAM = (
+    f"(? <% {DOCUMENT} OR {DOCUMENT} LIKE ?)",
+    f"(word_similarity(?, {DOCUMENT}) + CASE WHEN {DOCUMENT} LIKE ? THEN 1 ELSE 0 END)::real",
+)
+_FULLTEXT = (
+    f"to_tsvector('simple', {DOCUMENT}) @@ to_tsquery('simple', ?)",
+    f"ts_rank(to_tsvector('simple', {DOCUMENT}), to_tsquery('simple', ?))",
+)
+
+_mode = None
+
+
+def search_mode(cursor):
+    """'trigram' or 'fulltext', depending on which index was built (checked once per process)"""
+    global _mode
+    if _mode is None:
+        queries.run(cursor, MODE)
+        _mode = 'trigram' if cursor.fetchone()[0] else 'fulltext'
+    return _mode
+
+
+def _like_pattern(text):
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _fulltext_query(text):
+    """Every word as a prefix match: 'ana sha' -> 'ana:* & sha:*'"""
+    return ' & '.join(f"{word}:*" for word in re.findall(r'\w+', text))
+
+
+def clean_query(q):
+    """Normalised search text; ValueError if it is too short to use the index"""
+    text = ' '.join((q or '').lower().split())
+    if len(re.sub(r'\W', '', text)) < SEARCH_MIN_LENGTH:
+        raise ValueError(f"q must contain at least {SEARCH_MIN_LENGTH} letters or digits")
+    return text
+
+
+def encode_cursor(rank, check_in_time, visitor_id):
+    raw = json.dumps([rank, check_in_time.isoformat(), visitor_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        rank, check_in_time, visitor_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return float(rank), datetime.fromisoformat(check_in_time), int(visitor_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def search(cursor, q, conditions=(), params=(), after=None, limit=SEARCH_PAGE_DEFAULT):
+    """One page of matches, best first: (visitor row tuples, next cursor or None, truncated)
+
+    conditions/params are extra `?` filters on visitors columns (dates, status, ...).
+    truncated is True when SEARCH_MAX_CANDIDATES cut off older matches before ranking.
+    """
+    text = clean_query(q)
+    mode = search_mode(cursor)
+    if mode == 'trigram':
+        queries.run(cursor, SET_SIMILARITY, (str(SEARCH_SIMILARITY),))
+        match, rank = _TRIGRAM
+        pattern = _like_pattern(text)
+        match_values = rank_values = [text, pattern]
+    else:
+        match, rank = _FULLTEXT
+        match_values = rank_values = [_fulltext_query(text)]
+
+    capped = SEARCH_MAX_CANDIDATES > 0
+    columns = queries.VISITOR_COLUMNS
+    newest = "check_in_time DESC, id DESC"
+    position = f"ROW_NUMBER() OVER (ORDER BY {newest})" if capped else "0"
+    candidates = (f"SELECT {columns}, {position} AS position FROM visitors WHERE " +
+                  " AND ".join([match, *conditions]))
+    values = [*rank_values, *match_values, *params]
+    filters = []
+    if capped:
+        # One extra candidate says whether any were cut off; it is counted, not ranked
+        candidates += f" ORDER BY {newest} LIMIT ?"
+        values.append(SEARCH_MAX_CANDIDATES + 1)
+        filters.append("position <= ?")
+        values.append(SEARCH_MAX_CANDIDATES)
+    total = "COUNT(*) OVER ()" if capped else "0"
+    sql = (f"SELECT {columns}, candidates, rank FROM "
+           f"(SELECT c.*, {total} AS candidates, {rank} AS rank FROM ({candidates}) AS c) AS matches")
+    if after:
+        filters.append("(rank, check_in_time, id) < (?::real, ?, ?)")
+        values.extend(after)
+    if filters:
+        sql += " WHERE " + " AND ".join(filters)
+    # One extra row says whether there is another page
+    sql += " ORDER BY rank DESC, check_in_time DESC, id DESC LIMIT ?"
+    values.append(limit + 1)
+
+    queries.run(cursor, queries.dynamic(sql, f'visitor_search_{mode}'), tuple(values))
+    rows = cursor.fetchall()
+    truncated = bool(rows) and rows[0][-2] > SEARCH_MAX_CANDIDATES if capped else False
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][-1], rows[-1][5], rows[-1][0])
+    return [row[:-2] for row in rows], next_cursor, truncated
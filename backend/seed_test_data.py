@@ -11,11 +11,14 @@ from datetime import datetime, timedelta
 # Ensure we can import from backend
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from api_server import get_db_connection
+from db import get_db_connection
+from auth import hash_password
+import migrations
 
 def seed_test_data():
     try:
         conn = get_db_connection()
+        migrations.ensure_current(conn)
         cursor = conn.cursor()
 
         print("Connected to database successfully")
@@ -59,7 +62,7 @@ def seed_test_data():
                 """, (
                     user['name'],
                     user['email'],
-                    user['password'],
+                    hash_password(user['password']),
                     user['role'],
                     user['status'],
                     now,
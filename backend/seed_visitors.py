@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Synthetic visitor data for capacity testing, loaded through COPY FROM STDIN
+Rows are generated in check-in order and streamed straight into COPY, so millions of
+visitors load without building them in memory. The same --seed and --end always give the
+same visitors, however many --workers load them.
+
+    python seed_visitors.py --count 1000000 [--days 365] [--seed 42] [--open-share 0.02]
+        [--repeat-share 0.35] [--hosts 40] [--purposes Meeting=35,Delivery=25,...]
+        [--peak-hour 19] [--peak-factor 2.5] [--duration-median 40] [--duration-sigma 0.8]
+        [--workers 4] [--rebuild-search-index]
+    python seed_visitors.py --count 100000 --end 2025-12-31 --output visitors.tsv   # COPY text only
+
+The shape of the data:
+- arrivals follow an hourly profile: quiet nights, a daytime plateau and an evening peak
+  (--peak-hour, --peak-factor); weekends get WEEKEND_FACTOR of a weekday's visits
+- visit length is log-normal around --duration-median minutes, capped at MAX_VISIT_HOURS
+- --open-share of visits never check out, and visits still running at the end are open
+- --repeat-share of visits are by someone who came before, favouring regulars
+- hosts follow a Zipf-like mix (a few hosts get most visitors); purposes use --purposes
+
+Monthly partitions for the range are created first, and the daily rollups for the range
+are rebuilt afterwards.
+"""
+
+import argparse
+import bisect
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import partitions
+import rollups
+import search
+
+DEFAULT_PURPOSES = {'Meeting': 35, 'Delivery': 25, 'Visit': 20, 'Interview': 10, 'Maintenance': 10}
+DEFAULT_HOSTS = 40
+DEFAULT_OPEN_SHARE = 0.02
+DEFAULT_REPEAT_SHARE = 0.35
+DEFAULT_PEAK_HOUR = 19
+DEFAULT_PEAK_FACTOR = 2.5
+DEFAULT_DURATION_MEDIAN = 40
+DEFAULT_DURATION_SIGMA = 0.8
+WEEKEND_FACTOR = 0.6
+MAX_VISIT_HOURS = 12
+# Average visits per regular visitor, which sizes the pool returning visits come from
+REGULAR_VISITS = 20
+# COPY text format's NULL marker
+NULL = '\\N'
+
+COLUMNS = ('name', 'email', 'phone', 'purpose', 'check_in_time', 'check_out_time', 'host_name', 'company')
+
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Akash', 'Ananya', 'Arjun', 'Bhavna', 'Chetan', 'Deepa', 'Divya', 'Farhan',
+    'Gauri', 'Harish', 'Isha', 'Jaya', 'Karan', 'Kavya', 'Lakshmi', 'Manish', 'Meera', 'Neha',
+    'Nikhil', 'Omkar', 'Pooja', 'Priya', 'Rahul', 'Riya', 'Rohan', 'Sanjay', 'Sneha', 'Suresh',
+    'Tanvi', 'Uday', 'Varun', 'Vidya', 'Yash', 'Zoya', 'Anil', 'Rekha', 'Sunil', 'Kiran',
+]
+LAST_NAMES = [
+    'Agarwal', 'Bhat', 'Chavan', 'Desai', 'Gupta', 'Iyer', 'Jain', 'Joshi', 'Kulkarni', 'Kumar',
+    'Mehta', 'Menon', 'Nair', 'Patel', 'Patil', 'Rao', 'Reddy', 'Shah', 'Sharma', 'Singh',
+    'Shinde', 'Verma', 'Pawar', 'Kapoor', 'Khan', 'Mishra', 'Naidu', 'Pillai', 'Sawant', 'More',
+]
+COMPANIES = [
+    'Acme Logistics', 'BlueDart', 'Infosys', 'Tata Consultancy', 'Wipro', 'Zomato', 'Swiggy',
+    'Amazon', 'Flipkart', 'Reliance Digital', 'City Plumbing', 'Sai Electricals', 'Mahindra',
+    'HDFC Bank', 'Bajaj Finserv', 'Urban Company', 'Dunzo', 'Apollo Clinics', 'Godrej', 'Asian Paints',
+]
+EMAIL_DOMAINS = ['gmail.com', 'yahoo.co.in', 'outlook.com', 'rediffmail.com', 'example.com']
+
+
+def parse_purposes(text):
+    """'Meeting=35,Delivery=25' -> {'Meeting': 35.0, 'Delivery': 25.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if not name.strip() or not weight:
+            raise ValueError(f"Invalid purpose weight {part!r}: expected Name=weight")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def hourly_profile(peak_hour=DEFAULT_PEAK_HOUR, peak_factor=DEFAULT_PEAK_FACTOR):
+    """Relative arrivals for each hour of the day"""
+    weights = []
+    for hour in range(24):
+        # Quiet before 7 and after 22, a plateau in between, plus a bump around peak_hour
+        base = 1.0 if 8 <= hour <= 21 else 0.4 if hour in (7, 22) else 0.05
+        bump = (peak_factor - 1) * math.exp(-((hour - peak_hour) ** 2) / 2.0)
+        weights.append(base * (1 + bump))
+    return weights
+
+
+class VisitorGenerator:
+    """Deterministic visitor rows as COPY text lines, generated month by month
+
+    Each month has its own random stream, seeded from --seed and the month, so a month's
+    rows are the same whether it is generated alone, in a worker or in sequence.
+    """
+
+    def __init__(self, count, days=365, end=None, seed=42, open_share=DEFAULT_OPEN_SHARE,
+                 repeat_share=DEFAULT_REPEAT_SHARE, hosts=DEFAULT_HOSTS, purposes=None,
+                 peak_hour=DEFAULT_PEAK_HOUR, peak_factor=DEFAULT_PEAK_FACTOR,
+                 duration_median=DEFAULT_DURATION_MEDIAN, duration_sigma=DEFAULT_DURATION_SIGMA):
+        self.count = count
+        # Up to `end` (default: now), from midnight `days` days before it
+        self.end = end or datetime.utcnow().replace(microsecond=0)
+        self.start = datetime.combine(self.end.date() - timedelta(days=days), datetime.min.time())
+        self.seed = seed
+        self.open_share = open_share
+        self.repeat_share = repeat_share
+        # Returning visits come from this many regulars (about REGULAR_VISITS visits each)
+        self.regulars = max(100, int(count * repeat_share / REGULAR_VISITS))
+        self.duration_mu = math.log(duration_median)
+        self.duration_sigma = duration_sigma
+        self.profile = hourly_profile(peak_hour, peak_factor)
+
+        purposes = purposes or DEFAULT_PURPOSES
+        self._purposes = list(purposes)
+        self._purpose_weights = self._cumulative(purposes.values())
+        self._hosts = [f"{FIRST_NAMES[i * 7 % len(FIRST_NAMES)]} {LAST_NAMES[i * 11 % len(LAST_NAMES)]}"
+                       for i in range(hosts)]
+        self._host_weights = self._cumulative(1 / (rank + 1) ** 1.1 for rank in range(hosts))
+
+    @staticmethod
+    def _cumulative(weights):
+        total = 0.0
+        cumulative = []
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+        return cumulative
+
+    def months(self):
+        """{first day of month: [(hour, rows), ...]}, with rows summing exactly to count"""
+        slots = []
+        hour = self.start
+        while hour < self.end:
+            weight = self.profile[hour.hour] * (WEEKEND_FACTOR if hour.weekday() >= 5 else 1.0)
+            slots.append((hour, weight))
+            hour += timedelta(hours=1)
+        total = sum(weight for _, weight in slots) or 1.0
+        months = {}
+        cumulative = 0.0
+        emitted = 0
+        for hour, weight in slots:
+            # Round the running total, not each slot, so the rows add up to count exactly
+            cumulative += weight
+            rows = round(self.count * cumulative / total) - emitted
+            emitted += rows
+            months.setdefault(hour.date().replace(day=1), []).append((hour, rows))
+        return months
+
+    @staticmethod
+    def _person(person_id):
+        """Name, email and phone (as COPY fields) and company of a person, derived from their id alone"""
+        mixed = (person_id * 2654435761) & 0xFFFFFFFF
+        first = FIRST_NAMES[mixed % len(FIRST_NAMES)]
+        last = LAST_NAMES[(mixed >> 8) % len(LAST_NAMES)]
+        domain = EMAIL_DOMAINS[(mixed >> 16) % len(EMAIL_DOMAINS)]
+        company = COMPANIES[(mixed >> 20) % len(COMPANIES)] if mixed % 10 >= 3 else NULL
+        return (f"{first} {last}\t{first.lower()}.{last.lower()}{person_id}@{domain}\t"
+                f"9{(person_id * 7919 + 1000003) % 1000000000:09d}"), company
+
+    def lines(self, months=None):
+        """Yield one COPY text line (with newline) per visitor, for the given months (default: all)"""
+        plan = self.months()
+        for month in sorted(months if months is not None else plan):
+            yield from self._month_lines(month, plan[month], sorted(plan).index(month))
+
+    def _month_lines(self, month, slots, month_index):
+        rng = random.Random(f"{self.seed}:{month.isoformat()}")
+        rand = rng.random
+        gauss = rng.gauss
+        exp = math.exp
+        pick = bisect.bisect
+        purposes, purpose_weights = self._purposes, self._purpose_weights
+        hosts, host_weights = self._hosts, self._host_weights
+        purpose_total, host_total = purpose_weights[-1], host_weights[-1]
+        mu, sigma = self.duration_mu, self.duration_sigma
+        open_share, repeat_share, regulars = self.open_share, self.repeat_share, self.regulars
+        max_seconds = MAX_VISIT_HOURS * 3600
+        person = self._person
+        regular_cache = {}
+        # First-time visitors get ids no other month uses
+        next_person = regulars + month_index * self.count
+
+        # Timestamps are built from cached strings; check-outs may run into the next days
+        first_day = slots[0][0].date()
+        days = [(first_day + timedelta(days=offset)).isoformat() for offset in range(40)]
+        end_offset = int((self.end - datetime.combine(first_day, datetime.min.time())).total_seconds())
+
+        for hour, rows in slots:
+            if not rows:
+                continue
+            hour_offset = int((hour - datetime.combine(first_day, datetime.min.time())).total_seconds())
+            # The last slot may be cut short by `end`
+            span = min(3600, end_offset - hour_offset + 1)
+            for second in sorted(int(rand() * span) for _ in range(rows)):
+                if rand() < repeat_share:
+                    # Regulars: low ids come back far more often than the rest
+                    person_id = int(regulars * rand() ** 3) + 1
+                    identity = regular_cache.get(person_id)
+                    if identity is None:
+                        identity = regular_cache[person_id] = person(person_id)
+                else:
+                    next_person += 1
+                    identity = person(next_person)
+
+                check_in = hour_offset + second
+                day, time_of_day = divmod(check_in, 86400)
+                check_in_text = f"{days[day]} {_CLOCK[time_of_day // 60]}{_SECONDS[time_of_day % 60]}"
+                check_out_text = NULL
+                if rand() >= open_share:
+                    check_out = check_in + min(int(exp(gauss(mu, sigma)) * 60), max_seconds)
+                    if check_out <= end_offset:
+                        day, time_of_day = divmod(check_out, 86400)
+                        check_out_text = f"{days[day]} {_CLOCK[time_of_day // 60]}{_SECONDS[time_of_day % 60]}"
+
+                yield (f"{identity[0]}\t{purposes[pick(purpose_weights, rand() * purpose_total)]}\t"
+                       f"{check_in_text}\t{check_out_text}\t{hosts[pick(host_weights, rand() * host_total)]}\t"
+                       f"{identity[1]}\n")
+
+
+# "HH:MM" for every minute of the day and ":SS" for every second
+_CLOCK = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(1440)]
+_SECONDS = [f":{second:02d}" for second in range(60)]
+
+
+class _LineReader(io.TextIOBase):
+    """File-like view of an iterator of lines, read by COPY in chunks"""
+
+    def __init__(self, lines, chunk_rows=4096):
+        super().__init__()
+        self._lines = lines
+        self._chunk_rows = chunk_rows
+        self._buffer = ''
+        self._done = False
+        self.rows = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            chunk = list(itertools.islice(self._lines, self._chunk_rows))
+            if not chunk:
+                self._done = True
+                break
+            self.rows += len(chunk)
+            self._buffer += ''.join(chunk)
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def copy_months(conn, generator, months):
+    """COPY the given months, committing after each; returns rows loaded"""
+    cursor = conn.cursor()
+    loaded = 0
+    for month in sorted(months):
+        reader = _LineReader(generator.lines([month]))
+        cursor.copy_expert(f"COPY visitors ({', '.join(COLUMNS)}) FROM STDIN", reader, size=65536)
+        conn.commit()
+        loaded += reader.rows
+    return loaded
+
+
+def _copy_worker(generator, months):
+    """Pool entry point: COPY some months over this process's own connection"""
+    import psycopg2
+    conn = psycopg2.connect(os.getenv('DATABASE_URL') or os.getenv('Database_URL'))
+    try:
+        return copy_months(conn, generator, months)
+    finally:
+        conn.close()
+
+
+def _search_index(cursor):
+    """(name, setup statements) of the visitor search index that exists, or None"""
+    cursor.execute("SELECT to_regclass('idx_visitors_search_trgm'), to_regclass('idx_visitors_search_fts')")
+    trigram, fulltext = cursor.fetchone()
+    if trigram:
+        return 'idx_visitors_search_trgm', search.TRIGRAM_SETUP_SQL
+    if fulltext:
+        return 'idx_visitors_search_fts', search.FULLTEXT_SETUP_SQL
+    return None
+
+
+def load(conn, generator, workers=1, rebuild_search_index=False, progress=None):
+    """Load the generator's visitors with COPY; returns rows loaded
+
+    workers > 1 loads months in parallel processes (each connects with DATABASE_URL).
+    rebuild_search_index drops the search index for the load and builds it again after;
+    search is slow meanwhile, so use it on databases nobody is using.
+    """
+    cursor = conn.cursor()
+    plan = generator.months()
+    # Every month needs its partition before rows arrive (else they land in the default one)
+    partitions.ensure_months(cursor, min(plan), max(plan))
+    conn.commit()
+
+    index = _search_index(cursor) if rebuild_search_index else None
+    if index:
+        cursor.execute(f"DROP INDEX {index[0]}")
+        conn.commit()
+
+    loaded = 0
+    try:
+        if workers > 1:
+            # Spread months round-robin so each worker gets a mix of busy and quiet ones
+            shards = [sorted(plan)[i::workers] for i in range(workers)]
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                for rows in pool.map(_copy_worker, [generator] * len(shards), shards):
+                    loaded += rows
+                    if progress:
+                        progress(loaded)
+        else:
+            for month in sorted(plan):
+                loaded += copy_months(conn, generator, [month])
+                if progress:
+                    progress(loaded)
+    finally:
+        if index:
+            print(f"INFO: Rebuilding {index[0]}", file=sys.stderr)
+            for statement in index[1]:
+                cursor.execute(statement)
+            conn.commit()
+
+    rollups.rebuild(cursor, generator.start.date(), generator.end.date())
+    conn.commit()
+    return loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic visitors and load them with COPY")
+    parser.add_argument('--count', type=int, required=True, help="Visitors to generate")
+    parser.add_argument('--days', type=int, default=365, help="Days of history, ending now")
+    parser.add_argument('--end', help="Last day of the range (YYYY-MM-DD) instead of now")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed; the same seed gives the same data")
+    parser.add_argument('--open-share', type=float, default=DEFAULT_OPEN_SHARE, help="Share of visits never checked out")
+    parser.add_argument('--repeat-share', type=float, default=DEFAULT_REPEAT_SHARE, help="Share of visits by returning visitors")
+    parser.add_argument('--hosts', type=int, default=DEFAULT_HOSTS, help="Number of distinct hosts")
+    parser.add_argument('--purposes', default=','.join(f"{k}={v}" for k, v in DEFAULT_PURPOSES.items()),
+                        help="Purpose mix as Name=weight,...")
+    parser.add_argument('--peak-hour', type=int, default=DEFAULT_PEAK_HOUR, help="Hour of the evening peak (0-23)")
+    parser.add_argument('--peak-factor', type=float, default=DEFAULT_PEAK_FACTOR, help="Arrivals at the peak vs the daytime plateau")
+    parser.add_argument('--duration-median', type=float, default=DEFAULT_DURATION_MEDIAN, help="Median visit length in minutes")
+    parser.add_argument('--duration-sigma', type=float, default=DEFAULT_DURATION_SIGMA, help="Spread of visit lengths (log-normal sigma)")
+    parser.add_argument('--workers', type=int, default=1, help="Processes loading months in parallel")
+    parser.add_argument('--rebuild-search-index', action='store_true',
+                        help="Drop the search index during the load and rebuild it after (much faster; for idle databases)")
+    parser.add_argument('--output', help="Write COPY text to this file ('-' for stdout) instead of loading")
+    args = parser.parse_args()
+
+    try:
+        end = datetime.strptime(args.end, '%Y-%m-%d') + timedelta(days=1, seconds=-1) if args.end else None
+        generator = VisitorGenerator(
+            args.count, args.days, end, args.seed, args.open_share, args.repeat_share, args.hosts,
+            parse_purposes(args.purposes), args.peak_hour, args.peak_factor, args.duration_median, args.duration_sigma
+        )
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+
+    def report(rows):
+        elapsed = time.perf_counter() - started
+        print(f"  {rows:>10} visitors  {rows / elapsed:>9.0f} rows/s", file=sys.stderr)
+
+    if args.output:
+        out = sys.stdout if args.output == '-' else open(args.output, 'w')
+        try:
+            for index, line in enumerate(generator.lines(), 1):
+                out.write(line)
+                if index % 500000 == 0:
+                    report(index)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"✓ Wrote {args.count} visitors in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        sys.exit(0)
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from db import get_db_connection
+    import migrations
+
+    conn = get_db_connection()
+    try:
+        # Importing api_server used to do this; a new database needs its tables first
+        migrations.ensure_current(conn)
+        rows = load(conn, generator, args.workers, args.rebuild_search_index, report)
+        conn.autocommit = True
+        conn.cursor().execute("ANALYZE visitors")
+        elapsed = time.perf_counter() - started
+        print(f"✓ Loaded {rows} visitors ({generator.start.date()} to {generator.end.date()}) "
+              f"in {elapsed:.1f}s, {rows / elapsed:.0f} rows/s")
+    except Exception as e:
+        conn.rollback()
+        print(f"✗ Error loading visitors: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+JSON serialisation for API rows
+Each table gets an encoder compiled once from its column list. Rows go straight from
+cursor tuples to JSON bytes without building intermediate dicts. Timestamps are naive
+UTC and are written as ISO-8601 with a Z suffix. orjson is used when it is installed
+(JSON_BACKEND=stdlib forces the standard library).
+"""
+
+import json
+import os
+from datetime import date, datetime
+from json.encoder import encode_basestring_ascii
+
+import queries
+
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto').lower()
+
+try:
+    if JSON_BACKEND == 'stdlib':
+        raise ImportError
+    import orjson
+    _ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+except ImportError:
+    orjson = None
+
+
+def utc_iso(value):
+    """Naive UTC datetime as ISO-8601 with a Z suffix"""
+    return value.isoformat() + 'Z'
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return utc_iso(value) if value.tzinfo is None else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_stdlib_encoder = json.JSONEncoder(separators=(',', ':'), default=_default)
+
+
+def dumps(obj):
+    """Serialise any API payload (dicts, lists, datetimes) to JSON bytes"""
+    if orjson:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+    return _stdlib_encoder.encode(obj).encode('utf-8')
+
+
+def envelope(**parts):
+    """JSON object from parts that are either plain values or already-encoded JSON bytes"""
+    items = []
+    for key, value in parts.items():
+        encoded = value if isinstance(value, bytes) else dumps(value)
+        items.append(b'"' + key.encode('ascii') + b'":' + encoded)
+    return b'{' + b','.join(items) + b'}'
+
+
+# Column kinds and how the compiled stdlib encoder writes a non-NULL value
+_VALUE_TEMPLATES = {
+    'int': "str({v})",
+    'text': "_escape({v})",
+    'timestamp': "'\"' + {v}.isoformat() + 'Z\"'",
+    'bool': "('true' if {v} else 'false')",
+}
+
+
+class TableEncoder:
+    """Row encoder for one table's column list, compiled once"""
+
+    def __init__(self, fields, kinds):
+        self.fields = tuple(fields)
+        self.kinds = dict(kinds)
+        env = {"_escape": encode_basestring_ascii}
+
+        # Tuple -> dict with native values (orjson path and callers that need a dict)
+        items = ", ".join(f"{field!r}: row[{index}]" for index, field in enumerate(self.fields))
+        source = f"def to_dict(row):\n    return {{{items}}}\n"
+
+        # Tuple -> JSON text by string concatenation (stdlib path)
+        parts = []
+        for index, field in enumerate(self.fields):
+            value = f"row[{index}]"
+            encoded = _VALUE_TEMPLATES[self.kinds.get(field, 'text')].format(v=value)
+            separator = '{' if index == 0 else ','
+            parts.append(f"'{separator}\"{field}\":' + ('null' if {value} is None else {encoded})")
+        source += "def to_json(row):\n    return " + " + ".join(parts) + " + '}'\n"
+
+        exec(source, env)
+        self.to_dict = env["to_dict"]
+        self._to_json = env["to_json"]
+
+    def dumps_row(self, row):
+        """One row as JSON bytes"""
+        if orjson:
+            return orjson.dumps(self.to_dict(row), option=_ORJSON_OPTIONS)
+        return self._to_json(row).encode('utf-8')
+
+    def dumps_rows(self, rows):
+        """A list of rows as a JSON array (bytes)"""
+        if orjson:
+            to_dict = self.to_dict
+            return orjson.dumps([to_dict(row) for row in rows], option=_ORJSON_OPTIONS)
+        to_json = self._to_json
+        return ('[' + ','.join([to_json(row) for row in rows]) + ']').encode('utf-8')
+
+
+visitors = TableEncoder(queries.VISITOR_FIELDS, {
+    "id": 'int',
+    "check_in_time": 'timestamp',
+    "check_out_time": 'timestamp',
+    "created_at": 'timestamp',
+    "updated_at": 'timestamp',
+})
+
+users = TableEncoder(queries.USER_FIELDS, {
+    "id": 'int',
+    "created_at": 'timestamp',
+    "updated_at": 'timestamp',
+})
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Slow-query log for GET /api/debug/slow-queries
+queries.run/execute (and so execute_query) report every statement that took at least
+SLOW_QUERY_MS. Each one is printed and kept in a per-process ring buffer of
+SLOW_QUERY_BUFFER entries. An entry holds the statement name, its SQL, parameters
+redacted to their types, the route (or thread) that ran it, the row count and the
+duration.
+
+For SLOW_QUERY_EXPLAIN_SAMPLE of them the statement runs again under
+EXPLAIN (ANALYZE, BUFFERS) on the same connection, inside a savepoint that is rolled
+back. Statements that write or lock rows get a plain EXPLAIN instead, because ANALYZE
+would run them a second time. Statements calling functions with side effects (advisory
+locks, nextval, ...) are not explained at all. The re-run costs as much as the
+statement did, which is what the sampling limits. Plans have their string literals
+redacted too.
+"""
+
+import collections
+import os
+import random
+import re
+import threading
+import time
+
+try:
+    from flask import has_request_context, request
+except ImportError:
+    has_request_context = None
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 500))
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.getenv('SLOW_QUERY_EXPLAIN_SAMPLE', 0.1))
+SLOW_QUERY_BUFFER = int(os.getenv('SLOW_QUERY_BUFFER', 100))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'true').lower() in ('1', 'true', 'yes')
+
+# Statements are compared against this in queries.py; 0 or less turns the log off
+THRESHOLD = SLOW_QUERY_MS / 1000 if SLOW_QUERY_MS > 0 else float('inf')
+
+# Statements EXPLAIN accepts (not DDL, COPY, SET, ...)
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|VALUES|TABLE|INSERT|UPDATE|DELETE|MERGE)\b', re.IGNORECASE)
+_WRITES = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|FOR\s+(NO\s+KEY\s+)?UPDATE|FOR\s+(KEY\s+)?SHARE)\b', re.IGNORECASE)
+# Running these twice is not harmless, even in a rolled-back savepoint
+_SIDE_EFFECTS = re.compile(r'\b(pg_(try_)?advisory\w*|nextval|setval|pg_notify|dblink\w*|pg_sleep)\s*\(', re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+_entries = collections.deque(maxlen=SLOW_QUERY_BUFFER)
+_lock = threading.Lock()
+_counts = {"recorded": 0, "explained": 0, "explain_errors": 0}
+
+
+def redact_params(params):
+    """Parameters as their types (and lengths), never their values"""
+    redacted = []
+    for value in params or ():
+        if value is None:
+            redacted.append(None)
+        elif isinstance(value, (str, bytes, list, tuple)):
+            redacted.append(f"<{type(value).__name__}:{len(value)}>")
+        else:
+            redacted.append(f"<{type(value).__name__}>")
+    return redacted
+
+
+def redact_sql(sql):
+    return _LITERAL.sub("'…'", sql)
+
+
+def _origin():
+    """Route pattern of the current request, or the thread's name outside one"""
+    if has_request_context is not None and has_request_context():
+        return f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+    return f"thread:{threading.current_thread().name}"
+
+
+def _explain(cursor, executed_sql, params, analyze):
+    """Plan text of the statement just run (executed_sql may be an EXECUTE of it), or raises"""
+    options = "ANALYZE, BUFFERS" if analyze else "COSTS"
+    conn = cursor.connection
+    # A new cursor, so the caller can still fetch the statement's own rows
+    explain_cursor = conn.cursor()
+    in_transaction = not conn.autocommit
+    if in_transaction:
+        explain_cursor.execute("SAVEPOINT slow_query_explain")
+    try:
+        explain_cursor.execute(f"EXPLAIN ({options}) {executed_sql}", params)
+        plan = '\n'.join(row[0] for row in explain_cursor.fetchall())
+    finally:
+        if in_transaction:
+            explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        explain_cursor.close()
+    return redact_sql(plan)
+
+
+def record(cursor, label, sql, executed_sql, params, seconds):
+    """Log one statement that took at least THRESHOLD seconds (called by queries.py after it succeeded)"""
+    entry = {
+        "at": time.time(),
+        "statement": label,
+        "duration_ms": round(seconds * 1000, 3),
+        "rows": cursor.rowcount,
+        "origin": _origin(),
+        "sql": redact_sql(' '.join(sql.split())),
+        "params": redact_params(params),
+        "plan": None,
+    }
+
+    # Named (server-side) cursors are DECLAREd; the statement cannot be run again here
+    if (not cursor.name and _EXPLAINABLE.match(sql) and not _SIDE_EFFECTS.search(sql)
+            and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE):
+        entry["analyzed"] = not _WRITES.search(sql)
+        try:
+            entry["plan"] = _explain(cursor, executed_sql, params, entry["analyzed"])
+            with _lock:
+                _counts["explained"] += 1
+        except Exception as e:
+            entry["explain_error"] = str(e).strip()
+            with _lock:
+                _counts["explain_errors"] += 1
+
+    with _lock:
+        _entries.append(entry)
+        _counts["recorded"] += 1
+    if SLOW_QUERY_LOG:
+        print(f"WARNING: Slow query {label} took {entry['duration_ms']:.1f}ms ({entry['rows']} rows) "
+              f"in {entry['origin']}: {entry['sql'][:200]}")
+
+
+def entries(reset=False):
+    """Recorded slow statements, newest first"""
+    with _lock:
+        snapshot = list(_entries)
+        if reset:
+            _entries.clear()
+    snapshot.reverse()
+    return snapshot
+
+
+def stats():
+    with _lock:
+        counts = dict(_counts)
+    counts.update(threshold_ms=SLOW_QUERY_MS, explain_sample=SLOW_QUERY_EXPLAIN_SAMPLE, buffer=SLOW_QUERY_BUFFER)
+    return counts
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Per-table data versions for conditional GETs
+A list endpoint can answer If-None-Match with a version lookup instead of reading (or
+hashing) rows.
+
+users: a statement-level trigger bumps the table's row in table_versions in the same
+transaction as the write, so the new version becomes visible exactly when the new rows do.
+Users change rarely, so the single row is no bottleneck.
+
+visitors: every check-in would update that one row and queue behind the previous writer.
+Instead the version is read from the change feed's stamps (changes.py): the newest
+change_xid among visible visitors and tombstones, or the prune/truncate horizon if
+newer. Writers share nothing. A transaction that started earlier can still commit
+rows with a lower xid, though, so the version only counts while no writer older than it
+is running (the snapshot's xmin is above it). Otherwise it is None and callers skip the
+ETag or the cache. Reports use the version of their check-in range.
+"""
+
+import queries
+
+TRACKED_TABLES = ('users',)
+
+SETUP_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 1
+    )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO table_versions (table_name) VALUES (TG_TABLE_NAME)
+        ON CONFLICT (table_name) DO UPDATE SET version = table_versions.version + 1;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+]
+for _table in TRACKED_TABLES:
+    SETUP_SQL += [
+        f"INSERT INTO table_versions (table_name) VALUES ('{_table}') ON CONFLICT (table_name) DO NOTHING",
+        f"DROP TRIGGER IF EXISTS {_table}_bump_version ON {_table}",
+        f"""
+        CREATE TRIGGER {_table}_bump_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {_table}
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()
+        """,
+    ]
+
+# Existing databases: stop bumping a shared row on every visitor write
+UNTRACK_VISITORS_SQL = [
+    "DROP TRIGGER IF EXISTS visitors_bump_version ON visitors",
+    "DELETE FROM table_versions WHERE table_name = 'visitors'",
+]
+
+TABLE_VERSION = queries.statement("table_version", "SELECT version FROM table_versions WHERE table_name = ?")
+
+_VISITORS_VERSION_SQL = """
+    SELECT v.version::text, pg_snapshot_xmin(pg_current_snapshot()) > v.version
+    FROM (SELECT GREATEST(
+        (SELECT MAX(change_xid) FROM visitors{visitors_range}),
+        (SELECT MAX(change_xid) FROM visitor_tombstones{tombstones_range}),
+        (SELECT pruned_xid FROM visitor_sync_state WHERE id = 1)
+    ) AS version) AS v
+"""
+VISITORS_VERSION = queries.statement("visitors_version", _VISITORS_VERSION_SQL.format(
+    visitors_range="", tombstones_range=""))
+# Tombstones written before they recorded check_in_time count for every range
+VISITORS_RANGE_VERSION = queries.statement("visitors_range_version", _VISITORS_VERSION_SQL.format(
+    visitors_range=" WHERE check_in_time >= ?::timestamp AND check_in_time < ?::timestamp",
+    tombstones_range=" WHERE check_in_time IS NULL OR (check_in_time >= ?::timestamp AND check_in_time < ?::timestamp)",
+))
+
+
+def visitors_version(cursor, start=None, end=None):
+    """Version of the visitors checked in at [start, end) (either may be None), or None while it is unsafe to use"""
+    if start is None and end is None:
+        queries.run(cursor, VISITORS_VERSION)
+    else:
+        start = start or '-infinity'
+        end = end or 'infinity'
+        queries.run(cursor, VISITORS_RANGE_VERSION, (start, end, start, end))
+    version, settled = cursor.fetchone()
+    return version if settled else None
+
+
+def get_version(cursor, table):
+    """Current data version of a table (None if it isn't tracked or can't be used right now)"""
+    if table == 'visitors':
+        return visitors_version(cursor)
+    queries.run(cursor, TABLE_VERSION, (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
@@ -0,0 +1,109 @@
+"""
+Shared fixtures for the backend tests
+
+Tests that need PostgreSQL run against TEST_DATABASE_URL and are skipped when it is
+unset or unreachable. Point it at a throwaway database: the session starts by dropping
+and recreating its public schema, then migrates it from scratch.
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/vt_test python -m pytest -q
+"""
+
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+# Read by the modules at import time, so set before any of them is imported
+if TEST_DATABASE_URL:
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+os.environ['AUTO_CHECKOUT_ENABLED'] = 'false'
+os.environ['PASSWORD_HASH_ITERATIONS'] = '1000'
+os.environ['DEBUG_SEED_ENABLED'] = 'false'
+
+
+def _reset_schema():
+    """Empty the test database; returns why not if it can't be reached"""
+    try:
+        import psycopg2
+    except ImportError:
+        return "psycopg2 is not installed"
+    try:
+        conn = psycopg2.connect(TEST_DATABASE_URL)
+    except psycopg2.Error as e:
+        return f"TEST_DATABASE_URL unreachable: {e}"
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute("DROP SCHEMA public CASCADE")
+        cursor.execute("CREATE SCHEMA public")
+    finally:
+        conn.close()
+    return None
+
+
+@pytest.fixture(scope='session')
+def database():
+    """Connection factory for a freshly migrated test database"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    error = _reset_schema()
+    if error:
+        pytest.skip(error)
+    import db
+    import migrations
+    conn = db.get_db_connection()
+    try:
+        migrations.migrate(conn)
+    finally:
+        conn.close()
+    return db.get_db_connection
+
+
+@pytest.fixture
+def conn(database):
+    connection = database()
+    yield connection
+    connection.rollback()
+    connection.close()
+
+
+@pytest.fixture(scope='session')
+def app(database):
+    import api_server
+    api_server.app.config['TESTING'] = True
+    # Its thread would hold the leader lock for the whole session; tests drive the scheduler directly
+    api_server._auto_checkout.check = lambda: None
+    return api_server.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, email, password):
+    response = client.post('/api/login', json={"email": email, "password": password})
+    assert response.status_code == 200, response.get_json()
+    return {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+
+@pytest.fixture(scope='session')
+def admin_headers(app):
+    import migrations
+    _, email, password = migrations.MAIN_ADMIN
+    return login(app.test_client(), email, password)
+
+
+@pytest.fixture(scope='session')
+def security_headers(app, admin_headers):
+    client = app.test_client()
+    response = client.post('/api/users', headers=admin_headers, json={
+        "name": "Test Guard", "email": "guard@test.local", "password": "guard-pass", "role": "security"
+    })
+    assert response.status_code == 201, response.get_json()
+    return login(client, "guard@test.local", "guard-pass")
@@ -0,0 +1,88 @@
+import pytest
+
+import auth
+
+
+def test_token_round_trip():
+    signer = auth.TokenSigner("secret")
+    token, expires = signer.issue(7, 'admin')
+    claims = signer.verify(token)
+    assert (claims["uid"], claims["role"], claims["exp"]) == (7, 'admin', expires)
+
+
+def test_expired_token_is_rejected():
+    token, _ = auth.TokenSigner("secret", ttl=-10).issue(7, 'admin')
+    with pytest.raises(auth.AuthError, match="expired"):
+        auth.TokenSigner("secret").verify(token)
+
+
+def test_token_signed_with_another_key_is_rejected():
+    token, _ = auth.TokenSigner("other secret").issue(7, 'admin')
+    with pytest.raises(auth.AuthError, match="Invalid"):
+        auth.TokenSigner("secret").verify(token)
+
+
+def test_tampered_claims_are_rejected():
+    signer = auth.TokenSigner("secret")
+    admin_token, _ = signer.issue(1, 'admin')
+    guard_token, _ = signer.issue(2, 'security')
+    forged = f"{admin_token.split('.')[0]}.{guard_token.split('.')[1]}"
+    with pytest.raises(auth.AuthError):
+        signer.verify(forged)
+
+
+@pytest.mark.parametrize('token', ["", "abc", "a.b.c", "é.é"])
+def test_malformed_token_is_rejected(token):
+    with pytest.raises(auth.AuthError):
+        auth.TokenSigner("secret").verify(token)
+
+
+def test_password_hash_and_check():
+    stored = auth.hash_password("s3cret")
+    assert auth.is_hashed(stored)
+    assert auth.check_password("s3cret", stored) == (True, False)
+    assert auth.check_password("wrong", stored)[0] is False
+
+
+def test_weaker_password_hash_needs_rehash():
+    stored = auth.hash_password("s3cret", auth.PASSWORD_HASH_ITERATIONS // 2)
+    assert auth.check_password("s3cret", stored) == (True, True)
+
+
+def test_legacy_plain_text_password_needs_rehash():
+    assert auth.check_password("s3cret", "s3cret") == (True, True)
+    assert auth.check_password("wrong", "s3cret")[0] is False
+
+
+@pytest.mark.parametrize('stored', [
+    "pbkdf2_sha256$bad",
+    "pbkdf2_sha256$many$salt$digest",
+    "pbkdf2_sha256$0$salt$digest",
+    "pbkdf2_sha256$1000$sält$digest",
+])
+def test_malformed_password_hash_never_matches(stored):
+    assert auth.check_password("anything", stored) == (False, False)
+
+
+def test_protected_route_requires_token(client):
+    assert client.get('/api/visitors').status_code == 401
+
+
+def test_query_token_only_accepted_where_allowed(client, admin_headers):
+    token = admin_headers["Authorization"].split(' ', 1)[1]
+    assert client.get(f'/api/visitors?access_token={token}').status_code == 401
+
+
+def test_admin_routes_reject_other_roles(client, security_headers):
+    assert client.get('/api/visitors', headers=security_headers).status_code == 200
+    for path in ('/api/users', '/api/debug/queries', '/api/debug/slow-queries', '/api/debug/seed'):
+        assert client.get(path, headers=security_headers).status_code == 403, path
+
+
+def test_admin_routes_allow_admin(client, admin_headers):
+    assert client.get('/api/users', headers=admin_headers).status_code == 200
+    assert client.get('/api/debug/queries', headers=admin_headers).status_code == 200
+
+
+def test_debug_seed_is_off_by_default(client, admin_headers):
+    assert client.get('/api/debug/seed', headers=admin_headers).status_code == 404
@@ -0,0 +1,35 @@
+import logging
+
+import auto_checkout
+
+
+def _failing_connect():
+    raise RuntimeError("database unavailable")
+
+
+def test_leader_probe_failure_is_logged_not_raised(caplog):
+    scheduler = auto_checkout.AutoCheckout(_failing_connect, interval=60)
+    with caplog.at_level(logging.WARNING, logger='auto_checkout'):
+        scheduler.check()
+    assert "database unavailable" in caplog.text
+    assert scheduler.stats()["leader"] is False
+
+
+def test_leader_probe_uses_its_own_connection(database, monkeypatch):
+    opened = []
+
+    def connect():
+        conn = database()
+        opened.append(conn)
+        return conn
+
+    scheduler = auto_checkout.AutoCheckout(connect, interval=60)
+    started = []
+    monkeypatch.setattr(scheduler, 'start', lambda: started.append(True))
+    scheduler.check()
+    # Nobody holds the leader lock, so this worker starts a thread; the probe connection is closed
+    assert started == [True]
+    assert len(opened) == 1 and opened[0].closed
+    # At most one probe per interval
+    scheduler.check()
+    assert len(opened) == 1
@@ -0,0 +1,76 @@
+import pytest
+
+import changes
+
+
+def test_sync_token_round_trip():
+    token = changes.encode_token('1234', 56, '1200', False)
+    assert changes.decode_token(token) == ('1234', 56, '1200', False)
+    token = changes.encode_token('0', 0, None, True)
+    assert changes.decode_token(token) == ('0', 0, None, True)
+
+
+@pytest.mark.parametrize('token', ["", "not a token", "WzEsMl0"])
+def test_malformed_sync_token_raises_value_error(token):
+    with pytest.raises(ValueError):
+        changes.decode_token(token)
+
+
+def _sync(client, headers, since=None):
+    """Follow next_token until caught up; returns (visitor ids, deleted ids, token, final status)"""
+    seen, deleted = [], []
+    while True:
+        args = {"since": since} if since else {}
+        response = client.get('/api/visitors/changes', headers=headers, query_string=args)
+        if response.status_code != 200:
+            return seen, deleted, since, response.status_code
+        body = response.get_json()
+        seen += [visitor["id"] for visitor in body["visitors"]]
+        deleted += body["deleted"]
+        since = body["next_token"]
+        if not body["has_more"]:
+            return seen, deleted, since, 200
+
+
+def _check_in(client, headers, name):
+    response = client.post('/api/visitors', headers=headers, json={"name": name, "purpose": "Change feed test"})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+
+def test_delete_is_reported_as_tombstone(client, admin_headers):
+    kept = _check_in(client, admin_headers, "Kept Visitor")
+    removed = _check_in(client, admin_headers, "Removed Visitor")
+    seen, _, token, _ = _sync(client, admin_headers)
+    assert {kept["id"], removed["id"]} <= set(seen)
+
+    response = client.delete(f'/api/visitors/{removed["id"]}', headers=admin_headers,
+                             query_string={"check_in_time": removed["check_in_time"]})
+    assert response.status_code == 200
+
+    seen, deleted, token, status = _sync(client, admin_headers, token)
+    assert status == 200
+    assert deleted == [removed["id"]]
+    assert kept["id"] not in seen
+
+    # Caught up: nothing new until the next write
+    assert _sync(client, admin_headers, token)[:2] == ([], [])
+
+
+def test_pruned_tombstones_expire_old_tokens(client, admin_headers, conn):
+    removed = _check_in(client, admin_headers, "Pruned Visitor")
+    _, _, token, _ = _sync(client, admin_headers)
+    client.delete(f'/api/visitors/{removed["id"]}', headers=admin_headers)
+
+    cursor = conn.cursor()
+    assert changes.prune_tombstones(cursor, days=0) >= 1
+    conn.commit()
+
+    response = client.get('/api/visitors/changes', headers=admin_headers, query_string={"since": token})
+    assert response.status_code == 410
+    assert response.get_json()["resync"] is True
+
+    # A full sync still works and no longer lists the pruned visitor
+    seen, deleted, _, status = _sync(client, admin_headers)
+    assert status == 200
+    assert removed["id"] not in seen and deleted == []
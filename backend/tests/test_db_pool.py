@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for the pool"""
+
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.in_transaction = False
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return 2 if self.in_transaction else 0
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+
+class Connector:
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+
+def test_borrow_and_release_reuses_connection():
+    connect = Connector()
+    pool = ConnectionPool(connect, minconn=1, maxconn=2)
+    assert len(connect.opened) == 1
+
+    conn = pool.getconn()
+    assert conn is connect.opened[0]
+    assert pool.stats()["in_use"] == 1
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(connect.opened) == 1
+
+
+def test_release_rolls_back_open_transaction_and_autocommit():
+    pool = ConnectionPool(Connector(), minconn=0, maxconn=1)
+    conn = pool.getconn()
+    conn.in_transaction = True
+    conn.autocommit = True
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert conn.autocommit is False
+    assert pool.stats()["idle"] == 1
+
+
+def test_closed_connections_are_discarded():
+    connect = Connector()
+    pool = ConnectionPool(connect, minconn=1, maxconn=1)
+    conn = pool.getconn()
+    conn.close()
+    pool.putconn(conn)
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert pool.stats()["discarded_total"] == 1
+
+
+def test_exhausted_pool_times_out():
+    pool = ConnectionPool(Connector(), minconn=0, maxconn=2, timeout=0.05)
+    pool.getconn()
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts_total"] == 1
+
+
+def test_waiter_gets_released_connection():
+    pool = ConnectionPool(Connector(), minconn=0, maxconn=1, timeout=2)
+    conn = pool.getconn()
+    borrowed = []
+    waiter = threading.Thread(target=lambda: borrowed.append(pool.getconn()))
+    waiter.start()
+    threading.Timer(0.05, pool.putconn, (conn,)).start()
+    waiter.join(2)
+    assert borrowed == [conn]
+
+
+def test_fork_resets_pool_without_closing_parent_connections(monkeypatch):
+    connect = Connector()
+    pool = ConnectionPool(connect, minconn=1, maxconn=1)
+    inherited = pool.getconn()
+
+    monkeypatch.setattr(db_pool.os, 'getpid', lambda: pool._pid + 1)
+    conn = pool.getconn()
+    assert conn is not inherited
+    assert not inherited.closed
+    # Returning a connection borrowed before the fork leaves it to the parent
+    pool.putconn(inherited)
+    assert not inherited.closed
+    assert pool.stats()["in_use"] == 1
+
+
+def test_stats_count_acquisitions():
+    pool = ConnectionPool(Connector(), minconn=1, maxconn=3)
+    for _ in range(3):
+        pool.putconn(pool.getconn())
+    stats = pool.stats()
+    assert (stats["min"], stats["max"], stats["idle"], stats["in_use"]) == (1, 3, 1, 0)
+    assert stats["acquired_total"] == 3
+    assert stats["wait_max_ms"] >= stats["wait_avg_ms"] >= 0
+
+
+def test_invalid_sizes_are_rejected():
+    with pytest.raises(ValueError):
+        ConnectionPool(Connector(), minconn=2, maxconn=1)
@@ -0,0 +1,194 @@
+import socketserver
+import threading
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+import mailer
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server on localhost that records delivered messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.port = self.server_address[1]
+        self.messages = []
+        # Answer this many MAIL commands with a transient 451 before accepting
+        self.transient_failures = 0
+        self.lock = threading.Lock()
+        self.delivered = threading.Condition(self.lock)
+
+    def wait_for(self, count, timeout=5):
+        with self.delivered:
+            return self.delivered.wait_for(lambda: len(self.messages) >= count, timeout)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        self.reply('220 localhost stand-in')
+        recipients = []
+        for raw in self.rfile:
+            command = raw.decode('ascii').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                with server.lock:
+                    failing = server.transient_failures > 0
+                    server.transient_failures -= failing
+                self.reply('451 try again later' if failing else '250 OK')
+                recipients = []
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip('<> '))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                for line in self.rfile:
+                    if line.rstrip(b'\r\n') == b'.':
+                        break
+                    lines.append(line.decode('utf-8'))
+                with server.delivered:
+                    server.messages.append((recipients, ''.join(lines)))
+                    server.delivered.notify_all()
+                self.reply('250 queued')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _message(subject):
+    message = MIMEText("body")
+    message['Subject'] = subject
+    return message
+
+
+def _dispatcher(server, **kwargs):
+    connect = mailer.smtp_session_factory('127.0.0.1', server.port, starttls=False, timeout=5)
+    kwargs.setdefault('backoff', 0.01)
+    return mailer.EmailDispatcher(connect, 'noreply@test.local', **kwargs)
+
+
+def test_messages_are_delivered_over_one_session(smtp_server):
+    dispatcher = _dispatcher(smtp_server, workers=1)
+    for n in range(3):
+        assert dispatcher.submit('guard@test.local', _message(f"Reset {n}"))
+    assert smtp_server.wait_for(3)
+    dispatcher.shutdown()
+
+    assert [recipients for recipients, _ in smtp_server.messages] == [['guard@test.local']] * 3
+    assert "Subject: Reset 0" in smtp_server.messages[0][1]
+    stats = dispatcher.stats()
+    assert (stats["sent"], stats["connects"], stats["failed"]) == (3, 1, 0)
+
+
+def test_transient_failure_is_retried(smtp_server):
+    smtp_server.transient_failures = 2
+    dispatcher = _dispatcher(smtp_server, workers=1, max_retries=3, backoff=0.05)
+    started = time.monotonic()
+    dispatcher.submit('guard@test.local', _message("Reset"))
+    assert smtp_server.wait_for(1)
+    # Backs off 0.05s, then 0.1s (plus jitter) before the third attempt
+    assert time.monotonic() - started >= 0.15
+    dispatcher.shutdown()
+
+    stats = dispatcher.stats()
+    assert (stats["sent"], stats["retries"], stats["failed"]) == (1, 2, 0)
+    # Each failure drops the session, so every attempt reconnects
+    assert stats["connects"] == 3
+
+
+def test_gives_up_after_max_retries(smtp_server):
+    smtp_server.transient_failures = 10
+    failures = []
+    gave_up = threading.Event()
+
+    def on_failure(to, message, reason):
+        failures.append((to, reason))
+        gave_up.set()
+
+    dispatcher = _dispatcher(smtp_server, workers=1, max_retries=2, on_failure=on_failure)
+    dispatcher.submit('guard@test.local', _message("Reset"))
+    assert gave_up.wait(5)
+    dispatcher.shutdown()
+
+    assert smtp_server.messages == []
+    assert dispatcher.stats()["retries"] == 2
+    assert failures and failures[0][0] == 'guard@test.local' and '451' in failures[0][1]
+
+
+def _blocked_dispatcher(server, overflow, failures):
+    """One worker stuck connecting on the first message, with room for one more in the queue"""
+    connecting = threading.Event()
+    release = threading.Event()
+    connect = mailer.smtp_session_factory('127.0.0.1', server.port, starttls=False, timeout=5)
+
+    def slow_connect():
+        connecting.set()
+        release.wait(5)
+        return connect()
+
+    dispatcher = mailer.EmailDispatcher(slow_connect, 'noreply@test.local', workers=1, queue_size=1,
+                                        overflow=overflow, backoff=0.01,
+                                        on_failure=lambda to, message, reason: failures.append(message['Subject']))
+    assert dispatcher.submit('guard@test.local', _message("first"))
+    assert connecting.wait(5)
+    return dispatcher, release
+
+
+def _delivered_subjects(server):
+    return [body.split("Subject: ", 1)[1].split("\n", 1)[0].strip() for _, body in server.messages]
+
+
+def test_drop_new_rejects_message_when_queue_is_full(smtp_server):
+    failures = []
+    dispatcher, release = _blocked_dispatcher(smtp_server, 'drop_new', failures)
+    assert dispatcher.submit('guard@test.local', _message("second"))
+    assert not dispatcher.submit('guard@test.local', _message("third"))
+    release.set()
+    assert smtp_server.wait_for(2)
+    dispatcher.shutdown()
+
+    assert _delivered_subjects(smtp_server) == ["first", "second"]
+    assert failures == ["third"]
+    assert dispatcher.stats()["dropped"] == 1
+
+
+def test_drop_oldest_makes_room_for_new_message(smtp_server):
+    failures = []
+    dispatcher, release = _blocked_dispatcher(smtp_server, 'drop_oldest', failures)
+    assert dispatcher.submit('guard@test.local', _message("second"))
+    assert dispatcher.submit('guard@test.local', _message("third"))
+    release.set()
+    assert smtp_server.wait_for(2)
+    dispatcher.shutdown()
+
+    assert _delivered_subjects(smtp_server) == ["first", "third"]
+    assert failures == ["second"]
+    assert dispatcher.stats()["dropped"] == 1
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        mailer.EmailDispatcher(lambda: None, 'noreply@test.local', overflow='block')
@@ -0,0 +1,47 @@
+import pytest
+
+import migrations
+
+
+def _schema(cursor):
+    cursor.execute("""
+        SELECT table_name, column_name, data_type FROM information_schema.columns
+        WHERE table_schema = 'public' ORDER BY table_name, column_name
+    """)
+    columns = cursor.fetchall()
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = 'public' ORDER BY indexname")
+    indexes = cursor.fetchall()
+    cursor.execute("""
+        SELECT tgrelid::regclass::text, tgname FROM pg_trigger WHERE NOT tgisinternal ORDER BY 1, 2
+    """)
+    return columns, indexes, cursor.fetchall()
+
+
+def test_fresh_database_is_fully_migrated(conn):
+    assert migrations.current_version(conn.cursor()) == migrations.LATEST
+
+
+def test_migrate_again_applies_nothing(conn):
+    assert migrations.migrate(conn) == []
+    assert migrations.ensure_current(conn) == []
+
+
+@pytest.mark.parametrize('number', [migration[0] for migration in migrations.MIGRATIONS])
+def test_redo_leaves_schema_unchanged(conn, number):
+    cursor = conn.cursor()
+    before = _schema(cursor)
+    cursor.execute("SELECT COUNT(*) FROM users")
+    users = cursor.fetchone()[0]
+    conn.rollback()
+
+    migrations.redo(conn, number)
+
+    assert _schema(cursor) == before
+    cursor.execute("SELECT COUNT(*) FROM users")
+    assert cursor.fetchone()[0] == users
+    assert migrations.current_version(cursor) == migrations.LATEST
+
+
+def test_redo_unknown_migration(conn):
+    with pytest.raises(ValueError):
+        migrations.redo(conn, migrations.LATEST + 1)
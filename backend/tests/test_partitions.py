@@ -0,0 +1,46 @@
+from datetime import date
+
+import auto_checkout
+import partitions
+
+
+def _partition_of(cursor, visitor_id):
+    cursor.execute("SELECT tableoid::regclass::text FROM visitors WHERE id = %s", (visitor_id,))
+    return cursor.fetchone()[0]
+
+
+def test_ensure_months_moves_rows_out_of_default(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO visitors (name, purpose, check_in_time) VALUES
+            ('Early Visitor', 'Partition test', '2031-05-03 10:00'),
+            ('Other Month', 'Partition test', '2031-07-09 10:00')
+        RETURNING id
+    """)
+    may, july = [row[0] for row in cursor.fetchall()]
+    assert _partition_of(cursor, may) == partitions.DEFAULT_PARTITION
+
+    created = partitions.ensure_months(cursor, date(2031, 5, 1), date(2031, 5, 1))
+
+    assert created == ['visitors_2031_05']
+    assert _partition_of(cursor, may) == 'visitors_2031_05'
+    assert _partition_of(cursor, july) == partitions.DEFAULT_PARTITION
+    # A move is not a delete: no tombstone for the change feed
+    cursor.execute("SELECT COUNT(*) FROM visitor_tombstones WHERE id = %s", (may,))
+    assert cursor.fetchone()[0] == 0
+    # The default partition is attached again and still catches other months
+    cursor.execute("SELECT COUNT(*) FROM visitors WHERE name IN ('Early Visitor', 'Other Month')")
+    assert cursor.fetchone()[0] == 2
+
+
+def test_scheduler_keeps_partitions_with_auto_checkout_disabled(conn, monkeypatch):
+    ensured = []
+    monkeypatch.setattr(auto_checkout, 'AUTO_CHECKOUT_ENABLED', False)
+    monkeypatch.setattr(partitions, 'ensure_partitions', lambda cursor: ensured.append(True) or [])
+
+    def no_sweep(*args):
+        raise AssertionError("swept with auto checkout disabled")
+
+    monkeypatch.setattr(auto_checkout, 'sweep', no_sweep)
+    assert auto_checkout.AutoCheckout(lambda: conn)._tick(conn) is True
+    assert ensured == [True]
@@ -0,0 +1,69 @@
+import re
+import zlib
+from datetime import datetime, timedelta
+
+import report_export
+
+
+def _rows(count, consumed=None):
+    """Visitor rows, newest first, across a few check-in days"""
+    start = datetime(2025, 1, 1, 8, 0)
+    for i in range(count, 0, -1):
+        if consumed is not None:
+            consumed.append(i)
+        check_in = start + timedelta(hours=5 * i)
+        yield (i, f"Visitor {i}", f"visitor{i}@example.com", "9800000000", "Meeting", check_in,
+               check_in + timedelta(hours=1) if i % 2 else None, "Host", "Acme", check_in, check_in)
+
+
+def _page_text(pdf):
+    """Decompressed content of every page, in order"""
+    texts = []
+    for match in re.finditer(rb'/Filter /FlateDecode /Length (\d+) >>\nstream\n', pdf):
+        start = match.end()
+        texts.append(zlib.decompress(pdf[start:start + int(match.group(1))]))
+    return texts
+
+
+def test_pdf_pages_are_sent_before_rows_run_out():
+    consumed = []
+    chunks = report_export.stream_pdf(_rows(5000, consumed))
+    assert next(chunks).startswith(b'%PDF-1.4')
+    second = next(chunks)
+    assert b'/Type /Page ' in second
+    assert len(consumed) < 5000
+
+
+def test_pdf_cross_reference_points_at_objects():
+    pdf = b''.join(report_export.stream_pdf(_rows(200), subtitle="January"))
+    xref = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', pdf).group(1))
+    entries = re.findall(rb'(\d{10}) 00000 n ', pdf[xref:])
+    for number, offset in enumerate(entries, start=1):
+        assert pdf[int(offset):].startswith(b'%d 0 obj\n' % number)
+
+
+def test_pdf_page_count_and_totals():
+    pdf = b''.join(report_export.stream_pdf(_rows(200)))
+    pages = int(re.search(rb'/Type /Pages /Count (\d+)', pdf).group(1))
+    texts = _page_text(pdf)
+    # Every page's content, then the shared page-count form
+    assert len(texts) == pages + 1
+    assert texts[-1].endswith(b'(%d) Tj ET' % pages)
+    assert b'Page 1 of' in texts[0] and b'/PageCount Do' in texts[0]
+    assert b'Total: 200 visits, 100 checked out, 100 inside' in texts[pages - 1]
+    assert b'Subtotal 2025-01-01' in texts[pages - 1]
+
+
+def test_pdf_cells_are_cut_to_their_column():
+    fitted = report_export._pdf_fit("x" * 200 + "@example.com", 130)
+    assert fitted.endswith(b'\x85') and len(fitted) < 60
+    assert report_export._pdf_fit("Zoë", 130) == b'Zo\xeb'
+
+
+def test_pdf_report_endpoint_streams(client, admin_headers):
+    client.post('/api/visitors', headers=admin_headers, json={"name": "Report Visitor", "purpose": "Report test"})
+    response = client.get('/api/visitors/report', headers=admin_headers,
+                          query_string={"format": "pdf", "purpose": "Report test"})
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.data.startswith(b'%PDF-1.4') and response.data.endswith(b'%%EOF\n')
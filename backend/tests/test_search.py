@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import pytest
+
+import search
+
+
+def test_search_cursor_round_trip():
+    position = (0.75, datetime(2025, 3, 1, 9, 30, 15, 250000), 42)
+    assert search.decode_cursor(search.encode_cursor(*position)) == position
+
+
+@pytest.mark.parametrize('cursor', ["", "not a cursor", "WzEsMl0"])
+def test_malformed_search_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        search.decode_cursor(cursor)
+
+
+def _search(client, headers, **params):
+    response = client.get('/api/visitors/search', headers=headers, query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_search_ranks_only_newest_candidates(client, admin_headers, monkeypatch):
+    for n in range(3):
+        client.post('/api/visitors', headers=admin_headers, json={"name": f"Candidate Zebulon {n}", "purpose": "Search cap"})
+    assert search.SEARCH_MAX_CANDIDATES > 0
+
+    monkeypatch.setattr(search, 'SEARCH_MAX_CANDIDATES', 2)
+    body = _search(client, admin_headers, q="zebulon")
+    assert body["truncated"] is True
+    assert sorted(v["name"] for v in body["visitors"]) == ["Candidate Zebulon 1", "Candidate Zebulon 2"]
+    # Later pages rank the same candidates
+    first = _search(client, admin_headers, q="zebulon", limit=1)
+    second = _search(client, admin_headers, q="zebulon", limit=1, cursor=first["next_cursor"])
+    assert second["truncated"] is True and second["next_cursor"] is None
+    assert {first["visitors"][0]["name"], second["visitors"][0]["name"]} == {"Candidate Zebulon 1", "Candidate Zebulon 2"}
+
+    # 0 opts out of the cap
+    monkeypatch.setattr(search, 'SEARCH_MAX_CANDIDATES', 0)
+    body = _search(client, admin_headers, q="zebulon")
+    assert body["truncated"] is False
+    assert len(body["visitors"]) == 3
@@ -0,0 +1,50 @@
+import ast
+import importlib.util
+import os
+
+import api_server
+from benchmarks import bench_startup
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _is_module(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def _function_level_imports(filename):
+    """Modules imported inside functions, i.e. on first use"""
+    with open(os.path.join(BACKEND_DIR, filename)) as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for func in ast.walk(tree):
+        if not isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for node in ast.walk(func):
+            if isinstance(node, ast.Import):
+                names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                # from reportlab.pdfbase import pdfmetrics loads reportlab.pdfbase.pdfmetrics
+                names.update(f"{node.module}.{alias.name}" if _is_module(f"{node.module}.{alias.name}")
+                             else node.module for alias in node.names)
+    return names
+
+
+def test_lazy_modules_match_deferred_imports():
+    # Everything report_export loads on first use is prewarmed
+    assert _function_level_imports('report_export.py') <= set(api_server.LAZY_MODULES)
+    # and every prewarmed module is still imported on first use somewhere
+    deferred = _function_level_imports('api_server.py') | _function_level_imports('report_export.py')
+    assert set(api_server.LAZY_MODULES) <= deferred
+
+
+def test_bench_startup_checks_lazy_modules():
+    assert bench_startup.HEAVY_MODULES == list(api_server.LAZY_MODULES)
+
+
+def test_app_import_does_not_load_lazy_modules(database):
+    result = bench_startup.run_once('/api/health')
+    assert result['loaded'] == []
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+
+def test_visitor_list_cursor_round_trip(app):
+    import api_server
+    position = (datetime(2025, 3, 1, 9, 30, 15, 250000), 42)
+    assert api_server.decode_cursor(api_server.encode_cursor(*position)) == position
+    with pytest.raises(ValueError):
+        api_server.decode_cursor("not a cursor")
+
+
+def test_visitor_list_pages_with_cursor(client, admin_headers):
+    for n in range(5):
+        response = client.post('/api/visitors', headers=admin_headers, json={
+            "name": f"Paging Visitor {n}", "purpose": "Paging test"
+        })
+        assert response.status_code == 201, response.get_json()
+
+    seen = []
+    args = {"purpose": "Paging test", "limit": 2}
+    while True:
+        body = client.get('/api/visitors', headers=admin_headers, query_string=args).get_json()
+        seen += [visitor["name"] for visitor in body["visitors"]]
+        if not body["next_cursor"]:
+            break
+        args["cursor"] = body["next_cursor"]
+    assert seen == [f"Paging Visitor {n}" for n in reversed(range(5))]
+
+
+def test_bad_cursor_is_rejected(client, admin_headers):
+    response = client.get('/api/visitors', headers=admin_headers, query_string={"cursor": "not a cursor"})
+    assert response.status_code == 400
+
+
+def test_bulk_check_in_maps_rows_back_to_request_indexes(client, admin_headers):
+    items = [
+        {"name": "Bulk 0", "purpose": "Bulk test"},
+        {"name": "Missing purpose"},
+        {"name": "Bulk 2", "purpose": "Bulk test", "company": "Acme"},
+        {"name": "Bulk 3", "purpose": "Bulk test"},
+    ]
+    response = client.post('/api/visitors/bulk', headers=admin_headers, json={"visitors": items})
+    assert response.status_code == 201, response.get_json()
+    body = response.get_json()
+
+    assert [error["index"] for error in body["errors"]] == [1]
+    assert {visitor["index"]: visitor["name"] for visitor in body["created"]} == {0: "Bulk 0", 2: "Bulk 2", 3: "Bulk 3"}
+    assert next(visitor for visitor in body["created"] if visitor["index"] == 2)["company"] == "Acme"
+    assert len({visitor["id"] for visitor in body["created"]}) == 3
@@ -10,6 +10,7 @@ import SettingsPage from './pages/SettingsPage.jsx';
 import ForgotPasswordPage from './pages/ForgotPasswordPage.jsx';
 
 import Sidebar from './components/Sidebar.jsx';
+import { clearSession } from './api/api';
 import './App.css';
 
 function App() {
@@ -47,6 +48,7 @@ function App() {
   const handleLogout = () => {
     localStorage.removeItem('isLoggedIn');
     localStorage.removeItem('userRole');
+    clearSession();
     setIsAuthenticated(false);
     setUserRole(null);
   };
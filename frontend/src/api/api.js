@@ -8,12 +8,44 @@ const apiClient = axios.create({
   timeout: 60000,
 });
 
+// Session token from /login, sent with every request
+const TOKEN_KEY = 'authToken';
+
+apiClient.interceptors.request.use((config) => {
+  const token = localStorage.getItem(TOKEN_KEY);
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`;
+  }
+  return config;
+});
+
+// A missing, expired or revoked token: drop the session and go back to the login page
+apiClient.interceptors.response.use(
+  (response) => response,
+  (error) => {
+    if (error.response?.status === 401 && !error.config?.url?.endsWith('/login')) {
+      ['isLoggedIn', 'userRole', 'userId', 'userName', TOKEN_KEY].forEach((key) => localStorage.removeItem(key));
+      if (window.location.pathname !== '/login') {
+        window.location.assign('/login');
+      }
+    }
+    return Promise.reject(error);
+  }
+);
+
 // Auth
 export const login = async (credentials) => {
   const response = await apiClient.post('/login', credentials);
+  if (response.data.token) {
+    localStorage.setItem(TOKEN_KEY, response.data.token);
+  }
   return response.data;
 };
 
+export const clearSession = () => {
+  localStorage.removeItem(TOKEN_KEY);
+};
+
 export const changePassword = async (data) => {
   const response = await apiClient.post('/change-password', data);
   return response.data;
@@ -31,18 +63,114 @@ export const updateSettings = async (settings) => {
 };
 
 // Visitors
-export const getVisitors = async () => {
-  const response = await apiClient.get('/visitors');
+// One keyset page: { visitors, next_cursor }. Pass next_cursor back as `cursor` for the next page.
+export const getVisitorPage = async (params = {}) => {
+  const response = await apiClient.get('/visitors', { params });
+  return response.data;
+};
+
+// Every visitor matching the filters (start_date, end_date, status, host, purpose), following
+// next_cursor page by page. Always pass a date range or status: unfiltered, this is the whole table.
+const VISITORS_FETCH_PAGE = 500;
+
+export const getVisitors = async (params = {}) => {
+  const visitors = [];
+  let cursor = null;
+  do {
+    const page = await getVisitorPage({ limit: VISITORS_FETCH_PAGE, ...params, ...(cursor ? { cursor } : {}) });
+    visitors.push(...page.visitors);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return visitors;
+};
+
+// YYYY-MM-DD `days` away from a YYYY-MM-DD date
+export const shiftDate = (date, days) => {
+  const d = new Date(`${date}T00:00:00Z`);
+  d.setUTCDate(d.getUTCDate() + days);
+  return d.toISOString().split('T')[0];
+};
+
+// Visitors who checked in on a local calendar day. The server filters by UTC date, so a day
+// either side is fetched and the rest dropped here.
+export const getVisitorsForDay = async (date, params = {}) => {
+  const visitors = await getVisitors({ ...params, start_date: shiftDate(date, -1), end_date: shiftDate(date, 1) });
+  return visitors.filter((v) => new Date(v.check_in_time).toLocaleDateString('en-CA') === date);
+};
+
+// Ranked search over name, email, phone, company and host: { visitors, next_cursor, truncated }.
+// truncated means the server ranked only the newest matches (SEARCH_MAX_CANDIDATES).
+// q needs at least 3 letters or digits; the list filters (start_date, status, ...) also apply.
+export const searchVisitors = async (q, params = {}) => {
+  const response = await apiClient.get('/visitors/search', { params: { ...params, q } });
+  return response.data;
+};
+
+// Aggregates from the daily rollups: { total_visits, checked_out, currently_inside, avg_duration_minutes, series }
+export const getVisitorStats = async (params = {}) => {
+  const response = await apiClient.get('/visitors/stats', { params });
+  return response.data;
+};
+
+// Delta sync: { visitors, deleted, next_token, has_more }. Omit `since` for a full copy, keep
+// requesting with next_token while has_more, then poll with the last next_token.
+// A 410 response means the token is too old: start again without `since`.
+export const getVisitorChanges = async (since = null, params = {}) => {
+  const response = await apiClient.get('/visitors/changes', { params: since ? { ...params, since } : params });
   return response.data;
 };
 
+// Live visitor events over Server-Sent Events; EventSource reconnects on its own.
+// onSnapshot(visitors) gets everyone currently inside, onEvent({ type, id, visitor }) each
+// check_in / check_out / delete, and onResync() means events were missed: refetch.
+// Returns a function that closes the stream.
+export const subscribeVisitorEvents = ({ onSnapshot, onEvent, onResync } = {}) => {
+  // EventSource cannot send headers, so the token goes in the query string
+  const token = localStorage.getItem(TOKEN_KEY);
+  const query = token ? `?access_token=${encodeURIComponent(token)}` : '';
+  const source = new EventSource(`${apiClient.defaults.baseURL}/visitors/stream${query}`);
+  source.addEventListener('snapshot', (e) => onSnapshot && onSnapshot(JSON.parse(e.data)));
+  ['check_in', 'check_out', 'delete'].forEach((type) => {
+    source.addEventListener(type, (e) => {
+      const event = JSON.parse(e.data);
+      // Oversized events arrive without the visitor
+      if (event.partial) {
+        if (onResync) onResync();
+      } else if (onEvent) {
+        onEvent(event);
+      }
+    });
+  });
+  source.addEventListener('resync', () => onResync && onResync());
+  return () => source.close();
+};
+
+// Apply one live event to a list of visitors (newest first)
+export const applyVisitorEvent = (visitors, event) => {
+  if (event.type === 'delete') {
+    return visitors.filter((v) => v.id !== event.id);
+  }
+  if (visitors.some((v) => v.id === event.id)) {
+    return visitors.map((v) => (v.id === event.id ? event.visitor : v));
+  }
+  return [event.visitor, ...visitors];
+};
+
 export const addVisitor = async (data) => {
   const response = await apiClient.post('/visitors', data);
   return response.data;
 };
 
-export const checkoutVisitor = async (id, payload = {}) => {
-  const response = await apiClient.post(`/visitors/${id}/checkout`, payload);
+// Group check-in: { created: [...], errors: [{ index, error }] }
+export const addVisitorsBulk = async (visitors) => {
+  const response = await apiClient.post('/visitors/bulk', { visitors });
+  return response.data;
+};
+
+// Pass the visit's check_in_time where it is known: the server then reads only that month's partition
+export const checkoutVisitor = async (id, payload = {}, checkInTime = null) => {
+  const params = checkInTime ? { check_in_time: checkInTime } : {};
+  const response = await apiClient.post(`/visitors/${id}/checkout`, payload, { params });
   return response.data;
 };
 
@@ -51,12 +179,24 @@ export const deleteVisitor = async (id) => {
   return response.data;
 };
 
-export const downloadVisitorReport = async (format = 'csv', startDate = null, endDate = null) => {
-  let url = `/visitors/report?format=${format}`;
-  if (startDate) url += `&start_date=${startDate}`;
-  if (endDate) url += `&end_date=${endDate}`;
+const REPORT_POLL_MS = 1000;
 
-  const response = await apiClient.get(url, {
+// Reports are built in the background: queue a job, poll it until done, then fetch the file
+export const downloadVisitorReport = async (format = 'csv', startDate = null, endDate = null) => {
+  const body = { format };
+  if (startDate) body.start_date = startDate;
+  if (endDate) body.end_date = endDate;
+
+  let { data: job } = await apiClient.post('/reports', body);
+  while (job.status === 'pending' || job.status === 'running') {
+    await new Promise((resolve) => setTimeout(resolve, REPORT_POLL_MS));
+    ({ data: job } = await apiClient.get(`/reports/${job.id}`));
+  }
+  if (job.status !== 'done') {
+    throw new Error(job.error || 'Report generation failed');
+  }
+
+  const response = await apiClient.get(`/reports/${job.id}/download`, {
     responseType: 'blob',
   });
   return response.data;
@@ -90,7 +230,15 @@ export const deleteUser = async (id) => {
 
 export default {
   getVisitors,
+  getVisitorsForDay,
+  getVisitorPage,
+  getVisitorStats,
+  getVisitorChanges,
+  searchVisitors,
+  subscribeVisitorEvents,
+  applyVisitorEvent,
   addVisitor,
+  addVisitorsBulk,
   checkoutVisitor,
   deleteVisitor,
   downloadVisitorReport,
@@ -99,5 +247,6 @@ export default {
   toggleUserStatus,
   deleteUser,
   changePassword,
+  clearSession,
 };
 
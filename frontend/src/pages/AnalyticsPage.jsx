@@ -1,195 +1,188 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import { LineChart, Line, BarChart, Bar, PieChart, Pie, Cell, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
-import { getVisitors, checkoutVisitor } from '../api/api';
+import { getVisitors, getVisitorsForDay, getVisitorStats, shiftDate, checkoutVisitor, subscribeVisitorEvents, applyVisitorEvent } from '../api/api';
 import '../styles/Analytics.css';
 
+const PERIOD_LABELS = {
+  daily: 'Today',
+  weekly: 'Last 7 days',
+  monthly: 'Last 30 days',
+  yearly: 'Last 12 months',
+  alltime: 'All time',
+};
+
+const monthKey = (date) => `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}`;
+const monthLabel = (key) => new Date(key + '-01').toLocaleDateString('en-US', { month: 'short', year: 'numeric' });
+const dayLabel = (key) => new Date(key).toLocaleDateString('en-US', { day: '2-digit', month: 'short' });
+
+// Same shape as /api/visitors/stats, for today's visitors (the rollups have no hours)
+const summarizeVisitors = (visitors) => {
+  const completed = visitors.filter(v => v.check_out_time);
+  const minutes = completed.reduce((sum, v) => sum + (new Date(v.check_out_time) - new Date(v.check_in_time)) / 60000, 0);
+  const purposes = {};
+  visitors.forEach(v => { purposes[v.purpose || ''] = (purposes[v.purpose || ''] || 0) + 1; });
+  return {
+    total_visits: visitors.length,
+    checked_out: completed.length,
+    avg_duration_minutes: completed.length ? minutes / completed.length : null,
+    purposes: Object.entries(purposes).map(([purpose, visits]) => ({ purpose, visits })),
+    series: [],
+  };
+};
+
 const Analytics = () => {
   const [timePeriod, setTimePeriod] = useState('weekly');
-  const [visitors, setVisitors] = useState([]);
+  // Rollup aggregates for the period (or today's visitors for the hourly view)
+  const [periodStats, setPeriodStats] = useState(null);
+  const [todaysVisitors, setTodaysVisitors] = useState([]);
+  const [activeVisitors, setActiveVisitors] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [refreshKey, setRefreshKey] = useState(0);
 
-  useEffect(() => {
-    fetchVisitorsData();
-  }, []);
-
-  const fetchVisitorsData = async () => {
+  // Everyone inside right now, kept current from the live feed
+  const fetchActiveVisitors = async () => {
     try {
-      setLoading(true);
-      const data = await getVisitors();
-      setVisitors(data);
+      setActiveVisitors(await getVisitors({ status: 'inside' }));
     } catch (error) {
       console.error('Error fetching visitors:', error);
-    } finally {
-      setLoading(false);
     }
   };
 
-  const filteredVisitors = useMemo(() => {
-    const now = new Date();
-    const startDate = new Date();
-
-    if (timePeriod === 'daily') {
-      startDate.setHours(0, 0, 0, 0); // Start of today
-    } else if (timePeriod === 'weekly') {
-      startDate.setDate(now.getDate() - 7); // Last 7 days
-    } else if (timePeriod === 'monthly') {
-      startDate.setDate(now.getDate() - 30); // Last 30 days
-    } else if (timePeriod === 'yearly') {
-      startDate.setFullYear(now.getFullYear() - 1); // Last 12 months
-    } else {
-      startDate.setTime(0); // All time
-    }
-
-    return visitors.filter(v => {
-      if (!v.check_in_time) return false;
-      const date = new Date(v.check_in_time);
-      return date >= startDate;
+  useEffect(() => {
+    fetchActiveVisitors();
+    let timer = null;
+    return subscribeVisitorEvents({
+      onEvent: (event) => {
+        setActiveVisitors((current) => applyVisitorEvent(current, event).filter(v => !v.check_out_time));
+        // Re-read the period's aggregates once a burst of events has settled
+        clearTimeout(timer);
+        timer = setTimeout(() => setRefreshKey((key) => key + 1), 2000);
+      },
+      onResync: () => {
+        fetchActiveVisitors();
+        setRefreshKey((key) => key + 1);
+      },
     });
-  }, [visitors, timePeriod]);
+  }, []);
+
+  useEffect(() => {
+    let stale = false;
+    const fetchPeriod = async () => {
+      try {
+        const today = new Date().toLocaleDateString('en-CA');
+        if (timePeriod === 'daily') {
+          const visitors = await getVisitorsForDay(today);
+          if (!stale) {
+            setTodaysVisitors(visitors);
+            setPeriodStats(summarizeVisitors(visitors));
+          }
+          return;
+        }
+        const params = { group: timePeriod === 'weekly' || timePeriod === 'monthly' ? 'day' : 'month' };
+        if (timePeriod === 'weekly') params.start_date = shiftDate(today, -6);
+        if (timePeriod === 'monthly') params.start_date = shiftDate(today, -29);
+        if (timePeriod === 'yearly') {
+          const first = new Date();
+          first.setDate(1);
+          first.setMonth(first.getMonth() - 11);
+          params.start_date = first.toLocaleDateString('en-CA');
+        }
+        const data = await getVisitorStats(params);
+        if (!stale) setPeriodStats(data);
+      } catch (error) {
+        console.error('Error fetching visitor stats:', error);
+      } finally {
+        if (!stale) setLoading(false);
+      }
+    };
+    fetchPeriod();
+    return () => { stale = true; };
+  }, [timePeriod, refreshKey]);
 
   const visitsTrendData = useMemo(() => {
-    const counts = {};
+    if (!periodStats) return [];
     const now = new Date();
-
-    // Default Formatters (Daily)
-    let formatKey = (date) => date.toISOString().split('T')[0];
-    let labelFormat = (date_str) => new Date(date_str).toLocaleDateString('en-US', { day: '2-digit', month: 'short' });
-    let generateKeys = () => []; // Default empty
+    let keys = [];
+    let labelFormat = dayLabel;
+    const counts = {};
 
     if (timePeriod === 'daily') {
-      // Hourly breakdown for Today
-      generateKeys = () => {
-        const keys = [];
-        for (let i = 0; i <= now.getHours(); i++) {
-          keys.push(`${i.toString().padStart(2, '0')}:00`);
-        }
-        return keys;
-      };
-      // Format key for data aggregation
-      formatKey = (date) => `${date.getHours().toString().padStart(2, '0')}:00`;
+      // Hourly breakdown for today
+      for (let i = 0; i <= now.getHours(); i++) {
+        keys.push(`${i.toString().padStart(2, '0')}:00`);
+      }
+      todaysVisitors.forEach((visitor) => {
+        const key = `${new Date(visitor.check_in_time).getHours().toString().padStart(2, '0')}:00`;
+        counts[key] = (counts[key] || 0) + 1;
+      });
       labelFormat = (key) => key;
-    } else if (timePeriod === 'weekly') {
-      // Daily breakdown (last 7 days)
-      generateKeys = () => {
-        const keys = [];
-        for (let i = 6; i >= 0; i--) {
-          const d = new Date();
-          d.setDate(now.getDate() - i);
-          keys.push(formatKey(d));
-        }
-        return keys;
-      };
-    } else if (timePeriod === 'monthly') {
-      // Daily breakdown (last 30 days)
-      generateKeys = () => {
-        const keys = [];
-        for (let i = 29; i >= 0; i--) {
-          const d = new Date();
-          d.setDate(now.getDate() - i);
-          keys.push(formatKey(d));
-        }
-        return keys;
-      };
-    } else if (timePeriod === 'yearly') {
-      // Monthly breakdown (Last 12 Months)
-      formatKey = (date) => `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}`;
-      labelFormat = (date_str) => new Date(date_str + '-01').toLocaleDateString('en-US', { month: 'short', year: 'numeric' });
-      generateKeys = () => {
-        const keys = [];
+    } else if (timePeriod === 'weekly' || timePeriod === 'monthly') {
+      // Daily breakdown (last 7 or 30 days)
+      const today = now.toLocaleDateString('en-CA');
+      for (let i = timePeriod === 'weekly' ? 6 : 29; i >= 0; i--) {
+        keys.push(shiftDate(today, -i));
+      }
+      periodStats.series.forEach((bucket) => { counts[bucket.date] = bucket.visits; });
+    } else {
+      // Monthly breakdown (last 12 months, or every month with visits)
+      periodStats.series.forEach((bucket) => { counts[bucket.date.slice(0, 7)] = bucket.visits; });
+      if (timePeriod === 'yearly') {
         for (let i = 11; i >= 0; i--) {
           const d = new Date();
+          d.setDate(1);
           d.setMonth(now.getMonth() - i);
-          keys.push(formatKey(d));
+          keys.push(monthKey(d));
         }
-        return keys;
-      };
-    } else if (timePeriod === 'alltime') {
-      formatKey = (date) => `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}`;
-      labelFormat = (date_str) => new Date(date_str + '-01').toLocaleDateString('en-US', { month: 'short', year: 'numeric' });
-      generateKeys = () => {
-        if (filteredVisitors.length === 0) return [];
-        return [];
-      };
+      } else {
+        keys = Object.keys(counts).sort();
+      }
+      labelFormat = monthLabel;
     }
 
-    // 1. Aggregate actual data
-    filteredVisitors.forEach((visitor) => {
-      const date = new Date(visitor.check_in_time);
-      const key = formatKey(date);
-      counts[key] = (counts[key] || 0) + 1;
-    });
-
-    // 2. Generate full timeline
-    let finalKeys = generateKeys();
-
-    // If alltime (or fallback), use actual keys
-    if (finalKeys.length === 0) {
-      finalKeys = Object.keys(counts).sort();
-    }
-
-    // 3. Map to array
-    return finalKeys.map(key => ({
+    return keys.map(key => ({
       day: labelFormat(key),
       visits: counts[key] || 0,
       rawKey: key
     }));
-  }, [filteredVisitors, timePeriod]);
+  }, [periodStats, todaysVisitors, timePeriod]);
 
   const visitorTypeData = useMemo(() => {
-    const typeCounts = {};
-    filteredVisitors.forEach((visitor) => {
-      const type = visitor.purpose || 'General';
-      typeCounts[type] = (typeCounts[type] || 0) + 1;
-    });
-
-    const total = filteredVisitors.length;
+    if (!periodStats) return [];
+    const total = periodStats.purposes.reduce((sum, p) => sum + p.visits, 0);
     if (total === 0) return [];
 
-    return Object.entries(typeCounts).map(([name, count]) => ({
-      name,
-      value: Math.round((count / total) * 100),
-      count,
+    return periodStats.purposes.map(({ purpose, visits }) => ({
+      name: purpose || 'General',
+      value: Math.round((visits / total) * 100),
+      count: visits,
     }));
-  }, [filteredVisitors]);
+  }, [periodStats]);
 
   const dailyVisitsData = useMemo(() => {
     return visitsTrendData;
   }, [visitsTrendData]);
 
   const stats = useMemo(() => {
-    const totalVisits = filteredVisitors.length;
-    const currentlyInside = visitors.filter(v => !v.check_out_time).length; // Keep global for "Currently Inside"
-    const uniqueVisitors = new Set(filteredVisitors.map(v => v.email || v.phone)).size;
-
-    const completedVisits = filteredVisitors.filter(v => v.check_out_time);
-    const avgDuration = completedVisits.length > 0
-      ? completedVisits.reduce((sum, v) => {
-        const duration = (new Date(v.check_out_time) - new Date(v.check_in_time)) / (1000 * 60);
-        return sum + duration;
-      }, 0) / completedVisits.length
-      : 0;
-
-    let periodLabel = 'All time';
-    if (timePeriod === 'daily') periodLabel = 'Today';
-    if (timePeriod === 'weekly') periodLabel = 'Last 7 days';
-    if (timePeriod === 'monthly') periodLabel = 'Last 30 days';
-    if (timePeriod === 'yearly') periodLabel = 'Last 12 months';
+    const totals = periodStats || { total_visits: 0, checked_out: 0, avg_duration_minutes: null };
+    const avgDuration = totals.avg_duration_minutes || 0;
+    const periodLabel = PERIOD_LABELS[timePeriod];
 
     return [
-      { label: 'Total Visits', value: totalVisits, detail: periodLabel },
-      { label: 'Unique Visitors', value: uniqueVisitors, detail: 'In this period' },
-      { label: 'Currently Inside', value: currentlyInside, detail: 'Right now (Total)' },
+      { label: 'Total Visits', value: totals.total_visits, detail: periodLabel },
+      { label: 'Completed Visits', value: totals.checked_out, detail: 'In this period' },
+      { label: 'Currently Inside', value: activeVisitors.length, detail: 'Right now (Total)' },
       { label: 'Avg. Visit Duration', value: avgDuration > 0 ? `${Math.round(avgDuration)} min` : 'N/A', detail: 'In this period' },
     ];
-  }, [filteredVisitors, visitors, timePeriod]);
+  }, [periodStats, activeVisitors, timePeriod]);
 
   const COLORS = ['#0088FE', '#00C49F', '#FFBB28', '#FF8042', '#8884d8'];
 
-  const handleCheckout = async (visitorId) => {
+  const handleCheckout = async (visitorId, checkInTime) => {
     try {
-      await checkoutVisitor(visitorId);
+      await checkoutVisitor(visitorId, {}, checkInTime);
       // Refresh visitor data
-      await fetchVisitorsData();
+      setActiveVisitors((current) => current.filter(v => v.id !== visitorId));
+      setRefreshKey((key) => key + 1);
       alert('Visitor checked out successfully!');
     } catch (error) {
       console.error('Error checking out:', error);
@@ -197,8 +190,6 @@ const Analytics = () => {
     }
   };
 
-  const activeVisitors = visitors.filter(v => !v.check_out_time);
-
   if (loading) {
     return <div className="loading-state">Loading analytics...</div>;
   }
@@ -380,7 +371,7 @@ const Analytics = () => {
                     <td style={{ padding: '1rem', color: '#6b7280' }}>{visitor.purpose}</td>
                     <td style={{ padding: '1rem' }}>
                       <button
-                        onClick={() => handleCheckout(visitor.id)}
+                        onClick={() => handleCheckout(visitor.id, visitor.check_in_time)}
                         style={{
                           backgroundColor: '#6366f1',
                           color: 'white',
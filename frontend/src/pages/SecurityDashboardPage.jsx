@@ -1,12 +1,14 @@
 import React, { useState, useEffect } from 'react';
-import { getVisitors, addVisitor, checkoutVisitor } from '../api/api';
+import { getVisitors, getVisitorStats, searchVisitors, shiftDate, checkoutVisitor, subscribeVisitorEvents, applyVisitorEvent } from '../api/api';
 import AddVisitorModal from '../components/AddVisitorModal';
 import '../styles/SecurityDashboard.css';
 
 const SecurityDashboard = ({ adminView = false }) => {
   const [showAddVisitorModal, setShowAddVisitorModal] = useState(false);
   const [activeSection, setActiveSection] = useState('checkin');
+  // Today's visitors plus everyone still inside from earlier days
   const [visitors, setVisitors] = useState([]);
+  const [totalVisitors, setTotalVisitors] = useState(0);
   const [loading, setLoading] = useState(true);
 
   const [visitorForm, setVisitorForm] = useState({
@@ -21,7 +23,7 @@ const SecurityDashboard = ({ adminView = false }) => {
   const [searchTerm, setSearchTerm] = useState('');
   const [searchResults, setSearchResults] = useState([]);
 
-  // Search logic
+  // Search logic: the server's ranked search once there are 3 characters, the loaded visitors before that
   useEffect(() => {
     if (!searchTerm.trim()) {
       setSearchResults([]);
@@ -29,24 +31,40 @@ const SecurityDashboard = ({ adminView = false }) => {
     }
 
     const term = searchTerm.toLowerCase();
-    const uniqueVisitors = new Map();
+    if (term.replace(/[^a-z0-9]/g, '').length >= 3) {
+      let stale = false;
+      const timer = setTimeout(async () => {
+        try {
+          const { visitors: matches } = await searchVisitors(term, { limit: 20 });
+          if (!stale) setSearchResults(uniqueByContact(matches).slice(0, 5));
+        } catch (error) {
+          console.error('Error searching visitors:', error);
+        }
+      }, 300);
+      return () => {
+        stale = true;
+        clearTimeout(timer);
+      };
+    }
 
-    visitors.forEach(v => {
-      // Create a unique key based on email or phone or name
+    setSearchResults(uniqueByContact(visitors.filter(v =>
+      (v.name && v.name.toLowerCase().includes(term)) ||
+      (v.email && v.email.toLowerCase().includes(term)) ||
+      (v.phone && v.phone.includes(term))
+    )).slice(0, 5));
+  }, [searchTerm, visitors]);
+
+  // One entry per person, keyed on email or phone or name
+  const uniqueByContact = (list) => {
+    const uniqueVisitors = new Map();
+    list.forEach(v => {
       const key = v.email || v.phone || v.name;
       if (!uniqueVisitors.has(key)) {
-        if (
-          (v.name && v.name.toLowerCase().includes(term)) ||
-          (v.email && v.email.toLowerCase().includes(term)) ||
-          (v.phone && v.phone.includes(term))
-        ) {
-          uniqueVisitors.set(key, v);
-        }
+        uniqueVisitors.set(key, v);
       }
     });
-
-    setSearchResults(Array.from(uniqueVisitors.values()).slice(0, 5));
-  }, [searchTerm, visitors]);
+    return Array.from(uniqueVisitors.values());
+  };
 
   const handleSelectVisitor = (visitor) => {
     // Splits name into First/Last if possible
@@ -67,16 +85,32 @@ const SecurityDashboard = ({ adminView = false }) => {
     setShowAddVisitorModal(true);
   };
 
-  // Fetch visitors on mount
+  // Fetch visitors on mount, then keep them current from the live feed
   useEffect(() => {
     fetchVisitors();
+    return subscribeVisitorEvents({
+      onEvent: (event) => {
+        setVisitors((current) => applyVisitorEvent(current, event));
+        if (event.type === 'check_in') setTotalVisitors((total) => total + 1);
+        if (event.type === 'delete') setTotalVisitors((total) => Math.max(0, total - 1));
+      },
+      onResync: fetchVisitors,
+    });
   }, []);
 
   const fetchVisitors = async () => {
     try {
       setLoading(true);
-      const data = await getVisitors();
-      setVisitors(data);
+      // The server filters by UTC date: a day either side covers the local day
+      const today = new Date().toLocaleDateString('en-CA');
+      const [recent, inside, stats] = await Promise.all([
+        getVisitors({ start_date: shiftDate(today, -1), end_date: shiftDate(today, 1) }),
+        getVisitors({ status: 'inside' }),
+        getVisitorStats(),
+      ]);
+      const byId = new Map([...recent, ...inside].map((v) => [v.id, v]));
+      setVisitors(Array.from(byId.values()).sort((a, b) => new Date(b.check_in_time) - new Date(a.check_in_time)));
+      setTotalVisitors(stats.total_visits);
     } catch (error) {
       console.error('Error fetching visitors:', error);
     } finally {
@@ -84,11 +118,11 @@ const SecurityDashboard = ({ adminView = false }) => {
     }
   };
 
-  const handleCheckout = async (visitorId) => {
+  const handleCheckout = async (visitorId, checkInTime) => {
     try {
-      const updatedVisitor = await checkoutVisitor(visitorId);
-      setVisitors(
-        visitors.map((v) => (v.id === visitorId ? updatedVisitor : v))
+      const { visitor: updatedVisitor } = await checkoutVisitor(visitorId, {}, checkInTime);
+      setVisitors((current) =>
+        current.map((v) => (v.id === visitorId ? updatedVisitor : v))
       );
       alert('Visitor checked out successfully!');
     } catch (error) {
@@ -97,11 +131,14 @@ const SecurityDashboard = ({ adminView = false }) => {
     }
   };
 
+  const isToday = (v) => new Date(v.check_in_time).toLocaleDateString('en-CA') === new Date().toLocaleDateString('en-CA');
+  const todaysVisitors = visitors.filter(isToday);
+
   const stats = [
-    { label: "Today's Visits", value: visitors.length, detail: 'Total check-ins today', icon: '📊' },
+    { label: "Today's Visits", value: todaysVisitors.length, detail: 'Total check-ins today', icon: '📊' },
     { label: 'Currently Inside', value: visitors.filter(v => !v.check_out_time).length, detail: 'Visitors not checked out', icon: '🚪' },
-    { label: 'Total Visitors', value: visitors.length, detail: 'Registered visitors', icon: '👥' },
-    { label: 'Checked Out', value: visitors.filter(v => v.check_out_time).length, detail: "Today's check-outs", icon: '✓' },
+    { label: 'Total Visitors', value: totalVisitors, detail: 'Registered visitors', icon: '👥' },
+    { label: 'Checked Out', value: todaysVisitors.filter(v => v.check_out_time).length, detail: "Today's check-outs", icon: '✓' },
   ];
 
   const activeVisitors = visitors.filter(v => !v.check_out_time).map(visitor => ({
@@ -218,14 +255,8 @@ const SecurityDashboard = ({ adminView = false }) => {
                   </tr>
                 </thead>
                 <tbody>
-                  {visitors.length > 0 ? (
-                    visitors
-                      .filter(v => {
-                        // Show today's visitors
-                        const today = new Date().toISOString().split('T')[0];
-                        const visitorDate = new Date(v.check_in_time).toISOString().split('T')[0];
-                        return visitorDate === today;
-                      })
+                  {todaysVisitors.length > 0 ? (
+                    todaysVisitors
                       .map((visitor) => (
                         <tr key={visitor.id}>
                           <td>{visitor.name}</td>
@@ -290,7 +321,7 @@ const SecurityDashboard = ({ adminView = false }) => {
                       <td>
                         <button
                           className="checkout-btn"
-                          onClick={() => handleCheckout(visitor.id)}
+                          onClick={() => handleCheckout(visitor.id, visitor.check_in_time)}
                         >
                           Check Out
                         </button>
@@ -315,7 +346,8 @@ const SecurityDashboard = ({ adminView = false }) => {
           <AddVisitorModal
             onClose={() => setShowAddVisitorModal(false)}
             onVisitorAdded={(newVisitor) => {
-              setVisitors([newVisitor, ...visitors]);
+              // The live feed may have delivered it already
+              setVisitors((current) => applyVisitorEvent(current, { type: 'check_in', id: newVisitor.id, visitor: newVisitor }));
               setShowAddVisitorModal(false);
             }}
             initialData={visitorForm}
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { getVisitors, downloadVisitorReport } from '../api/api';
+import { getVisitorsForDay, downloadVisitorReport } from '../api/api';
 import AddVisitorModal from '../components/AddVisitorModal';
 import '../styles/VisitorLog.css';
 
@@ -15,22 +15,23 @@ const VisitorLog = () => {
   const [isExporting, setIsExporting] = useState(false);
   const [showAddModal, setShowAddModal] = useState(false);
 
-  // Fetch visitors on mount
+  // Fetch the selected day's visitors (all of them, page by page) whenever the day changes
   useEffect(() => {
+    let stale = false;
+    const fetchVisitors = async () => {
+      try {
+        const data = await getVisitorsForDay(selectedDate);
+        // A later day may have been picked while this one was loading
+        if (!stale) setVisitors(Array.isArray(data) ? data : []);
+      } catch (error) {
+        console.error('Error fetching visitors:', error);
+      } finally {
+        if (!stale) setLoading(false);
+      }
+    };
     fetchVisitors();
-  }, []);
-
-  const fetchVisitors = async () => {
-    try {
-      setLoading(true);
-      const data = await getVisitors();
-      setVisitors(Array.isArray(data) ? data : []);
-    } catch (error) {
-      console.error('Error fetching visitors:', error);
-    } finally {
-      setLoading(false);
-    }
-  };
+    return () => { stale = true; };
+  }, [selectedDate]);
 
   const stats = {
     totalVisits: visitors.filter(v => new Date(v.check_in_time).toLocaleDateString('en-CA') === selectedDate).length,